@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Combine the stats artifacts of the iterations of each conversion in a timing
+# workflow run (`<component>_<subvariant>_<iteration>`, each holding the JSON
+# files that 3c writes) into one table with robust statistics per component,
+# subvariant and metric.
+#
+# usage: aggregate-timing-stats.py [options] ARTIFACTS_DIR...
+#
+# ARTIFACTS_DIR is a directory with one subdirectory per artifact, as left by
+# `gh run download` or run-workflow-locally.py. For each metric (by default,
+# those with "time" in their name; see perfstats.flatten_json for the naming),
+# we report the number of iterations, the median, the median absolute
+# deviation (MAD), the minimum and maximum, and a bootstrap confidence interval
+# for the median. A metric is flagged as noisy if its MAD is more than
+# --noise-threshold of its median, in which case the machine was probably busy
+# and the comparisons we draw from it are suspect.
+#
+# Each row records the build profile of 3c that its conversion comes from; the
+# artifacts of one conversion must all come from the same one.
+#
+# The table is written as CSV and/or JSON (a list of one object per row). The
+# artifact directories are read in parallel, since with a few hundred of them
+# that's where the time goes.
+
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Dict, List
+
+import perfstats
+
+DEFAULT_METRIC_RE = r'(?i)time'
+
+COLUMNS = [
+    'component', 'subvariant', 'metric', 'n', 'median', 'mad', 'rel_mad',
+    'min', 'max', 'ci_low', 'ci_high', 'noisy', 'build_profile'
+]
+
+
+def summarize(values: List[float], bootstrap: perfstats.MedianBootstrap,
+              confidence: float, noise_threshold: float) -> Dict:
+    values = sorted(values)
+    center = perfstats.median(values)
+    mad = perfstats.median_abs_deviation(values)
+    rel_mad = mad / abs(center) if center != 0 else 0.0
+    ci_low, ci_high = bootstrap.interval(values, confidence)
+    return {
+        'n': len(values),
+        'median': center,
+        'mad': mad,
+        'rel_mad': rel_mad,
+        'min': values[0],
+        'max': values[-1],
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'noisy': rel_mad > noise_threshold,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Aggregate the stats artifacts of repeated conversions.')
+    parser.add_argument('artifact_dirs', nargs='+', metavar='ARTIFACTS_DIR')
+    parser.add_argument('--metric',
+                        default=DEFAULT_METRIC_RE,
+                        help='Regular expression selecting the metrics to '
+                        f'aggregate (default: {DEFAULT_METRIC_RE!r}).')
+    parser.add_argument('--csv', help='Write the table to this CSV file.')
+    parser.add_argument('--json', help='Write the table to this JSON file.')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--bootstrap-resamples', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--noise-threshold',
+                        type=float,
+                        default=0.05,
+                        help='Flag metrics whose MAD exceeds this fraction of '
+                        'the median (default: 0.05).')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of processes reading artifacts.')
+    args = parser.parse_args()
+    if args.csv is None and args.json is None:
+        args.csv = '-'
+
+    artifacts = perfstats.find_artifacts(args.artifact_dirs)
+    if not artifacts:
+        sys.exit('aggregate-timing-stats.py: no stats artifacts found')
+    try:
+        build_profiles = perfstats.build_profiles(artifacts)
+    except ValueError as e:
+        sys.exit(f'aggregate-timing-stats.py: error: {e}')
+
+    groups = perfstats.load_groups(artifacts, args.metric, args.jobs)
+    bootstrap = perfstats.MedianBootstrap(args.bootstrap_resamples, args.seed)
+    rows = []
+    for (component, subvariant), metrics in sorted(groups.items()):
+        for metric, values in sorted(metrics.items()):
+            rows.append({
+                'component': component,
+                'subvariant': subvariant,
+                'metric': metric,
+                **summarize(values, bootstrap, args.confidence,
+                            args.noise_threshold),
+                'build_profile': build_profiles[(component, subvariant)],
+            })
+
+    if args.csv is not None:
+        out = sys.stdout if args.csv == '-' else open(args.csv, 'w', newline='')
+        writer = csv.DictWriter(out, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        if out is not sys.stdout:
+            out.close()
+    if args.json is not None:
+        with open(args.json, 'w') as out:
+            json.dump(rows, out, indent=1)
+            out.write('\n')
+
+    noisy = [r for r in rows if r['noisy']]
+    print(f'{len(artifacts)} artifacts, {len(groups)} conversions, '
+          f'{len(rows)} metrics, {len(noisy)} noisy (build profiles: '
+          f'{", ".join(sorted(set(build_profiles.values())))})',
+          file=sys.stderr)
+    for row in noisy:
+        print(f'Noisy: {row["component"]} ({row["subvariant"]}) '
+              f'{row["metric"]}: median {row["median"]:.4g}, MAD '
+              f'{row["rel_mad"]:.1%} of median', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Measure the throughput of filter-bounds-inference-errors.py on synthetic
+# clang build logs with different densities of error lines.
+#
+# usage: benchmark-filter-bounds-inference-errors.py [options]
+#
+# For each density, we generate a log of roughly --size-mb megabytes in which
+# that fraction of the lines are errors (half of them ones that the filter
+# marks as filtered), pipe it through the filter a few times and report the
+# best time as MB/s, not counting the time the filter takes to start up and
+# exit on empty input. To compare against another version of the filter (e.g.,
+# `git show HEAD~:filter-bounds-inference-errors.py >old.py`), pass it with
+# --filter.
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Lines resembling what a `make` or `ninja` build of a converted benchmark
+# prints between errors.
+NOISE_LINES = [
+    '[{n}/812] Building C object libarchive/CMakeFiles/archive.dir/'
+    'archive_read_support_format_{n}.c.o',
+    'clang -w -ferror-limit=0 -D_ISOC99_SOURCE -c -o obj_{n}.o src_{n}.c',
+    'src/lvm.c:{n}:17: note: (expanded from macro \'luai_numadd\')',
+    '    _Array_ptr<char> buf : count(len) = malloc<char>(len + {n});',
+    '                         ^~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~',
+    'make[2]: Leaving directory \'/home/github/benchmark_conv/bh_{n}\'',
+]
+FILTERED_ERROR = ('src/file_{n}.c:{n}:9: error: expression has unknown bounds')
+UNFILTERED_ERROR = ('src/file_{n}.c:{n}:9: error: incompatible type for '
+                    'argument {n} of \'memcpy\'')
+
+
+def generate_log(path: str, size: int, error_density: float, rng):
+    with open(path, 'w') as log_file:
+        written = 0
+        n = 0
+        while written < size:
+            n += 1
+            r = rng.random()
+            if r < error_density / 2:
+                line = FILTERED_ERROR
+            elif r < error_density:
+                line = UNFILTERED_ERROR
+            else:
+                line = rng.choice(NOISE_LINES)
+            line = line.format(n=n) + '\n'
+            log_file.write(line)
+            written += len(line)
+
+
+def time_filter(filter_path: str, log_path: str, extra_args: List[str],
+                repetitions: int) -> float:
+    best = float('inf')
+    for _ in range(repetitions):
+        with open(log_path, 'rb') as log_file:
+            start = time.perf_counter()
+            # The filter exits 1 when it sees unfiltered errors, so don't use
+            # check=True.
+            subprocess.run([sys.executable, filter_path, *extra_args],
+                           stdin=log_file,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark filter-bounds-inference-errors.py.')
+    parser.add_argument('--filter',
+                        action='append',
+                        help='Filter script to benchmark (may be repeated; '
+                        'default: the one in this directory).')
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--density',
+                        type=float,
+                        action='append',
+                        help='Fraction of lines that are errors (may be '
+                        'repeated; default: 0, 0.001, 0.01, 0.1 and 0.5).')
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('filter_args',
+                        nargs='*',
+                        help='Extra arguments to pass to the filter.')
+    args = parser.parse_args()
+
+    filters = args.filter or [
+        os.path.join(SCRIPT_DIR, 'filter-bounds-inference-errors.py')
+    ]
+    densities = args.density or [0, 0.001, 0.01, 0.1, 0.5]
+    size = int(args.size_mb * (1 << 20))
+    rng = random.Random(args.seed)
+
+    print('density  ' + '  '.join(f'{os.path.basename(f):>12.12}'
+                                  for f in filters) + '  (MB/s)')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        empty_path = os.path.join(tmp_dir, 'empty.log')
+        open(empty_path, 'w').close()
+        startup_times = [
+            time_filter(f, empty_path, args.filter_args, args.repetitions)
+            for f in filters
+        ]
+        for density in densities:
+            log_path = os.path.join(tmp_dir, f'build-{density}.log')
+            generate_log(log_path, size, density, rng)
+            actual_mb = os.path.getsize(log_path) / (1 << 20)
+            rates = [
+                actual_mb /
+                max(1e-6,
+                    time_filter(f, log_path, args.filter_args,
+                                args.repetitions) - startup)
+                for f, startup in zip(filters, startup_times)
+            ]
+            print(f'{density:<7g}  ' + '  '.join(f'{r:12.1f}' for r in rates),
+                  flush=True)
+            os.remove(log_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Measure how long workflowgen.py takes to render the workflow files, so
+# we can keep an eye on it as the benchmark list grows.
+#
+# usage: benchmark-generate-workflow.py [--scale N]... [--repetitions N]
+#
+# Renders every workflow config in memory (nothing is written) with the
+# benchmark list repeated N times (under distinct names) and reports the best
+# time over the repetitions, with the memoization caches cleared first ("cold")
+# and kept ("warm").
+
+import argparse
+import dataclasses
+import time
+
+import workflowgen as gen
+
+
+def clear_caches():
+    for fn in (gen.dedent, gen.indent, gen.format_step):
+        fn.cache_clear()
+
+
+def render_all(benchmark_infos) -> int:
+    lines = 0
+    for config in gen.workflow_file_configs:
+        lines += gen.render_workflow(config, benchmark_infos).count('\n')
+    return lines
+
+
+def best_time(fn, repetitions: int, setup=lambda: None):
+    best = float('inf')
+    result = None
+    for _ in range(repetitions):
+        setup()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark rendering of the generated workflows.')
+    parser.add_argument('--scale',
+                        type=int,
+                        action='append',
+                        help='Number of copies of the benchmark list to '
+                        'render (may be repeated; default: 1, 4 and 16).')
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"scale":>5}  {"lines":>8}  {"cold ms":>8}  {"warm ms":>8}  '
+          f'{"klines/s":>8}')
+    for scale in args.scale or [1, 4, 16]:
+        benchmark_infos = [
+            dataclasses.replace(binfo, name=f'{binfo.name}{i or ""}')
+            for i in range(scale) for binfo in gen.benchmarks
+        ]
+        cold, lines = best_time(lambda: render_all(benchmark_infos),
+                                args.repetitions, clear_caches)
+        warm, _ = best_time(lambda: render_all(benchmark_infos),
+                            args.repetitions)
+        print(f'{scale:5}  {lines:8}  {cold * 1000:8.1f}  {warm * 1000:8.1f}  '
+              f'{lines / cold / 1000:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
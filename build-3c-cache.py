@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# Local, content-addressed cache of 3C/clang build directories, so that
+# workflow runs on the same self-hosted machine can skip the LLVM build when
+# another run already built the same commits with the same flags.
+#
+# usage (see the `Build 3c and clang` step in workflowgen.py):
+#
+#   key=$(build-3c-cache.py --cache-dir DIR key --source REPO... \
+#           --build-dir BUILDDIR -- CMAKE_FLAGS... NINJA_TARGETS...)
+#   if ! build-3c-cache.py --cache-dir DIR restore --source REPO... \
+#          "$key" BUILDDIR; then
+#     ...build...
+#     build-3c-cache.py --cache-dir DIR store --build-seconds N \
+#       --max-size SIZE "$key" BUILDDIR
+#   fi
+#   build-3c-cache.py --cache-dir DIR report
+#
+# Each cache entry is an uncompressed tarball of the whole build directory
+# (not just bin/3c, bin/clang and bin/clang-rename) because the `test_3c` job
+# runs `ninja check-3c` in the same directory, and that needs the rest of the
+# build tree to be up to date. We don't compress: the entries live on local
+# disk, and compressing several GB of objects would cost a good fraction of the
+# build time we're trying to save.
+#
+# Entries are evicted least recently used first once the cache exceeds its
+# size limit. Every lookup, store and eviction is appended to log.ndjson in the
+# cache directory, and `report` summarizes that log. A restore that fails
+# counts as a miss (and an entry whose tarball can't be read is dropped), and a
+# store that fails (e.g., when the disk is full) caches nothing; neither fails
+# the build.
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+LOG_FILENAME = 'log.ndjson'
+LOCK_FILENAME = 'lock'
+
+SIZE_SUFFIXES = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    match = re.fullmatch(r'(\d+)([KMGT]?)i?B?', size.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f'invalid size: {size!r}')
+    return int(match[1]) * SIZE_SUFFIXES[match[2]]
+
+
+def git_output(repo: str, *args: str) -> str:
+    return subprocess.run(['git', '-C', repo, *args],
+                          check=True,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout
+
+
+class BuildCache:
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _lock(self, exclusive: bool):
+        # The returned file holds the lock until it is closed. Several runners
+        # on the same machine may share one cache directory.
+        lock_file = open(self._path(LOCK_FILENAME), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return lock_file
+
+    def log(self, event: str, key: str, **fields):
+        record = {'time': time.time(), 'event': event, 'key': key, **fields}
+        # A single small write with O_APPEND is atomic enough for concurrent
+        # writers that we don't bother taking the lock for it.
+        with open(self._path(LOG_FILENAME), 'a') as log_file:
+            log_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def _read_meta(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key + '.json')) as meta_file:
+                return json.load(meta_file)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, key: str, meta: Dict):
+        tmp_path = self._path(f'{key}.json.tmp.{os.getpid()}')
+        with open(tmp_path, 'w') as meta_file:
+            json.dump(meta, meta_file, sort_keys=True)
+        os.replace(tmp_path, self._path(key + '.json'))
+
+    def entries(self) -> List[Dict]:
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.json') and not fname.startswith('.'):
+                meta = self._read_meta(fname[:-len('.json')])
+                if meta is not None:
+                    entries.append(meta)
+        return entries
+
+    def restore(self, key: str, dest: str) -> bool:
+        start = time.time()
+        with self._lock(exclusive=False):
+            meta = self._read_meta(key)
+            if meta is None:
+                self.log('miss', key)
+                return False
+            tar_path = self._path(key + '.tar')
+            try:
+                subprocess.run(['tar', '-xf', tar_path, '-C', dest],
+                               check=True)
+            except subprocess.CalledProcessError as e:
+                tar_status = e.returncode
+                # Tell an unreadable tarball (e.g., one truncated when the
+                # cache's disk filled up) from a failure to write `dest`
+                # (e.g., when the build's disk is full).
+                corrupt = subprocess.run(['tar', '-tf', tar_path],
+                                         stdout=subprocess.DEVNULL).returncode
+            else:
+                tar_status = 0
+                meta['last_used'] = time.time()
+                self._write_meta(key, meta)
+        if tar_status != 0:
+            # Rather than fail the build step, let the caller build from
+            # scratch, in an empty directory, since a partly extracted tree
+            # could look up to date to ninja.
+            clear_dir(dest)
+            if corrupt:
+                with self._lock(exclusive=True):
+                    # Unless another run has stored the entry again since.
+                    current = self._read_meta(key)
+                    if (current is not None and
+                            current['created'] == meta['created']):
+                        self._remove(key)
+                self.log('corrupt', key, tar_status=tar_status)
+            else:
+                self.log('restore_failed', key, tar_status=tar_status)
+            self.log('miss', key)
+            return False
+        restore_seconds = time.time() - start
+        self.log('hit',
+                 key,
+                 restore_seconds=restore_seconds,
+                 saved_seconds=max(0.0,
+                                   meta['build_seconds'] - restore_seconds))
+        return True
+
+    def store(self, key: str, src: str, build_seconds: float, max_size: int):
+        tmp_path = self._path(f'{key}.tar.tmp.{os.getpid()}')
+        # Build the tarball outside the lock; only the rename into place and
+        # the eviction need to be serialized.
+        try:
+            subprocess.run(['tar', '-cf', tmp_path, '-C', src, '.'],
+                           check=True)
+        except subprocess.CalledProcessError as e:
+            # Probably out of disk space. The build itself succeeded, so just
+            # don't cache it, and don't leave the partial tarball behind, where
+            # eviction wouldn't see it.
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            self.log('store_failed', key, tar_status=e.returncode)
+            print(f'Could not store the build in the cache: tar exited with '
+                  f'status {e.returncode}',
+                  file=sys.stderr)
+            return
+        with self._lock(exclusive=True):
+            os.replace(tmp_path, self._path(key + '.tar'))
+            now = time.time()
+            meta = {
+                'key': key,
+                'size': os.path.getsize(self._path(key + '.tar')),
+                'build_seconds': build_seconds,
+                'created': now,
+                'last_used': now,
+            }
+            self._write_meta(key, meta)
+            self.log('store',
+                     key,
+                     size=meta['size'],
+                     build_seconds=build_seconds)
+            self._evict(max_size, keep=key)
+
+    def _remove(self, key: str):
+        # Remove the metadata first so a concurrent `restore` never sees an
+        # entry whose tarball is gone.
+        for suffix in ('.json', '.tar'):
+            try:
+                os.remove(self._path(key + suffix))
+            except FileNotFoundError:
+                # Another run dropped the same corrupt entry.
+                pass
+
+    def _evict(self, max_size: int, keep: str):
+        entries = sorted(self.entries(), key=lambda e: e['last_used'])
+        total = sum(e['size'] for e in entries)
+        for entry in entries:
+            if total <= max_size:
+                break
+            if entry['key'] == keep:
+                continue
+            self._remove(entry['key'])
+            total -= entry['size']
+            self.log('evict', entry['key'], size=entry['size'])
+
+
+def compute_key(sources: List[str], build_dir: str, inputs: List[str],
+                build_args: List[str]) -> str:
+    h = hashlib.sha256()
+    # The absolute build directory is baked into CMakeCache.txt and
+    # build.ninja, so a tree built elsewhere isn't reusable.
+    h.update(b'build_dir\0' + os.path.abspath(build_dir).encode() + b'\0')
+    for source in sources:
+        h.update(b'source\0' + git_output(source, 'rev-parse', 'HEAD').encode())
+    for fname in inputs:
+        with open(fname, 'rb') as input_file:
+            h.update(b'input\0' + hashlib.sha256(input_file.read()).digest())
+    for arg in build_args:
+        h.update(b'arg\0' + arg.encode() + b'\0')
+    return h.hexdigest()
+
+
+def clear_dir(path: str):
+    """Remove the contents of `path`, but not `path` itself, which the
+    caller's shell may be in."""
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+
+def normalize_source_mtimes(repo: str):
+    # A fresh checkout gives every source file the current time as its mtime,
+    # which would make ninja consider the whole restored build out of date.
+    # Setting the tracked files back to the commit time makes them older than
+    # anything in a cache entry built from that commit.
+    commit_time = int(git_output(repo, 'log', '-1', '--format=%ct'))
+    for fname in git_output(repo, 'ls-files', '-z').split('\0'):
+        if fname == '':
+            continue
+        try:
+            os.utime(os.path.join(repo, fname), (commit_time, commit_time),
+                     follow_symlinks=False)
+        except FileNotFoundError:
+            # Deleted in the work tree or a submodule that isn't checked out.
+            pass
+
+
+def report(cache: BuildCache, out):
+    counts: Dict[str, int] = {}
+    saved_seconds = 0.0
+    try:
+        with open(cache._path(LOG_FILENAME)) as log_file:
+            for line in log_file:
+                record = json.loads(line)
+                counts[record['event']] = counts.get(record['event'], 0) + 1
+                saved_seconds += record.get('saved_seconds', 0.0)
+    except FileNotFoundError:
+        pass
+    lookups = counts.get('hit', 0) + counts.get('miss', 0)
+    entries = cache.entries()
+    out.write(f'Lookups: {lookups} ({counts.get("hit", 0)} hits, '
+              f'{counts.get("miss", 0)} misses, of which '
+              f'{counts.get("restore_failed", 0)} failed to write the build '
+              'directory)\n')
+    if lookups != 0:
+        out.write(f'Hit rate: {counts.get("hit", 0) / lookups:.1%}\n')
+    out.write(f'Stores: {counts.get("store", 0)} '
+              f'({counts.get("store_failed", 0)} more failed), '
+              f'evictions: {counts.get("evict", 0)}, '
+              f'corrupt entries dropped: {counts.get("corrupt", 0)}\n')
+    out.write(f'Build time saved: {saved_seconds / 3600:.2f} hours\n')
+    out.write(f'Entries: {len(entries)}, total size: '
+              f'{sum(e["size"] for e in entries) / (1 << 30):.2f} GiB\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cache 3C/clang build directories on local disk.')
+    parser.add_argument('--cache-dir', required=True)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    key_parser = subparsers.add_parser(
+        'key', help='Print the cache key for a build configuration.')
+    key_parser.add_argument('--source',
+                            action='append',
+                            default=[],
+                            help='Git checkout whose HEAD the build uses.')
+    key_parser.add_argument('--build-dir', required=True)
+    key_parser.add_argument(
+        '--input',
+        action='append',
+        default=[],
+        help='Extra file whose contents affect the build (e.g., a profile).')
+    key_parser.add_argument('build_args',
+                            nargs='*',
+                            help='CMake flags, ninja targets, etc.')
+
+    restore_parser = subparsers.add_parser(
+        'restore', help='Extract a cached build; exit 1 if there is none.')
+    restore_parser.add_argument(
+        '--source',
+        action='append',
+        default=[],
+        help='Git checkout to make older than the restored build.')
+    restore_parser.add_argument('key')
+    restore_parser.add_argument('dest')
+
+    store_parser = subparsers.add_parser('store',
+                                         help='Add a build to the cache.')
+    store_parser.add_argument('--build-seconds', type=float, required=True)
+    store_parser.add_argument('--max-size', type=parse_size, required=True)
+    store_parser.add_argument('key')
+    store_parser.add_argument('src')
+
+    subparsers.add_parser('report', help='Summarize the hit/miss log.')
+
+    args = parser.parse_args()
+    cache = BuildCache(args.cache_dir)
+    if args.command == 'key':
+        print(
+            compute_key(args.source, args.build_dir, args.input,
+                        args.build_args))
+    elif args.command == 'restore':
+        if not cache.restore(args.key, args.dest):
+            print(f'Build cache miss: {args.key}', file=sys.stderr)
+            sys.exit(1)
+        for source in args.source:
+            normalize_source_mtimes(source)
+        print(f'Build cache hit: {args.key}', file=sys.stderr)
+    elif args.command == 'store':
+        cache.store(args.key, args.src, args.build_seconds, args.max_size)
+    elif args.command == 'report':
+        report(cache, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# A ccache-style compiler cache for the benchmark builds, so that the
+# translation units that come out of a conversion unchanged, and those that
+# another job or workflow run already compiled the same way, aren't compiled
+# again. workflowgen.py puts this in front of the benchmark compiler
+# when WorkflowConfig.compiler_cache is set.
+#
+# usage:
+#   CLANG_CACHE_DIR=DIR clang-cache.py COMPILER ARG...
+#   clang-cache.py --report STATS_FILE...
+#
+# The first form runs `COMPILER ARG...`, but if ARG is a compilation of a
+# single source file to an object file, the object file (and the dependency
+# file of -MD, if any) comes from the cache when possible. The key is the hash
+# of the compiler binary, the arguments and the preprocessed source, and with
+# a -g option, the working directory, which the debug info records (as with
+# ccache's hash_dir). These environment variables control the cache:
+#
+#   CLANG_CACHE_DIR       The cache directory. If it is unset, we just run the
+#                         compiler.
+#   CLANG_CACHE_MAX_SIZE  Size limit (e.g., 20G; default 10G). Beyond it, the
+#                         least recently used entries are evicted.
+#   CLANG_CACHE_BASE_DIR  Absolute paths under this directory in the arguments
+#                         are made relative to the working directory, so that
+#                         copies of a benchmark in different directories (one
+#                         per subvariant) share entries (except with -g), as
+#                         with ccache's base_dir.
+#   CLANG_CACHE_STATS     File to append a record of each invocation to, for
+#                         `--report`.
+#
+# Under `bear`, we always run the compiler: bear records the compiler
+# invocations it sees, and a cache hit would leave the translation unit out of
+# the compilation database. So the cache pays off for the post-conversion
+# builds and for builds outside bear.
+#
+# `--report` summarizes the records of a job: how many compilations hit the
+# cache, missed it, failed or couldn't be cached, and the compile time saved.
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Change this to invalidate all the entries after a change in what they hold.
+CACHE_VERSION = '1'
+DEFAULT_MAX_SIZE = '10G'
+# On eviction, go this far below the limit so that we don't evict on every
+# store.
+EVICT_TO_FRACTION = 0.9
+
+SOURCE_EXTENSIONS = ('.c', '.i')
+# Options whose value is the next argument.
+OPTIONS_WITH_VALUE = {
+    '-o', '-I', '-D', '-U', '-include', '-imacros', '-isystem', '-iquote',
+    '-idirafter', '-MF', '-MT', '-MQ', '-x', '-Xclang', '-Xpreprocessor',
+    '-target', '-isysroot', '--sysroot'
+}
+# Options that produce something other than a single object file, and
+# prefixes of options whose result depends on files we don't hash.
+UNCACHEABLE_OPTIONS = {
+    '-E', '-S', '-M', '-MM', '-fsyntax-only', '-###', '-v', '--analyze'
+}
+UNCACHEABLE_PREFIXES = ('-save-temps', '-fprofile', '-ftime-trace')
+# Options that are only about the dependency file, which the preprocessing
+# doesn't need.
+DEP_OPTIONS = {'-MD', '-MMD', '-MP'}
+DEP_OPTIONS_WITH_VALUE = {'-MF', '-MT', '-MQ'}
+# Options whose (attached or next) value may be a path under the base
+# directory.
+PATH_OPTIONS = ('-I', '-iquote', '-isystem', '-idirafter', '-include', '-o',
+                '-MF', '-MT', '-MQ')
+
+SIZE_SUFFIXES = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    size = size.strip().upper().rstrip('B').rstrip('I')
+    suffix = size[-1:] if size[-1:] in SIZE_SUFFIXES else ''
+    return int(size[:len(size) - len(suffix)]) * SIZE_SUFFIXES[suffix]
+
+
+def under_bear() -> bool:
+    # Bear 2 and 3 intercept the build with a preloaded library and tell it
+    # where to report through the environment.
+    return ('INTERCEPT_BUILD_TARGET_DIR' in os.environ or
+            'INTERCEPT_REPORT_DESTINATION' in os.environ or
+            any(lib in os.environ.get('LD_PRELOAD', '')
+                for lib in ('libear', 'libexec.so')))
+
+
+class Compilation:
+    """The parts of a compiler command line that the cache needs, or None
+    from `parse` if we can't cache it."""
+
+    def __init__(self, args: List[str], source: str, output: str,
+                 dep_file: Optional[str]):
+        self.args = args
+        self.source = source
+        self.output = output
+        self.dep_file = dep_file
+
+    @staticmethod
+    def parse(args: List[str]) -> Optional['Compilation']:
+        if '-c' not in args:
+            return None
+        sources = []
+        output = None
+        dep_file = None
+        makes_deps = False
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if (arg in UNCACHEABLE_OPTIONS or
+                    arg.startswith(UNCACHEABLE_PREFIXES + ('@',)) or
+                    arg == '-' or (arg.startswith('-o') and arg != '-o')):
+                return None
+            if arg in OPTIONS_WITH_VALUE:
+                if i + 1 == len(args):
+                    return None
+                if arg == '-o':
+                    output = args[i + 1]
+                elif arg == '-MF':
+                    dep_file = args[i + 1]
+                i += 2
+                continue
+            if arg in ('-MD', '-MMD'):
+                makes_deps = True
+            elif not arg.startswith('-'):
+                sources.append(arg)
+            i += 1
+        if len(sources) != 1 or not sources[0].endswith(SOURCE_EXTENSIONS):
+            return None
+        source = sources[0]
+        if output is None:
+            output = os.path.splitext(os.path.basename(source))[0] + '.o'
+        if makes_deps and dep_file is None:
+            dep_file = os.path.splitext(output)[0] + '.d'
+        elif not makes_deps:
+            dep_file = None
+        return Compilation(args, source, output, dep_file)
+
+    def preprocess_args(self) -> List[str]:
+        args = []
+        skip_next = False
+        for arg in self.args:
+            if skip_next:
+                skip_next = False
+            elif arg == '-o' or arg in DEP_OPTIONS_WITH_VALUE:
+                skip_next = True
+            elif arg != '-c' and arg not in DEP_OPTIONS:
+                args.append(arg)
+        return args + ['-E', '-o', '-']
+
+
+def relativize_args(args: List[str], base_dir: str) -> List[str]:
+    """Make the absolute paths under `base_dir` in `args` relative to the
+    working directory."""
+    base_dir = os.path.normpath(base_dir) + os.sep
+    cwd = os.getcwd()
+    result = []
+    for arg in args:
+        prefix = next((p for p in PATH_OPTIONS if arg.startswith(p + base_dir)),
+                      '')
+        path = arg[len(prefix):]
+        if path.startswith(base_dir):
+            arg = prefix + os.path.relpath(path, cwd)
+        result.append(arg)
+    return result
+
+
+def generates_debug_info(args: List[str]) -> bool:
+    return any(arg.startswith('-g') for arg in args)
+
+
+class CompilerCache:
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _path(self, *names: str) -> str:
+        return os.path.join(self.cache_dir, *names)
+
+    def _lock(self):
+        # The returned file holds the lock until it is closed.
+        lock_file = open(self._path('lock'), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def compiler_hash(self, compiler: str) -> str:
+        # Hashing a clang binary takes longer than many of the compilations,
+        # so remember the hash of each version of the file, as identified by
+        # its path, size and modification time.
+        path = shutil.which(compiler) or compiler
+        st = os.stat(path)
+        memo_key = hashlib.sha256(
+            f'{os.path.realpath(path)}\0{st.st_size}\0{st.st_mtime_ns}'.encode(
+            )).hexdigest()
+        memo_path = self._path('compilers', memo_key)
+        try:
+            with open(memo_path) as memo_file:
+                return memo_file.read()
+        except FileNotFoundError:
+            pass
+        h = hashlib.sha256()
+        with open(path, 'rb') as compiler_file:
+            for block in iter(lambda: compiler_file.read(1 << 20), b''):
+                h.update(block)
+        os.makedirs(self._path('compilers'), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w',
+                                         dir=self._path('compilers'),
+                                         delete=False) as tmp:
+            tmp.write(h.hexdigest())
+        os.replace(tmp.name, memo_path)
+        return h.hexdigest()
+
+    def entry_dir(self, key: str) -> str:
+        return self._path('objects', key[:2], key)
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        # Readers don't take the lock, so another compilation of the same
+        # build may evict the entry at any point; then it's a miss.
+        try:
+            with open(os.path.join(self.entry_dir(key), 'meta.json')) as meta:
+                entry = json.load(meta)
+            # The modification time of the entry is its last use, for
+            # eviction.
+            os.utime(self.entry_dir(key))
+        except OSError:
+            return None
+        return entry
+
+    def fetch(self, key: str, files: Dict[str, str]) -> bool:
+        """Copy the files of entry `key` to their destinations in `files`
+        (by name in the entry). If the entry is evicted meanwhile, remove the
+        partial copies and return False."""
+        entry_dir = self.entry_dir(key)
+        try:
+            for name, dest in files.items():
+                shutil.copyfile(os.path.join(entry_dir, name), dest)
+        except OSError:
+            for dest in files.values():
+                try:
+                    os.remove(dest)
+                except FileNotFoundError:
+                    pass
+            return False
+        return True
+
+    def store(self, key: str, files: Dict[str, str], meta: Dict):
+        tmp_root = self._path('tmp')
+        os.makedirs(tmp_root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=tmp_root)
+        size = 0
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(tmp_dir, name))
+            size += os.path.getsize(src)
+        meta = dict(meta, size=size)
+        # Written last: an entry without it doesn't exist yet.
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        entry_dir = self.entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another job stored the same entry first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        with self._lock():
+            total = self._read_total() + size
+            if total > self.max_size:
+                total = self._evict()
+            self._write_total(total)
+
+    def _read_total(self) -> int:
+        try:
+            with open(self._path('size')) as size_file:
+                return int(size_file.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_total(self, total: int):
+        with open(self._path('size'), 'w') as size_file:
+            size_file.write(str(total))
+
+    def _evict(self) -> int:
+        """Evict the least recently used entries until the cache is below
+        EVICT_TO_FRACTION of its limit, and return its new size."""
+        entries: List[Tuple[float, int, str]] = []
+        objects_dir = self._path('objects')
+        for shard in os.scandir(objects_dir):
+            for entry in os.scandir(shard.path):
+                try:
+                    with open(os.path.join(entry.path, 'meta.json')) as meta:
+                        size = json.load(meta)['size']
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except (FileNotFoundError, ValueError, KeyError):
+                    continue
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= EVICT_TO_FRACTION * self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        return total
+
+
+def record(result: str, **fields):
+    stats_file = os.environ.get('CLANG_CACHE_STATS')
+    if not stats_file:
+        return
+    # A single small write with O_APPEND is atomic enough for the concurrent
+    # compilations of a parallel build.
+    with open(stats_file, 'a') as out:
+        out.write(json.dumps({'result': result, **fields}) + '\n')
+
+
+def run_compiler(compiler: str, args: List[str]) -> int:
+    return subprocess.run([compiler] + args).returncode
+
+
+def compile_cached(compiler: str, args: List[str]) -> int:
+    cache_dir = os.environ.get('CLANG_CACHE_DIR')
+    if not cache_dir:
+        return run_compiler(compiler, args)
+    if under_bear():
+        record('bear')
+        return run_compiler(compiler, args)
+    base_dir = os.environ.get('CLANG_CACHE_BASE_DIR')
+    if base_dir:
+        args = relativize_args(args, base_dir)
+    compilation = Compilation.parse(args)
+    if compilation is None:
+        record('uncacheable')
+        return run_compiler(compiler, args)
+
+    cache = CompilerCache(
+        cache_dir,
+        parse_size(os.environ.get('CLANG_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE)))
+    preprocessed = subprocess.run([compiler] + compilation.preprocess_args(),
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL)
+    if preprocessed.returncode != 0:
+        # Let the compiler report the error.
+        record('failed')
+        return run_compiler(compiler, args)
+    h = hashlib.sha256()
+    h.update(CACHE_VERSION.encode() + b'\0')
+    h.update(cache.compiler_hash(compiler).encode() + b'\0')
+    for arg in args:
+        h.update(arg.encode() + b'\0')
+    if generates_debug_info(args):
+        # The object file records it as DW_AT_comp_dir, so a copy of the
+        # benchmark elsewhere under CLANG_CACHE_BASE_DIR mustn't share it.
+        h.update(os.getcwd().encode() + b'\0')
+    h.update(preprocessed.stdout)
+    key = h.hexdigest()
+
+    files = {'object': compilation.output}
+    if compilation.dep_file is not None:
+        files['deps'] = compilation.dep_file
+    entry = cache.lookup(key)
+    if entry is not None and cache.fetch(key, files):
+        sys.stdout.write(entry['stdout'])
+        sys.stderr.write(entry['stderr'])
+        record('hit', saved_seconds=entry['seconds'])
+        return 0
+
+    start = time.monotonic()
+    compiled = subprocess.run([compiler] + args,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              universal_newlines=True)
+    seconds = time.monotonic() - start
+    sys.stdout.write(compiled.stdout)
+    sys.stderr.write(compiled.stderr)
+    if compiled.returncode != 0:
+        record('failed')
+        return compiled.returncode
+    cache.store(key, files, {
+        'seconds': seconds,
+        'stdout': compiled.stdout,
+        'stderr': compiled.stderr
+    })
+    record('miss', seconds=seconds)
+    return 0
+
+
+def report(stats_files: List[str], out):
+    counts: Dict[str, int] = {}
+    saved_seconds = 0.0
+    for path in stats_files:
+        try:
+            with open(path) as stats_file:
+                for line in stats_file:
+                    rec = json.loads(line)
+                    counts[rec['result']] = counts.get(rec['result'], 0) + 1
+                    saved_seconds += rec.get('saved_seconds', 0.0)
+        except FileNotFoundError:
+            pass
+    hits = counts.get('hit', 0)
+    lookups = hits + counts.get('miss', 0)
+    out.write(f'Compiler invocations: {sum(counts.values())}\n')
+    out.write(f'Cache lookups: {lookups} ({hits} hits, '
+              f'{counts.get("miss", 0)} misses)\n')
+    if lookups != 0:
+        out.write(f'Hit rate: {hits / lookups:.1%}\n')
+    out.write(f'Not looked up: {counts.get("failed", 0)} failed, '
+              f'{counts.get("uncacheable", 0)} uncacheable, '
+              f'{counts.get("bear", 0)} under bear\n')
+    out.write(f'Compile time saved: {saved_seconds:.1f} seconds\n')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1].startswith('-'):
+        parser = argparse.ArgumentParser(
+            description='Compiler cache for the benchmark builds.')
+        parser.add_argument('--report',
+                            nargs='+',
+                            required=True,
+                            metavar='STATS_FILE',
+                            help='Summarize the records in these files.')
+        args = parser.parse_args()
+        report(args.report, sys.stdout)
+        return
+    if len(sys.argv) < 2:
+        sys.exit('usage: clang-cache.py COMPILER ARG...')
+    sys.exit(compile_cached(sys.argv[1], sys.argv[2:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Copy a benchmark tree that has already been extracted, patched and built
+# (with its compile_commands.json) to a new location, so that each subvariant
+# can start from the same prepared tree instead of extracting and building the
+# benchmark again.
+#
+# usage: clone-benchmark-tree.py SRC DEST
+#
+# The copy uses `cp --reflink=auto`, which shares the file contents
+# copy-on-write on file systems that support it (Btrfs, XFS) and falls back to
+# an ordinary copy elsewhere. We can't use hard links: 3C's output is copied
+# over the original sources with `cp`, which writes into the existing inode and
+# would therefore modify the prepared tree and every other clone.
+#
+# Build systems record the absolute path of the tree all over the place
+# (compile_commands.json, CMakeCache.txt, Makefiles generated by configure,
+# dependency files, etc.), so we then replace SRC with DEST in every text file
+# of the copy. We preserve the modification times of the files we rewrite so
+# that `make` and `ninja` don't consider the build out of date. Ninja's
+# dependency log is binary and can't be rewritten this way, so we delete it,
+# which makes ninja rebuild each object the next time it runs (as it does
+# anyway after the conversion).
+
+import argparse
+import os
+import subprocess
+import sys
+
+# A file is considered binary if its first block contains a NUL byte, like
+# `grep -I` does.
+BINARY_CHECK_SIZE = 8192
+
+NINJA_DEPS_LOG = '.ninja_deps'
+
+
+def is_text(data: bytes) -> bool:
+    return b'\0' not in data[:BINARY_CHECK_SIZE]
+
+
+def relocate_file(path: str, old: bytes, new: bytes) -> bool:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if old not in data or not is_text(data):
+        return False
+    st = os.stat(path)
+    with open(path, 'wb') as f:
+        f.write(data.replace(old, new))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return True
+
+
+def clone_tree(src: str, dest: str) -> int:
+    src = os.path.abspath(src)
+    dest = os.path.abspath(dest)
+    if os.path.exists(dest):
+        sys.exit(f'clone-benchmark-tree.py: {dest} already exists')
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    subprocess.run(['cp', '-a', '--reflink=auto', src, dest], check=True)
+
+    rewritten = 0
+    old = os.fsencode(src)
+    new = os.fsencode(dest)
+    for dirpath, _, filenames in os.walk(dest):
+        for fname in filenames:
+            path = os.path.join(dirpath, fname)
+            if os.path.islink(path):
+                # A link into the tree should be relative; a link out of it
+                # doesn't need to change.
+                continue
+            if fname == NINJA_DEPS_LOG:
+                os.remove(path)
+                continue
+            if relocate_file(path, old, new):
+                rewritten += 1
+    return rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Clone a prepared benchmark tree to a new location.')
+    parser.add_argument('src')
+    parser.add_argument('dest')
+    args = parser.parse_args()
+    rewritten = clone_tree(args.src, args.dest)
+    print(f'Cloned {args.src} to {args.dest} '
+          f'({rewritten} files relocated)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Compare the 3c stats of the different solutions (e.g., least vs. greatest
+# from the exhaustiveleastgreatest workflow, CCured vs. FuncRevEdges from the
+# exhaustiveccured workflow, and the default solution from the others) side by
+# side, for each component of each benchmark. The same goes for the builds of
+# 3c that some variants use (see Variant.build_profile in workflowgen.py), so
+# that, e.g., the artifacts of the timing workflow give the conversion times
+# with the PGO build of 3c (`pgo`) next to those with the same build without
+# the profile (`default`, the thinlto profile).
+#
+# usage: compare-solutions.py [options] ARTIFACTS_DIR...
+#
+# ARTIFACTS_DIR is a directory with one subdirectory per artifact, as for
+# aggregate-timing-stats.py; pass the artifacts of several workflow runs to
+# compare across them. A subvariant name is the expand_macros and alltypes
+# settings followed by the extra 3c flags that select the solution (see
+# make_subvariant in workflowgen.py), so we compare the solutions that
+# share the settings. Each --section NAME=REGEX makes one table of the metrics
+# whose names match REGEX (see perfstats.flatten_json for the naming), with one
+# row per component and metric and one column per solution. A metric with
+# several iterations is represented by its median. After the values, each
+# other solution gets a column with its ratio to the first one (the default
+# solution if present, otherwise the first in name order, or the one given by
+# --baseline).
+
+import argparse
+import csv
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import perfstats
+
+# 3c writes its timings and counts under names that have changed over time,
+# so match them loosely.
+DEFAULT_SECTIONS = [
+    ('Conversion time', r'(?i)time'),
+    ('Constraints', r'(?i)constraint'),
+    ('Checked pointers', r'(?i)(checked|\bptr|\barr|ntarr)'),
+]
+
+SUBVARIANT_RE = re.compile(r'(?P<settings>(?:no_)?expand_macros_(?:no_)?alltypes)'
+                           r'(?:_(?P<solution>.+))?')
+DEFAULT_SOLUTION = 'default'
+
+
+def split_subvariant(subvariant: str) -> Tuple[str, str]:
+    match = SUBVARIANT_RE.fullmatch(subvariant)
+    if match is None:
+        return subvariant, DEFAULT_SOLUTION
+    return match['settings'], match['solution'] or DEFAULT_SOLUTION
+
+
+def parse_section(spec: str) -> Tuple[str, 're.Pattern']:
+    name, sep, pattern = spec.partition('=')
+    if sep == '':
+        raise argparse.ArgumentTypeError(
+            f'invalid section {spec!r}: expected NAME=REGEX')
+    return name, re.compile(pattern)
+
+
+def order_solutions(solutions: List[str], baseline: Optional[str]) -> List[str]:
+    first = baseline if baseline in solutions else (
+        DEFAULT_SOLUTION if DEFAULT_SOLUTION in solutions else None)
+    rest = sorted(s for s in solutions if s != first)
+    return ([first] if first is not None else []) + rest
+
+
+Table = Tuple[str, List[str], List[List]]
+
+
+def build_tables(groups: perfstats.Groups,
+                 sections: List[Tuple[str, 're.Pattern']],
+                 baseline: Optional[str]) -> List[Table]:
+    """Return (title, header, rows) for each table."""
+    # settings -> component -> metric -> solution -> median
+    by_settings: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {}
+    for (component, subvariant), metrics in groups.items():
+        settings, solution = split_subvariant(subvariant)
+        components = by_settings.setdefault(settings, {})
+        for metric, values in metrics.items():
+            components.setdefault(component, {}).setdefault(
+                metric, {})[solution] = perfstats.median(sorted(values))
+
+    tables = []
+    for settings, components in sorted(by_settings.items()):
+        solutions = order_solutions(
+            list({
+                solution for metrics in components.values()
+                for by_solution in metrics.values() for solution in by_solution
+            }), baseline)
+        if len(solutions) < 2:
+            continue
+        header = (['component', 'metric'] + solutions +
+                  [f'{s}/{solutions[0]}' for s in solutions[1:]])
+        for title, section_re in sections:
+            rows = []
+            for component, metrics in sorted(components.items()):
+                for metric, by_solution in sorted(metrics.items()):
+                    if not section_re.search(metric):
+                        continue
+                    values = [by_solution.get(s) for s in solutions]
+                    first = values[0]
+                    ratios = [
+                        v / first if v is not None and first else None
+                        for v in values[1:]
+                    ]
+                    rows.append([component, metric] + values + ratios)
+            if rows:
+                tables.append((f'{title} ({settings})', header, rows))
+    return tables
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{value:.4g}'
+    return str(value)
+
+
+def write_markdown(tables, out):
+    for title, header, rows in tables:
+        out.write(f'## {title}\n\n')
+        out.write('| ' + ' | '.join(header) + ' |\n')
+        out.write('|' + '---|' * 2 + '---:|' * (len(header) - 2) + '\n')
+        for row in rows:
+            out.write('| ' + ' | '.join(format_cell(v) for v in row) + ' |\n')
+        out.write('\n')
+
+
+def write_csv(tables, out):
+    writer = csv.writer(out)
+    for title, header, rows in tables:
+        writer.writerow(['table'] + header)
+        for row in rows:
+            writer.writerow([title] + [format_cell(v) for v in row])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare 3c stats across solutions side by side.')
+    parser.add_argument('artifact_dirs', nargs='+', metavar='ARTIFACTS_DIR')
+    parser.add_argument('--section',
+                        type=parse_section,
+                        action='append',
+                        metavar='NAME=REGEX',
+                        help='Table of the metrics matching REGEX (may be '
+                        'repeated; default: conversion time, constraints and '
+                        'checked pointers).')
+    parser.add_argument('--baseline',
+                        help='Solution to compare the others with, e.g., '
+                        'only_g_sol.')
+    parser.add_argument('--format', choices=['markdown', 'csv'],
+                        default='markdown')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout).')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of processes reading artifacts.')
+    args = parser.parse_args()
+    sections = args.section or [
+        (name, re.compile(pattern)) for name, pattern in DEFAULT_SECTIONS
+    ]
+
+    artifacts = [(name, path)
+                 for name, path in perfstats.find_artifacts(args.artifact_dirs)
+                 if name.kind == perfstats.STATS_KIND]
+    if not artifacts:
+        sys.exit('compare-solutions.py: no stats artifacts found')
+    groups = perfstats.load_groups(artifacts, '', args.jobs)
+    tables = build_tables(groups, sections, args.baseline)
+    if not tables:
+        sys.exit('compare-solutions.py: found no components with stats for '
+                 'more than one solution')
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    if args.format == 'markdown':
+        write_markdown(tables, out)
+    else:
+        write_csv(tables, out)
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# Find performance regressions of 3c between workflow runs (e.g., on different
+# checkedc-clang commits) from their stats artifacts, and keep a compact
+# history of those artifacts, which GitHub deletes after a few days.
+#
+# usage:
+#   detect-perf-regressions.py [--db FILE] record --label LABEL ARTIFACTS_DIR...
+#   detect-perf-regressions.py [--db FILE] compare [--last N] RUN...
+#   detect-perf-regressions.py [--db FILE] list
+#
+# `record` stores the values of the metrics in the artifacts (laid out as for
+# aggregate-timing-stats.py, including the step stats of measure-step.py) in a
+# SQLite database under LABEL, typically the checkedc-clang commit ID.
+#
+# `compare` compares the last RUN (the candidate) with the earlier ones (the
+# baseline). Each RUN is a label in the database or an artifacts directory.
+# With --last N, the N runs recorded most recently before the candidate are
+# added to the baseline. For each component, subvariant and metric (by
+# default, the times and memory sizes, for all of which more is worse):
+#
+# - If the candidate and the baseline both have at least 3 values (i.e., the
+#   runs repeat each conversion, as the timing workflow does), we use a
+#   one-sided Mann-Whitney U test of the candidate's values against the
+#   baseline's.
+#
+# - Otherwise, if there are at least 3 baseline runs, we compare the
+#   candidate's median with the medians of the baseline runs using a robust
+#   z-score (based on their median and MAD), which catches a change point at
+#   the candidate in a series of single-iteration runs.
+#
+# Each run is recorded with the build profiles of 3c it comes from (see
+# perfstats.build_profile), and runs with different ones are never compared:
+# an explicit baseline run with others is an error, and --last only picks runs
+# with the candidate's.
+#
+# A metric is reported if the test's p-value is below --alpha and its median
+# grew by at least --min-change relative to the baseline. The report is ranked
+# by the relative growth, and we exit 1 if it isn't empty.
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import perfstats
+
+DEFAULT_DB = 'perf-history.sqlite'
+DEFAULT_METRIC_RE = r'(?i)(time|seconds|rss|mem)'
+
+# Scale factor that makes the MAD a consistent estimator of the standard
+# deviation for normally distributed data.
+MAD_TO_STDDEV = 1.4826
+
+# Below this many values, neither test says much.
+MIN_SAMPLES = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE,
+    recorded REAL NOT NULL,
+    build_profile TEXT NOT NULL DEFAULT {default_build_profile!r}
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    component TEXT NOT NULL,
+    subvariant TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    median REAL NOT NULL,
+    mad REAL NOT NULL,
+    -- JSON list of the values, in the order of the iterations.
+    metric_values TEXT NOT NULL,
+    PRIMARY KEY (run_id, component, subvariant, metric)
+);
+'''.format(default_build_profile=perfstats.DEFAULT_BUILD_PROFILE)
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    # Databases from before we recorded the build profile.
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(runs)')]
+    if 'build_profile' not in columns:
+        with conn:
+            conn.execute('ALTER TABLE runs ADD COLUMN build_profile TEXT NOT '
+                         f"NULL DEFAULT '{perfstats.DEFAULT_BUILD_PROFILE}'")
+    return conn
+
+
+def record_run(conn: sqlite3.Connection, label: str, build_profile: str,
+               groups: perfstats.Groups):
+    with conn:
+        row = conn.execute('SELECT id FROM runs WHERE label = ?',
+                           (label,)).fetchone()
+        if row is not None:
+            # Re-recording a run replaces it.
+            conn.execute('DELETE FROM metrics WHERE run_id = ?', row)
+            conn.execute('DELETE FROM runs WHERE id = ?', row)
+        run_id = conn.execute(
+            'INSERT INTO runs (label, recorded, build_profile) '
+            'VALUES (?, ?, ?)', (label, time.time(), build_profile)).lastrowid
+        conn.executemany(
+            'INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ((run_id, component, subvariant, metric, len(values),
+              perfstats.median(sorted(values)),
+              perfstats.median_abs_deviation(sorted(values)),
+              json.dumps(values))
+             for (component, subvariant), metrics in groups.items()
+             for metric, values in metrics.items()))
+
+
+def load_recorded_run(conn: sqlite3.Connection, label: str,
+                      metric_re: 're.Pattern'
+                     ) -> Tuple[perfstats.Groups, str]:
+    """The metrics of the run `label` and its build profile."""
+    row = conn.execute('SELECT id, build_profile FROM runs WHERE label = ?',
+                       (label,)).fetchone()
+    if row is None:
+        sys.exit(f'detect-perf-regressions.py: {label} is neither a directory '
+                 'nor a recorded run')
+    run_id, build_profile = row
+    groups: perfstats.Groups = {}
+    for component, subvariant, metric, values in conn.execute(
+            'SELECT component, subvariant, metric, metric_values '
+            'FROM metrics WHERE run_id = ?', (run_id,)):
+        if metric_re.search(metric):
+            groups.setdefault((component, subvariant),
+                              {})[metric] = json.loads(values)
+    return groups, build_profile
+
+
+def recorded_labels(conn: sqlite3.Connection,
+                    build_profile: Optional[str] = None) -> List[str]:
+    """The labels of the recorded runs (of `build_profile`, if given), oldest
+    first."""
+    if build_profile is None:
+        return [label for (label,) in conn.execute('SELECT label FROM runs '
+                                                   'ORDER BY id')]
+    return [
+        label for (label,) in conn.execute(
+            'SELECT label FROM runs WHERE build_profile = ? ORDER BY id',
+            (build_profile,))
+    ]
+
+
+def change_p_value(candidate: List[float],
+                   baseline_runs: List[List[float]]) -> Optional[float]:
+    """The p-value of the hypothesis that `candidate` is larger than the
+    baseline, or None if there isn't enough data to tell."""
+    pooled = [v for values in baseline_runs for v in values]
+    if len(candidate) >= MIN_SAMPLES and len(pooled) >= MIN_SAMPLES:
+        return perfstats.mann_whitney_greater(candidate, pooled)
+    if len(baseline_runs) < MIN_SAMPLES:
+        return None
+    run_medians = sorted(perfstats.median(sorted(v)) for v in baseline_runs)
+    center = perfstats.median(run_medians)
+    spread = MAD_TO_STDDEV * perfstats.median_abs_deviation(run_medians)
+    candidate_median = perfstats.median(sorted(candidate))
+    if spread == 0:
+        return 0.0 if candidate_median > center else 1.0
+    return perfstats.normal_sf((candidate_median - center) / spread)
+
+
+def find_regressions(candidate: perfstats.Groups,
+                     baselines: List[perfstats.Groups], alpha: float,
+                     min_change: float) -> List[Dict]:
+    regressions = []
+    for key, metrics in candidate.items():
+        for metric, values in metrics.items():
+            baseline_runs = [
+                b[key][metric]
+                for b in baselines
+                if metric in b.get(key, {})
+            ]
+            if not baseline_runs:
+                continue
+            baseline_median = perfstats.median(
+                sorted(v for values in baseline_runs for v in values))
+            candidate_median = perfstats.median(sorted(values))
+            if baseline_median <= 0:
+                continue
+            change = candidate_median / baseline_median - 1
+            if change < min_change:
+                continue
+            p_value = change_p_value(values, baseline_runs)
+            if p_value is None or p_value >= alpha:
+                continue
+            regressions.append({
+                'component': key[0],
+                'subvariant': key[1],
+                'metric': metric,
+                'baseline': baseline_median,
+                'candidate': candidate_median,
+                'change': change,
+                'p_value': p_value,
+            })
+    regressions.sort(key=lambda r: -r['change'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Detect performance regressions between workflow runs.')
+    parser.add_argument('--db',
+                        default=DEFAULT_DB,
+                        help=f'SQLite history database (default: {DEFAULT_DB}).')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of processes reading artifacts.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser(
+        'record', help='Store the metrics of a run in the database.')
+    record_parser.add_argument('--label', required=True)
+    record_parser.add_argument('--metric',
+                               default='',
+                               help='Regular expression selecting the '
+                               'metrics to store (default: all).')
+    record_parser.add_argument('artifact_dirs',
+                               nargs='+',
+                               metavar='ARTIFACTS_DIR')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compare the last run with the earlier ones.')
+    compare_parser.add_argument('runs', nargs='+', metavar='RUN')
+    compare_parser.add_argument('--last',
+                                type=int,
+                                default=0,
+                                help='Add the N runs recorded most recently '
+                                'before the candidate to the baseline.')
+    compare_parser.add_argument('--metric',
+                                default=DEFAULT_METRIC_RE,
+                                help='Regular expression selecting the '
+                                'metrics to compare (default: '
+                                f'{DEFAULT_METRIC_RE!r}).')
+    compare_parser.add_argument('--alpha', type=float, default=0.01)
+    compare_parser.add_argument('--min-change',
+                                type=float,
+                                default=0.05,
+                                help='Smallest relative growth to report '
+                                '(default: 0.05).')
+    compare_parser.add_argument('--json',
+                                help='Also write the report to this file.')
+
+    subparsers.add_parser('list', help='List the recorded runs.')
+    args = parser.parse_args()
+
+    conn = open_db(args.db)
+    if args.command == 'record':
+        artifacts = perfstats.find_artifacts(args.artifact_dirs)
+        if not artifacts:
+            sys.exit('detect-perf-regressions.py: no stats artifacts found')
+        try:
+            build_profile = perfstats.build_profile(artifacts)
+        except ValueError as e:
+            sys.exit(f'detect-perf-regressions.py: error: {e}')
+        groups = perfstats.load_groups(artifacts, args.metric, args.jobs)
+        record_run(conn, args.label, build_profile, groups)
+        print(f'Recorded {sum(len(m) for m in groups.values())} metrics of '
+              f'{len(groups)} conversions as {args.label} (build profile '
+              f'{build_profile})')
+        return
+    if args.command == 'list':
+        for label, recorded, build_profile, count in conn.execute(
+                'SELECT label, recorded, build_profile, COUNT(*) FROM runs '
+                'JOIN metrics ON metrics.run_id = runs.id '
+                'GROUP BY runs.id ORDER BY runs.id'):
+            print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(recorded))}'
+                  f'  {count:6} metrics  {build_profile:10}  {label}')
+        return
+
+    if len(args.runs) < 2 and args.last == 0:
+        parser.error('compare needs a baseline: give two or more runs or '
+                     '--last')
+    metric_re = re.compile(args.metric)
+
+    def load(run: str) -> Tuple[perfstats.Groups, str]:
+        if os.path.isdir(run):
+            artifacts = perfstats.find_artifacts([run])
+            try:
+                build_profile = perfstats.build_profile(artifacts)
+            except ValueError as e:
+                sys.exit(f'detect-perf-regressions.py: error: {run}: {e}')
+            return (perfstats.load_groups(artifacts, args.metric, args.jobs),
+                    build_profile)
+        return load_recorded_run(conn, run, metric_re)
+
+    candidate_run = args.runs[-1]
+    candidate, build_profile = load(candidate_run)
+    baseline_runs = args.runs[:-1]
+    if args.last:
+        labels = recorded_labels(conn)
+        if candidate_run in labels:
+            labels = labels[:labels.index(candidate_run)]
+        same_profile = set(recorded_labels(conn, build_profile))
+        labels = [label for label in labels if label in same_profile]
+        baseline_runs = labels[-args.last:] + baseline_runs
+    baselines = []
+    for run in baseline_runs:
+        groups, run_profile = load(run)
+        if run_profile != build_profile:
+            sys.exit(f'detect-perf-regressions.py: error: {run} comes from '
+                     f'build profile {run_profile}, but {candidate_run} from '
+                     f'{build_profile}; their stats are not comparable')
+        baselines.append(groups)
+    regressions = find_regressions(candidate, baselines, args.alpha,
+                                   args.min_change)
+
+    print(f'{len(regressions)} regressions of {candidate_run} against '
+          f'{len(baseline_runs)} baseline runs')
+    if regressions:
+        print(f'{"change":>8}  {"p-value":>8}  {"baseline":>10}  '
+              f'{"candidate":>10}  metric')
+    for r in regressions:
+        print(f'{r["change"]:+8.1%}  {r["p_value"]:8.2g}  {r["baseline"]:10.4g}'
+              f'  {r["candidate"]:10.4g}  {r["component"]} ({r["subvariant"]}) '
+              f'{r["metric"]}')
+    if args.json is not None:
+        with open(args.json, 'w') as out:
+            json.dump(regressions, out, indent=1)
+            out.write('\n')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,38 +2,590 @@
 # Filter the output of a build command for errors that should be ignored as
 # likely reflecting known limitations of 3C bounds inference.
 #
-# usage: BUILD_COMMAND 2>&1 | filter-bounds-inference-errors.py
+# usage: BUILD_COMMAND 2>&1 | filter-bounds-inference-errors.py [--summary]
+#        filter-bounds-inference-errors.py [options] LOG_FILE_OR_DIR...
 #
 # Exits 1 if the input contains errors that should not be ignored. For this to
 # be useful, the original pipeline should be run with `pipefail` off.
+#
+# The second form (batch mode) re-filters saved logs, such as the build logs
+# of the exhaustive workflows. Large files are split into line-aligned chunks
+# that are filtered in parallel by a pool of processes. The filtered text is
+# written to stderr (or to --output-dir) in file order, and a summary line with
+# the same counts as `--summary` in the first form is printed to stdout for
+# each file. The exit status is 1 if any file contains unfiltered errors.
+#
+# The errors to filter are listed in bounds-inference-filter-rules.ini; see the
+# comments there.
+#
+# With --stats-json, we also tally the errors by source file and by message
+# (with a few example lines each) as we go and write the tallies to a JSON
+# file at the end, so nobody has to grep the logs again for the counts.
 
 # This could likely be implemented as a shell script using `sed`, etc., but it
 # looked like it might become messy. Once I took the plunge to Python, I didn't
 # regret it: I find the Python much clearer. ~ Matt
 
+import argparse
+import configparser
+from dataclasses import dataclass, field
+import fnmatch
+import io
+import json
+import multiprocessing
+import os
 import re
+import select
 import sys
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 ERROR_LINE_RE = re.compile(r'^(.*): error: (.*)$')
-# We'll add to this list as we confirm that more errors belong on it.
-FILTER_RE = re.compile(r'^expression has unknown bounds$')
-
-saw_unfiltered_error = False
-# This gives the same result as `sys.stdin.readlines()` (which I normally find
-# more explicit) but processes lines as they are received, which is nice for
-# long-running builds.
-for line in sys.stdin:
-    line = line.rstrip('\n')
-    match = ERROR_LINE_RE.search(line)
-    if match is not None:
-        is_filtered = (FILTER_RE.search(match[2]) is not None)
+
+# The list of errors to filter lives in this file next to the script.
+DEFAULT_RULES_FILENAME = 'bounds-inference-filter-rules.ini'
+
+# We read and write bytes and only decode error lines, using this error handler
+# so that any non-UTF-8 garbage in a log passes through unchanged.
+ENCODING = 'utf-8'
+ENCODING_ERRORS = 'surrogateescape'
+
+READ_SIZE = 1 << 16
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+class FilterRuleError(Exception):
+    pass
+
+
+@dataclass
+class FilterRule:
+    name: str
+    # Exactly one of `message` and `regex` is set.
+    message: Optional[str] = None
+    regex: Optional[str] = None
+    # None: All benchmarks.
+    benchmarks: Optional[List[str]] = None
+
+
+def load_rules(path: str) -> List[FilterRule]:
+    # Patterns may well contain `%`, so turn off interpolation.
+    parser = configparser.ConfigParser(interpolation=None)
+    with open(path) as rules_file:
+        parser.read_file(rules_file)
+    rules = []
+    for name in parser.sections():
+        section = parser[name]
+        unknown_keys = set(section) - {'message', 'regex', 'benchmarks'}
+        if unknown_keys:
+            raise FilterRuleError(f'{path}: rule {name}: unknown keys: ' +
+                                  ', '.join(sorted(unknown_keys)))
+        if ('message' in section) == ('regex' in section):
+            raise FilterRuleError(
+                f'{path}: rule {name}: must have exactly one of '
+                '`message` and `regex`')
+        benchmarks = section.get('benchmarks')
+        rules.append(
+            FilterRule(name=name,
+                       message=section.get('message'),
+                       regex=section.get('regex'),
+                       benchmarks=(benchmarks.split()
+                                   if benchmarks is not None else None)))
+    return rules
+
+
+class FilterRuleSet:
+    """The rules that apply to one benchmark, compiled so that the cost of
+    matching a message doesn't grow with the number of rules: a hash lookup
+    for the exact-message rules and one combined regex for the rest."""
+
+    def __init__(self, rules: List[FilterRule], benchmark: Optional[str]):
+        self.rule_names = []
+        self.exact_messages: Dict[str, str] = {}
+        # Maps the name of each top-level group of `combined_re` to its rule.
+        self.group_rule_names: Dict[str, str] = {}
+        alternatives = []
+        for rule in rules:
+            if (rule.benchmarks is not None and
+                    benchmark not in rule.benchmarks):
+                continue
+            self.rule_names.append(rule.name)
+            if rule.message is not None:
+                self.exact_messages.setdefault(rule.message, rule.name)
+                continue
+            group = f'rule{len(alternatives)}'
+            alternative = f'(?P<{group}>{rule.regex})'
+            # Check the regex as it will appear in the combined one, which
+            # rejects global inline flags like `(?i)`.
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                raise FilterRuleError(
+                    f'rule {rule.name}: invalid regex (note that global '
+                    f'inline flags are not allowed): {e}') from None
+            self.group_rule_names[group] = rule.name
+            alternatives.append(alternative)
+        try:
+            self.combined_re = (re.compile('|'.join(alternatives))
+                                if alternatives else None)
+        except re.error as e:
+            raise FilterRuleError(
+                'the regex rules cannot be combined (do two of them use the '
+                f'same group name?): {e}') from None
+
+    def match(self, message: str) -> Optional[str]:
+        """Return the name of the first rule that matches `message`, if
+        any."""
+        rule_name = self.exact_messages.get(message)
+        if rule_name is not None or self.combined_re is None:
+            return rule_name
+        match = self.combined_re.search(message)
+        if match is None:
+            return None
+        return self.group_rule_names[match.lastgroup]
+
+
+@dataclass
+class TableLimits:
+    # Beyond this many distinct keys, errors are tallied under OTHER_KEY so
+    # that memory use stays bounded however many distinct messages there are.
+    max_keys: int = 1000
+    max_examples: int = 3
+
+
+# The rules and table limits for this run. Set by `configure` in `main` (and,
+# in batch mode, in each worker process) before any filtering happens.
+rules: FilterRuleSet
+table_limits: TableLimits
+
+
+def configure(rule_set: FilterRuleSet, limits: TableLimits):
+    global rules, table_limits
+    rules = rule_set
+    table_limits = limits
+
+
+@dataclass
+class ErrorTally:
+    filtered: int = 0
+    unfiltered: int = 0
+    # The first few error lines (after filtering) with this key.
+    examples: List[str] = field(default_factory=list)
+
+
+class ErrorTable:
+    """Error counts by some key (source file or message), with a bounded number
+    of keys."""
+    OTHER_KEY = '<other>'
+
+    def __init__(self):
+        self.tallies: Dict[str, ErrorTally] = {}
+
+    def _tally(self, key: str) -> ErrorTally:
+        tally = self.tallies.get(key)
+        if tally is None:
+            if len(self.tallies) >= table_limits.max_keys:
+                key = self.OTHER_KEY
+                tally = self.tallies.get(key)
+            if tally is None:
+                tally = self.tallies[key] = ErrorTally()
+        return tally
+
+    def record(self, key: str, is_filtered: bool, example: str):
+        tally = self._tally(key)
         if is_filtered:
-            line = ERROR_LINE_RE.sub(r'\1: error (filtered): \2', line)
+            tally.filtered += 1
         else:
+            tally.unfiltered += 1
+        if len(tally.examples) < table_limits.max_examples:
+            tally.examples.append(example)
+
+    def add(self, other: 'ErrorTable'):
+        for key, other_tally in other.tallies.items():
+            tally = self._tally(key)
+            tally.filtered += other_tally.filtered
+            tally.unfiltered += other_tally.unfiltered
+            tally.examples.extend(
+                other_tally.examples[:table_limits.max_examples -
+                                     len(tally.examples)])
+
+    def to_json(self):
+        return {key: vars(tally) for key, tally in self.tallies.items()}
+
+
+# Strips the line and column from the location clang prints before `error:`.
+LOCATION_LINE_COLUMN_RE = re.compile(r'(:\d+){1,2}$')
+
+
+@dataclass
+class FilterCounts:
+    lines: int = 0
+    errors: int = 0
+    filtered_errors: int = 0
+    # Number of errors filtered by each rule.
+    rule_hits: Dict[str, int] = field(default_factory=dict)
+    by_source_file: ErrorTable = field(default_factory=ErrorTable)
+    by_message: ErrorTable = field(default_factory=ErrorTable)
+
+    @property
+    def unfiltered_errors(self):
+        return self.errors - self.filtered_errors
+
+    def add(self, other: 'FilterCounts'):
+        self.lines += other.lines
+        self.errors += other.errors
+        self.filtered_errors += other.filtered_errors
+        for rule_name, hits in other.rule_hits.items():
+            self.rule_hits[rule_name] = self.rule_hits.get(rule_name, 0) + hits
+        self.by_source_file.add(other.by_source_file)
+        self.by_message.add(other.by_message)
+
+    def record_error(self, location: str, message: str, is_filtered: bool,
+                     line: str):
+        self.errors += 1
+        if is_filtered:
+            self.filtered_errors += 1
+        self.by_source_file.record(LOCATION_LINE_COLUMN_RE.sub('', location),
+                                   is_filtered, line)
+        self.by_message.record(message, is_filtered, line)
+
+    def to_json(self):
+        return {
+            'lines': self.lines,
+            'errors': self.errors,
+            'filtered_errors': self.filtered_errors,
+            'unfiltered_errors': self.unfiltered_errors,
+            'by_source_file': self.by_source_file.to_json(),
+            'by_message': self.by_message.to_json(),
+        }
+
+    def summary(self, name: str):
+        return (f'{name}: {self.lines} lines, {self.errors} errors '
+                f'({self.filtered_errors} filtered, '
+                f'{self.unfiltered_errors} unfiltered)')
+
+
+# Every line ERROR_LINE_RE matches contains this, and almost all lines of a
+# build log don't, so we look for it with a plain substring search and only
+# run the regexes on the few lines that have it.
+ERROR_MARKER = b': error: '
+
+
+def filter_error_line(line: bytes, counts: FilterCounts) -> bytes:
+    match = ERROR_LINE_RE.search(line.decode(ENCODING, ENCODING_ERRORS))
+    if match is None:
+        return line
+    rule_name = rules.match(match[2])
+    if rule_name is None:
+        counts.record_error(match[1], match[2], False, match[0])
+        return line
+    counts.rule_hits[rule_name] = counts.rule_hits.get(rule_name, 0) + 1
+    filtered_line = f'{match[1]}: error (filtered): {match[2]}'
+    counts.record_error(match[1], match[2], True, filtered_line)
+    return filtered_line.encode(ENCODING, ENCODING_ERRORS)
+
+
+def filter_block(block: bytes, counts: FilterCounts) -> bytes:
+    """Filter `block`, which must consist of whole lines (i.e., be empty or end
+    with a newline)."""
+    counts.lines += block.count(b'\n')
+    pos = block.find(ERROR_MARKER)
+    if pos < 0:
+        return block
+    pieces = []
+    copied_up_to = 0
+    while pos >= 0:
+        line_start = block.rfind(b'\n', 0, pos) + 1
+        line_end = block.find(b'\n', pos)
+        pieces.append(block[copied_up_to:line_start])
+        pieces.append(filter_error_line(block[line_start:line_end], counts))
+        copied_up_to = line_end
+        pos = block.find(ERROR_MARKER, line_end)
+    pieces.append(block[copied_up_to:])
+    return b''.join(pieces)
+
+
+class StreamFilter:
+    """Filters a byte stream that arrives in arbitrary pieces, holding back any
+    partial line at the end of a piece until the rest of it arrives."""
+
+    def __init__(self, counts: FilterCounts):
+        self.counts = counts
+        self.partial_line = b''
+        self.output: List[bytes] = []
+        self.output_size = 0
+
+    def feed(self, data: bytes):
+        last_newline = data.rfind(b'\n')
+        if last_newline < 0:
+            self.partial_line += data
+            return
+        block = self.partial_line + data[:last_newline + 1]
+        self.partial_line = data[last_newline + 1:]
+        self._add_output(filter_block(block, self.counts))
+
+    def finish(self):
+        # Like `for line in sys.stdin`, treat a final line without a newline as
+        # a line and add the newline.
+        if self.partial_line != b'':
+            self._add_output(filter_block(self.partial_line + b'\n',
+                                          self.counts))
+            self.partial_line = b''
+
+    def _add_output(self, data: bytes):
+        self.output.append(data)
+        self.output_size += len(data)
+
+    def take_output(self) -> bytes:
+        data = b''.join(self.output)
+        self.output = []
+        self.output_size = 0
+        return data
+
+
+def input_is_pending(fd: int) -> bool:
+    return bool(select.select([fd], [], [], 0)[0])
+
+
+def filter_stream(counts: FilterCounts, flush_interval: float):
+    # We read whatever is available rather than iterating over `sys.stdin` by
+    # line, so that when the input arrives faster than we can write it (e.g.,
+    # re-filtering a saved log), we filter and write it in large blocks. We
+    # still process lines as they are received, which is nice for long-running
+    # builds: whenever we've caught up with the input, we write everything
+    # we have, and while we're behind, we still write at least every
+    # `flush_interval` seconds. Output is always written in whole lines.
+    #
+    # It probably makes more sense to write what was originally stderr output
+    # to stderr rather than make all callers redirect it, even if unix
+    # convention would normally be that the main data we process should go to
+    # stdout.
+    fd = sys.stdin.fileno()
+    out = sys.stderr.buffer
+    engine = StreamFilter(counts)
+    last_flush = time.monotonic()
+    while True:
+        data = os.read(fd, READ_SIZE)
+        if data == b'':
+            break
+        engine.feed(data)
+        now = time.monotonic()
+        if (engine.output_size >= OUTPUT_BUFFER_SIZE or
+                now - last_flush >= flush_interval or
+                not input_is_pending(fd)):
+            out.write(engine.take_output())
+            out.flush()
+            last_flush = now
+    engine.finish()
+    out.write(engine.take_output())
+    out.flush()
+
+
+# A chunk of a log file: (path, start offset, end offset). Chunk boundaries
+# are always just after a newline (or at the start or end of the file).
+Chunk = Tuple[str, int, int]
+
+
+def find_log_files(paths: List[str], pattern: str) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            # Sort so that the output order is reproducible.
+            dirnames.sort()
+            for fname in sorted(filenames):
+                if fnmatch.fnmatch(fname, pattern):
+                    yield os.path.join(dirpath, fname)
+
+
+def split_into_chunks(path: str, chunk_size: int) -> List[Chunk]:
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as log_file:
+        while boundaries[-1] + chunk_size < size:
+            log_file.seek(boundaries[-1] + chunk_size)
+            log_file.readline()
+            boundaries.append(log_file.tell())
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return [(path, start, end)
+            for start, end in zip(boundaries, boundaries[1:])] or [(path, 0, 0)]
+
+
+def filter_chunk(chunk: Chunk) -> Tuple[bytes, FilterCounts]:
+    path, start, end = chunk
+    with open(path, 'rb') as log_file:
+        log_file.seek(start)
+        data = log_file.read(end - start)
+    counts = FilterCounts()
+    if data != b'' and not data.endswith(b'\n'):
+        # Like the streaming mode, we add a newline to a final line that
+        # doesn't have one.
+        data += b'\n'
+    return filter_block(data, counts), counts
+
+
+def open_output(output_dir: str, path: str) -> BinaryIO:
+    out_path = os.path.join(output_dir, path.lstrip(os.sep))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    return open(out_path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+
+
+def filter_files(args, total_counts: FilterCounts) -> bool:
+    chunks: List[Chunk] = []
+    for path in find_log_files(args.paths, args.pattern):
+        chunks.extend(split_into_chunks(path, args.chunk_size))
+
+    saw_unfiltered_error = False
+    stderr_out = io.BufferedWriter(sys.stderr.buffer,
+                                   buffer_size=OUTPUT_BUFFER_SIZE)
+    out = stderr_out
+    current_path = None
+    counts = FilterCounts()
+
+    def finish_file():
+        nonlocal saw_unfiltered_error
+        if out is not stderr_out:
+            out.close()
+        print(counts.summary(current_path), flush=True)
+        total_counts.add(counts)
+        if counts.unfiltered_errors != 0:
             saw_unfiltered_error = True
-    # It probably makes more sense to write what was originally stderr output to
-    # stderr rather than make all callers redirect it, even if unix convention
-    # would normally be that the main data we process should go to stdout.
-    sys.stderr.write(line + '\n')
 
-sys.exit(1 if saw_unfiltered_error else 0)
+    with multiprocessing.Pool(args.jobs, configure,
+                              (rules, table_limits)) as pool:
+        # `imap` returns the results in order, so each file's output comes out
+        # contiguously even though its chunks are filtered in parallel.
+        for (path, _, _), (data, chunk_counts) in zip(
+                chunks, pool.imap(filter_chunk, chunks)):
+            if path != current_path:
+                if current_path is not None:
+                    finish_file()
+                current_path = path
+                counts = FilterCounts()
+                if args.output_dir is not None and not args.summary_only:
+                    out = open_output(args.output_dir, path)
+            if not args.summary_only:
+                out.write(data)
+            counts.add(chunk_counts)
+    if current_path is not None:
+        finish_file()
+    stderr_out.flush()
+    return saw_unfiltered_error
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mark 3C bounds inference errors that are known to be '
+        'spurious in a build log.')
+    parser.add_argument(
+        'paths',
+        nargs='*',
+        help='Log files or directories to filter (default: filter stdin).')
+    parser.add_argument('--summary',
+                        action='store_true',
+                        help='When filtering stdin, print a summary of the '
+                        'error counts to stdout at the end.')
+    parser.add_argument(
+        '--flush-interval',
+        type=float,
+        default=0.5,
+        help='When filtering stdin, the maximum time in seconds to hold '
+        'filtered output before writing it while more input is arriving.')
+    parser.add_argument(
+        '--rules',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             DEFAULT_RULES_FILENAME),
+        help=f'Rule file (default: {DEFAULT_RULES_FILENAME} next to this '
+        'script).')
+    parser.add_argument(
+        '--benchmark',
+        help='Name of the benchmark whose build is being filtered, for rules '
+        'that only apply to some benchmarks.')
+    parser.add_argument(
+        '--rule-stats',
+        help='Write the number of errors each rule filtered to this JSON file.')
+    parser.add_argument(
+        '--stats-json',
+        help='Write counts of filtered and unfiltered errors by source file '
+        'and by message, with examples, to this JSON file.')
+    parser.add_argument('--stats-examples',
+                        type=int,
+                        default=TableLimits.max_examples,
+                        help='Number of example lines to keep for each source '
+                        'file and message in the --stats-json output.')
+    parser.add_argument(
+        '--stats-max-keys',
+        type=int,
+        default=TableLimits.max_keys,
+        help='Maximum number of distinct source files (and, separately, '
+        'messages) in the --stats-json output; the rest are counted under '
+        f'"{ErrorTable.OTHER_KEY}".')
+    batch_group = parser.add_argument_group('batch mode options')
+    batch_group.add_argument(
+        '--pattern',
+        default='*',
+        help='Only filter files in directories whose names match this glob.')
+    batch_group.add_argument('-j',
+                             '--jobs',
+                             type=int,
+                             default=os.cpu_count(),
+                             help='Number of worker processes.')
+    batch_group.add_argument('--chunk-size',
+                             type=int,
+                             default=8 << 20,
+                             help='Approximate chunk size in bytes.')
+    batch_group.add_argument(
+        '--output-dir',
+        help='Write the filtered text of each file to its path under this '
+        'directory instead of to stderr.')
+    batch_group.add_argument('--summary-only',
+                             action='store_true',
+                             help="Don't write the filtered text at all.")
+    args = parser.parse_args()
+
+    try:
+        configure(FilterRuleSet(load_rules(args.rules), args.benchmark),
+                  TableLimits(args.stats_max_keys, args.stats_examples))
+    except (OSError, configparser.Error, FilterRuleError) as e:
+        sys.exit(f'filter-bounds-inference-errors.py: {e}')
+
+    counts = FilterCounts()
+    if args.paths:
+        saw_unfiltered_error = filter_files(args, counts)
+    else:
+        filter_stream(counts, args.flush_interval)
+        if args.summary:
+            print(counts.summary('<stdin>'))
+        saw_unfiltered_error = (counts.unfiltered_errors != 0)
+
+    if args.stats_json is not None:
+        with open(args.stats_json, 'w') as stats_file:
+            # Compact, since the tables can get large.
+            stats = {'benchmark': args.benchmark, **counts.to_json()}
+            json.dump(stats, stats_file, separators=(',', ':'))
+            stats_file.write('\n')
+
+    if args.rule_stats is not None:
+        with open(args.rule_stats, 'w') as rule_stats_file:
+            json.dump(
+                {
+                    'benchmark': args.benchmark,
+                    'filtered_errors': counts.filtered_errors,
+                    # Include the rules that never fired: they're the ones
+                    # we're looking for.
+                    'rule_hits': {
+                        rule_name: counts.rule_hits.get(rule_name, 0)
+                        for rule_name in rules.rule_names
+                    },
+                },
+                rule_stats_file,
+                indent=2)
+            rule_stats_file.write('\n')
+
+    sys.exit(1 if saw_unfiltered_error else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# Run a command and append a record of its resource use to an NDJSON file, so
+# that we can see how the time and memory of a benchmark job break down by
+# step. workflowgen.py wraps steps with this when WorkflowConfig.measure_steps
+# is set.
+#
+# usage: measure-step.py --output FILE --step NAME -- COMMAND [ARG]...
+#
+# Each record has the step name, the start time, the wall-clock time, the user
+# and system CPU time of the command and all its descendants, the peak RSS of
+# the largest of those processes (in KiB), and the exit status. We exit with
+# the command's exit status (128 + N if it was killed by signal N, like bash),
+# so wrapping a step doesn't change whether it fails. The record also has the
+# build profile of 3c from the workflow's `build_profile` variable, if set, so
+# that records of different profiles aren't compared (see perfstats.py).
+
+import argparse
+import json
+import os
+import sys
+
+import perfstats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a command and record its resource use.")
+    parser.add_argument('--output',
+                        required=True,
+                        help='NDJSON file to append the record to.')
+    parser.add_argument('--step', required=True, help='Name of the step.')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        parser.error('no command given')
+
+    record = {'step': args.step, **perfstats.measure_command(command)}
+    if 'build_profile' in os.environ:
+        record['build_profile'] = os.environ['build_profile']
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'a') as out:
+        out.write(json.dumps(record) + '\n')
+    sys.exit(record['exit_status'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# Merge the compilation databases that `bear` wrote for the components of a
+# benchmark, each built separately (see BenchmarkComponent.build_cmd in
+# workflowgen.py), into one for the whole benchmark.
+#
+# usage: merge-compile-commands.py --output FILE COMPILE_COMMANDS...
+#
+# Relative `directory` fields are made absolute, relative to the database they
+# came from, so that the merged database can live elsewhere. An entry that
+# appears in several databases is kept once.
+
+import argparse
+import json
+import os
+from typing import Tuple
+
+
+def entry_key(entry: dict) -> Tuple:
+    return (entry['directory'], entry['file'], entry.get('output'),
+            tuple(entry['arguments']) if 'arguments' in entry else
+            entry.get('command'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge compilation databases.')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('databases', nargs='+', metavar='COMPILE_COMMANDS')
+    args = parser.parse_args()
+
+    merged = []
+    seen = set()
+    for path in args.databases:
+        with open(path) as db_file:
+            entries = json.load(db_file)
+        db_dir = os.path.dirname(os.path.abspath(path))
+        for entry in entries:
+            entry['directory'] = os.path.normpath(
+                os.path.join(db_dir, entry['directory']))
+            key = entry_key(entry)
+            if key not in seen:
+                seen.add(key)
+                merged.append(entry)
+
+    with open(args.output, 'w') as out:
+        json.dump(merged, out, indent=2)
+        out.write('\n')
+    print(f'Merged {len(merged)} entries from {len(args.databases)} '
+          'compilation databases')
+
+
+if __name__ == '__main__':
+    main()
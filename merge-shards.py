@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Merge the 3c output directories of the shards of a benchmark (see
+# BenchmarkInfo.shards in workflowgen.py) into one, as if a single 3c
+# run had converted the whole benchmark.
+#
+# usage: merge-shards.py --output DIR SHARD_OUTPUT_DIR...
+#
+# 3c writes only the files it changes, so a file normally comes from a single
+# shard. A file that several shards changed (typically a shared header) is
+# fine if they all changed it the same way. Otherwise, the shards' conversions
+# depend on each other and can't be merged: we list the conflicting files and
+# exit 1, and the benchmark needs different shards (or none).
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+from typing import Dict, List
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge the 3c output of a benchmark's shards.")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('shard_dirs', nargs='+', metavar='SHARD_OUTPUT_DIR')
+    args = parser.parse_args()
+
+    # Relative path -> shard output directory it was taken from
+    sources: Dict[str, str] = {}
+    conflicts: Dict[str, List[str]] = {}
+    for shard_dir in args.shard_dirs:
+        if not os.path.isdir(shard_dir):
+            print(f'{shard_dir} does not exist; assuming 3c changed nothing '
+                  'in that shard')
+            continue
+        for dirpath, _, filenames in os.walk(shard_dir):
+            for fname in filenames:
+                src = os.path.join(dirpath, fname)
+                rel = os.path.relpath(src, shard_dir)
+                dest = os.path.join(args.output, rel)
+                if rel not in sources:
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    shutil.copy2(src, dest)
+                    sources[rel] = shard_dir
+                elif not filecmp.cmp(src, dest, shallow=False):
+                    conflicts.setdefault(rel, [sources[rel]]).append(shard_dir)
+
+    if conflicts:
+        print('merge-shards.py: error: the shards converted these files '
+              'differently, so the conversion of this benchmark cannot be '
+              'split into these shards:',
+              file=sys.stderr)
+        for rel, shard_dirs in sorted(conflicts.items()):
+            print(f'  {rel} ({", ".join(shard_dirs)})', file=sys.stderr)
+        sys.exit(1)
+    print(f'Merged {len(sources)} files from {len(args.shard_dirs)} shards')
+
+
+if __name__ == '__main__':
+    main()
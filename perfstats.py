@@ -0,0 +1,359 @@
+# Helpers shared by the tools that analyze the stats artifacts uploaded by the
+# generated workflows (see workflowgen.py): parsing artifact names,
+# flattening the JSON files that 3c writes and the records of measure-step.py
+# into named metrics, robust summary statistics and significance tests. The
+# scripts that write those records (measure-step.py and time-conversion.py)
+# share the measurement here too.
+#
+# This is a module rather than a script so that the tools can import it, which
+# is why its name has no hyphens.
+
+from dataclasses import dataclass
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# The stats artifact of one conversion is named
+# `<component>_<subvariant>[_<iteration>]` (see generate_benchmark_steps in
+# workflowgen.py).
+# Subvariant names consist of lowercase words joined by underscores, starting
+# with the expand_macros flag.
+ARTIFACT_NAME_RE = re.compile(r'(?P<component>.+?)_'
+                              r'(?P<subvariant>(?:no_)?expand_macros_[a-z_]+?)'
+                              r'(?:_(?P<iteration>\d+))?')
+# The records of measure-step.py for a whole job are uploaded as
+# `<benchmark>_<subvariant>_step_stats`.
+STEP_STATS_SUFFIX = '_step_stats'
+# Other artifacts of the same jobs, which would otherwise parse as stats
+# artifacts of a subvariant with this suffix.
+OTHER_ARTIFACT_SUFFIXES = ('_bounds_inference_errors', '_component_logs',
+                           '_benchmark_logs')
+
+# Each stats artifact records the build profile of 3c (see BuildProfile in
+# workflowgen.py) in this file, and each record of measure-step.py has it as
+# `build_profile`. Stats of different profiles mustn't be compared.
+BUILD_PROFILE_FNAME = 'build_profile.json'
+# The profile of artifacts from before we recorded it.
+DEFAULT_BUILD_PROFILE = 'debug'
+
+STATS_KIND = 'stats'
+STEP_STATS_KIND = 'step_stats'
+# The fields of the measure-step.py records that are metrics.
+STEP_STATS_FIELDS = ('wall_seconds', 'user_seconds', 'sys_seconds',
+                     'max_rss_kib')
+
+
+def measure_command(command: List[str]) -> Dict:
+    """Run `command` and return the fields of its step stats record: the
+    start time, the wall-clock time, the user and system CPU time of the
+    command and all its descendants, the peak RSS of the largest of those
+    processes (in KiB), and the exit status (128 + N if it was killed by
+    signal N, like bash)."""
+    start = time.time()
+    start_monotonic = time.monotonic()
+    proc = subprocess.Popen(command)
+    _, wait_status, rusage = os.wait4(proc.pid, 0)
+    wall_seconds = time.monotonic() - start_monotonic
+    if os.WIFSIGNALED(wait_status):
+        exit_status = 128 + os.WTERMSIG(wait_status)
+    else:
+        exit_status = os.WEXITSTATUS(wait_status)
+    return {
+        'start': start,
+        'wall_seconds': wall_seconds,
+        'user_seconds': rusage.ru_utime,
+        'sys_seconds': rusage.ru_stime,
+        'max_rss_kib': rusage.ru_maxrss,
+        'exit_status': exit_status,
+    }
+
+
+@dataclass(frozen=True)
+class ArtifactName:
+    # The benchmark, for step stats.
+    component: str
+    subvariant: str
+    # None if the workflow ran each conversion once.
+    iteration: Optional[int]
+    kind: str = STATS_KIND
+
+
+def parse_artifact_name(name: str) -> Optional[ArtifactName]:
+    if name.endswith(OTHER_ARTIFACT_SUFFIXES):
+        return None
+    kind = STATS_KIND
+    if name.endswith(STEP_STATS_SUFFIX):
+        name = name[:-len(STEP_STATS_SUFFIX)]
+        kind = STEP_STATS_KIND
+    match = ARTIFACT_NAME_RE.fullmatch(name)
+    if match is None:
+        return None
+    iteration = match['iteration']
+    return ArtifactName(match['component'], match['subvariant'],
+                        int(iteration) if iteration is not None else None,
+                        kind)
+
+
+def find_artifacts(roots: List[str]) -> List[Tuple[ArtifactName, str]]:
+    """Find the stats artifact directories directly under each of `roots`, as
+    laid out by `gh run download` or run-workflow-locally.py."""
+    artifacts = []
+    for root in roots:
+        for entry in sorted(os.scandir(root), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            name = parse_artifact_name(entry.name)
+            if name is not None:
+                artifacts.append((name, entry.path))
+    return artifacts
+
+
+def read_build_profile(name: ArtifactName, path: str) -> str:
+    if name.kind == STEP_STATS_KIND:
+        for fname in sorted(os.listdir(path)):
+            if not fname.endswith('.ndjson'):
+                continue
+            with open(os.path.join(path, fname)) as ndjson_file:
+                for line in ndjson_file:
+                    return json.loads(line).get('build_profile',
+                                                DEFAULT_BUILD_PROFILE)
+        return DEFAULT_BUILD_PROFILE
+    try:
+        with open(os.path.join(path, BUILD_PROFILE_FNAME)) as profile_file:
+            return json.load(profile_file)['name']
+    except FileNotFoundError:
+        return DEFAULT_BUILD_PROFILE
+
+
+def build_profiles(
+    artifacts: List[Tuple[ArtifactName, str]]
+) -> Dict[Tuple[str, str], str]:
+    """The build profile of 3c of each (component, subvariant) of `artifacts`
+    (from `find_artifacts`). One run may use several, for different variants
+    (see Variant.build_profile in workflowgen.py), but raise ValueError if
+    the artifacts of one (component, subvariant) come from different ones."""
+    profiles: Dict[Tuple[str, str], str] = {}
+    for name, path in artifacts:
+        key = (name.component, name.subvariant)
+        profile = read_build_profile(name, path)
+        if profiles.setdefault(key, profile) != profile:
+            raise ValueError(f'the artifacts of {key[0]} ({key[1]}) come from '
+                             'different build profiles of 3c: '
+                             f'{profiles[key]}, {profile}')
+    return profiles
+
+
+def build_profile(artifacts: List[Tuple[ArtifactName, str]]) -> str:
+    """The build profiles of 3c that `artifacts` come from, joined by `+`:
+    runs are comparable only if this is the same."""
+    return '+'.join(sorted(set(build_profiles(artifacts).values()))
+                    ) or DEFAULT_BUILD_PROFILE
+
+
+def flatten_json(value, prefix: str) -> Iterator[Tuple[str, float]]:
+    """Yield (name, number) for each number in the nested objects of `value`,
+    naming it by its path of keys joined by dots after `prefix`. Lists (e.g.,
+    per-pointer stats) aren't metrics of the whole conversion and are
+    skipped."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten_json(item, f'{prefix}.{key}')
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, float(value)
+
+
+def load_metrics(artifact_dir: str,
+                 metric_re: Optional['re.Pattern'] = None) -> Dict[str, float]:
+    """Load the numbers in the *.json files of `artifact_dir`, named
+    `<file name without .json>.<key path>`, keeping only the names that
+    `metric_re` matches (with `search`), if given."""
+    metrics = {}
+    for fname in sorted(os.listdir(artifact_dir)):
+        if not fname.endswith('.json'):
+            continue
+        with open(os.path.join(artifact_dir, fname)) as json_file:
+            data = json.load(json_file)
+        for name, number in flatten_json(data, fname[:-len('.json')]):
+            if metric_re is None or metric_re.search(name):
+                metrics[name] = number
+    return metrics
+
+
+def load_step_stats(artifact_dir: str,
+                    metric_re: Optional['re.Pattern'] = None
+                   ) -> Dict[str, float]:
+    """Like `load_metrics`, but for the NDJSON files of measure-step.py,
+    naming the metrics `steps.<step name>.<field>`."""
+    metrics = {}
+    for fname in sorted(os.listdir(artifact_dir)):
+        if not fname.endswith('.ndjson'):
+            continue
+        with open(os.path.join(artifact_dir, fname)) as ndjson_file:
+            for line in ndjson_file:
+                record = json.loads(line)
+                for field in STEP_STATS_FIELDS:
+                    name = f'steps.{record["step"]}.{field}'
+                    if metric_re is None or metric_re.search(name):
+                        metrics[name] = float(record[field])
+    return metrics
+
+
+def load_artifact(name: ArtifactName,
+                  path: str,
+                  metric_re: Optional['re.Pattern'] = None
+                 ) -> Dict[str, float]:
+    if name.kind == STEP_STATS_KIND:
+        return load_step_stats(path, metric_re)
+    return load_metrics(path, metric_re)
+
+
+# Set in each worker process of `load_groups`.
+_worker_metric_re: Optional['re.Pattern'] = None
+
+
+def _configure_worker(pattern: str):
+    global _worker_metric_re
+    _worker_metric_re = re.compile(pattern)
+
+
+def _load_artifact_in_worker(
+        artifact: Tuple[ArtifactName, str]
+) -> Tuple[ArtifactName, Dict[str, float]]:
+    name, path = artifact
+    return name, load_artifact(name, path, _worker_metric_re)
+
+
+# Metrics by (component, subvariant) and then by name, each with its values in
+# the order of the iterations.
+Groups = Dict[Tuple[str, str], Dict[str, List[float]]]
+
+
+def load_groups(artifacts: List[Tuple[ArtifactName, str]], metric_pattern: str,
+                jobs: Optional[int]) -> Groups:
+    """Load `artifacts` (from `find_artifacts`) in `jobs` processes, keeping
+    the metrics whose names match `metric_pattern`."""
+    groups: Groups = {}
+    loaded = []
+    with multiprocessing.Pool(jobs, _configure_worker,
+                              (metric_pattern,)) as pool:
+        for name, metrics in pool.imap_unordered(_load_artifact_in_worker,
+                                                 artifacts,
+                                                 chunksize=8):
+            loaded.append((name, metrics))
+    loaded.sort(key=lambda item: item[0].iteration or 0)
+    for name, metrics in loaded:
+        group = groups.setdefault((name.component, name.subvariant), {})
+        for metric, value in metrics.items():
+            group.setdefault(metric, []).append(value)
+    return groups
+
+
+def median(sorted_values: Sequence[float]) -> float:
+    n = len(sorted_values)
+    mid = n // 2
+    if n % 2 == 1:
+        return sorted_values[mid]
+    return (sorted_values[mid - 1] + sorted_values[mid]) / 2
+
+
+def median_abs_deviation(sorted_values: Sequence[float]) -> float:
+    center = median(sorted_values)
+    return median(sorted(abs(v - center) for v in sorted_values))
+
+
+def quantile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear interpolation between the closest ranks, as numpy does by
+    default."""
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return (sorted_values[lower] +
+            (sorted_values[upper] - sorted_values[lower]) * (pos - lower))
+
+
+class MedianBootstrap:
+    """Percentile bootstrap confidence intervals for the median.
+
+    A resample of n values is determined by the indices it draws. If the values
+    are sorted and the indices of each resample are sorted too, the median of
+    the resample is at the middle index (or the average of the two middle ones),
+    so we only need to draw the indices once per n and remember the positions
+    of the medians. That makes each interval cost one pass over the resamples,
+    which matters when there are thousands of (component, metric) pairs, and
+    with a fixed seed the intervals are reproducible."""
+
+    def __init__(self, resamples: int, seed: int = 0):
+        self.resamples = resamples
+        self.seed = seed
+        self._median_positions: Dict[int, List[Tuple[int, int]]] = {}
+
+    def _positions(self, n: int) -> List[Tuple[int, int]]:
+        positions = self._median_positions.get(n)
+        if positions is None:
+            rng = random.Random(f'{self.seed}/{n}')
+            population = range(n)
+            positions = []
+            for _ in range(self.resamples):
+                indices = sorted(rng.choices(population, k=n))
+                positions.append((indices[(n - 1) // 2], indices[n // 2]))
+            self._median_positions[n] = positions
+        return positions
+
+    def interval(self, sorted_values: Sequence[float],
+                 confidence: float) -> Tuple[float, float]:
+        medians = sorted((sorted_values[a] + sorted_values[b]) / 2
+                         for a, b in self._positions(len(sorted_values)))
+        alpha = (1 - confidence) / 2
+        return quantile(medians, alpha), quantile(medians, 1 - alpha)
+
+
+def normal_sf(z: float) -> float:
+    """P(Z > z) for a standard normal Z."""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _mann_whitney_null_counts(m: int, n: int) -> List[int]:
+    # The number of arrangements of m + n distinct values giving each U is the
+    # coefficient of q^U in the Gaussian binomial coefficient
+    # [m + n choose m]_q = prod_{i=1..m} (1 - q^(n+i)) / (1 - q^i).
+    counts = [1] + [0] * (m * n)
+    for i in range(1, m + 1):
+        for k in range(m * n, n + i - 1, -1):
+            counts[k] -= counts[k - n - i]
+        for k in range(i, m * n + 1):
+            counts[k] += counts[k - i]
+    return counts
+
+
+# Above this many pairs, the normal approximation is good enough and the exact
+# distribution gets expensive.
+MANN_WHITNEY_EXACT_MAX_PAIRS = 2500
+
+
+def mann_whitney_greater(a: Sequence[float], b: Sequence[float]) -> float:
+    """One-sided p-value of the Mann-Whitney U test that values in `a` tend
+    to be greater than those in `b`. Exact without ties and for small
+    samples, otherwise with the normal approximation (with tie correction)."""
+    m, n = len(a), len(b)
+    u = sum((x > y) + 0.5 * (x == y) for x in a for y in b)
+    ties = len(set(a) | set(b)) < m + n
+    if not ties and m * n <= MANN_WHITNEY_EXACT_MAX_PAIRS:
+        counts = _mann_whitney_null_counts(m, n)
+        return sum(counts[math.ceil(u):]) / sum(counts)
+    tie_sizes: Dict[float, int] = {}
+    for value in list(a) + list(b):
+        tie_sizes[value] = tie_sizes.get(value, 0) + 1
+    total = m + n
+    variance = m * n / 12 * (total + 1 - sum(t**3 - t
+                                             for t in tie_sizes.values()) /
+                             (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    # With continuity correction.
+    return normal_sf((u - m * n / 2 - 0.5) / math.sqrt(variance))
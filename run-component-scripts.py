@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Run the scripts that build, or convert and build, the components of a
+# benchmark (see BenchmarkComponent.build_cmd and
+# WorkflowConfig.parallel_components in workflowgen.py), or that test the
+# benchmarks of a merged job (see WorkflowConfig.merged_benchmarks), in
+# parallel, each with its output in its own log file.
+#
+# usage: run-component-scripts.py --jobs N --log-dir DIR SCRIPT...
+#
+# Each SCRIPT runs under `bash -e`, with its output in DIR/<name>.log, where
+# <name> is the script's file name without `.sh`. At most N run at once, and
+# we start them in the order given. As each one finishes, we print its log in
+# a collapsible group so that the job's log stays readable.
+#
+# We wait for all the scripts even if some fail, so that the logs are
+# complete, and then exit 1 if any failed. (A conversion script fails only if
+# a conversion failed: it records a failed post-conversion build in
+# failed-components-list.txt instead, as the separate steps do, and a later
+# step reports it.)
+
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+from typing import Tuple
+
+
+def script_name(path: str) -> str:
+    name = os.path.basename(path)
+    return name[:-len('.sh')] if name.endswith('.sh') else name
+
+
+def run_script(path: str, log_path: str) -> Tuple[int, float]:
+    start = time.monotonic()
+    with open(log_path, 'w') as log:
+        status = subprocess.run(['bash', '-e', path],
+                                stdin=subprocess.DEVNULL,
+                                stdout=log,
+                                stderr=subprocess.STDOUT).returncode
+    return status, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run component scripts in parallel with separate logs.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--log-dir', required=True)
+    parser.add_argument('scripts', nargs='+', metavar='SCRIPT')
+    args = parser.parse_args()
+    names = [script_name(path) for path in args.scripts]
+    if len(set(names)) != len(names):
+        parser.error('the scripts must have distinct names')
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = {
+            executor.submit(run_script, path,
+                            os.path.join(args.log_dir, f'{name}.log')): name
+            for name, path in zip(names, args.scripts)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            status, seconds = future.result()
+            outcome = 'done' if status == 0 else f'FAILED (exit {status})'
+            if status != 0:
+                failed.append(name)
+            print(f'::group::{name}: {outcome} in {seconds:.0f}s')
+            with open(os.path.join(args.log_dir, f'{name}.log')) as log:
+                sys.stdout.write(log.read())
+            print('::endgroup::', flush=True)
+
+    if failed:
+        print('Failed scripts (see their logs above):', file=sys.stderr)
+        for name in sorted(failed, key=names.index):
+            print(f'  {name}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# Run the benchmark jobs of a workflow generated by generate-workflow.py
+# directly on this machine instead of through GitHub Actions, e.g., to try a
+# change to 3c on a few benchmarks without queueing a CI run.
+#
+# usage: run-workflow-locally.py --workspace DIR [--workflow NAME]
+#          [--benchmark NAME]... [--job REGEX]... [-j N] [--env KEY=VALUE]...
+#
+# The runner works from the same Job and Step objects (see
+# workflowgen.JobGraph) that generate-workflow.py renders to YAML, so it runs
+# exactly the commands the workflow would. It doesn't run the fixed jobs at the
+# top of the workflow (clean, build_3c and test_3c): DIR plays the part of
+# ${{github.workspace}} and must already be set up the way build_3c leaves it,
+# with the checkedc-clang repository in DIR/depsfolder/checkedc-clang and 3c
+# and clang built in DIR/b/ninja (or wherever `--env builddir=...` says).
+# DIR/depsfolder/actions is linked to this checkout if it doesn't exist.
+#
+# A job may start once the jobs it needs have succeeded, with at most -j jobs
+# running at once. Jobs are also admitted by memory: the runner records the
+# peak RSS and the running time of each job in a history file (by default
+# WORKSPACE/job-resources.json), and only starts a job if the expected peak RSS
+# of the running jobs plus the new one fits in --memory-limit. A job with no
+# history is expected to use as much as the largest job of the same benchmark,
+# or --default-memory. Among the jobs that may start, the longest ones (by the
+# history) go first, and small jobs fill in the memory that's left next to big
+# ones, so that the whole run finishes as early as possible. This is better
+# than relying on the `-l $(nproc)` of the builds to keep several big
+# conversions from exhausting memory. The peak RSS is that of the largest
+# single process of the job (usually 3c), as reported by wait4, so jobs whose
+# builds run many compilers in parallel may use somewhat more.
+#
+# Each job's steps run in order with `bash -e`, as on GitHub, and their output
+# goes to LOG_DIR/<job>.log. A job with a matrix runs once per matrix entry.
+# The `${{ ... }}` expressions and step conditions that the generator uses are
+# evaluated here, and `actions/upload-artifact` is replaced by a copy to
+# ARTIFACTS_DIR/<artifact name>.
+
+import argparse
+import concurrent.futures
+from dataclasses import dataclass
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import workflowgen
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EXPRESSION_RE = re.compile(r'\$\{\{(.*?)\}\}', re.DOTALL)
+STATUS_FUNCTION_RE = re.compile(r'\b(always|success|failure|cancelled)\(\)')
+# The `env:` entries of the workflow header.
+HEADER_ENV_RE = re.compile(r'^  (\w+): "(.*)"$', re.MULTILINE)
+
+UPLOAD_ARTIFACT_ACTION = 'actions/upload-artifact@'
+
+SIZE_SUFFIXES = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    match = re.fullmatch(r'(\d+)([KMGT]?)i?B?', size.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f'invalid size: {size!r}')
+    return int(match[1]) * SIZE_SUFFIXES[match[2]]
+
+
+def physical_memory() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+# Just enough of the GitHub Actions expression language for what the generator
+# emits: context lookups such as `env.builddir` and `matrix.alltypes`, literals,
+# `!`, `&&`, `||` and the status functions. There are no parentheses other
+# than those of the function calls.
+
+
+@dataclass
+class ExpressionContext:
+    contexts: Dict[str, Any]
+    # 'success' or 'failure', for the status functions.
+    job_status: str = 'success'
+
+
+def is_truthy(value: Any) -> bool:
+    return value not in (None, False, 0, '')
+
+
+def to_text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def evaluate(expr: str, ctx: ExpressionContext) -> Any:
+    expr = expr.strip()
+    match = re.fullmatch(r'\$\{\{(.*)\}\}', expr, re.DOTALL)
+    if match is not None:
+        expr = match[1].strip()
+    if '||' in expr:
+        for part in expr.split('||'):
+            value = evaluate(part, ctx)
+            if is_truthy(value):
+                return value
+        return value
+    if '&&' in expr:
+        for part in expr.split('&&'):
+            value = evaluate(part, ctx)
+            if not is_truthy(value):
+                return value
+        return value
+    if expr.startswith('!'):
+        return not is_truthy(evaluate(expr[1:], ctx))
+    if expr == 'always()':
+        return True
+    if expr == 'success()':
+        return ctx.job_status == 'success'
+    if expr == 'failure()':
+        return ctx.job_status == 'failure'
+    if expr == 'cancelled()':
+        return False
+    if expr in ('true', 'false'):
+        return expr == 'true'
+    if expr == 'null':
+        return None
+    if len(expr) >= 2 and expr[0] == expr[-1] == "'":
+        return expr[1:-1].replace("''", "'")
+    if re.fullmatch(r'-?\d+(\.\d+)?', expr):
+        return float(expr) if '.' in expr else int(expr)
+    value: Any = ctx.contexts
+    for key in expr.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def substitute(text: str, ctx: ExpressionContext) -> str:
+    return EXPRESSION_RE.sub(lambda m: to_text(evaluate(m[1], ctx)), text)
+
+
+def step_should_run(condition: Optional[str], ctx: ExpressionContext) -> bool:
+    # As on GitHub, a condition without a status function implicitly requires
+    # the previous steps to have succeeded.
+    if condition is None or STATUS_FUNCTION_RE.search(condition) is None:
+        if ctx.job_status != 'success':
+            return False
+        if condition is None:
+            return True
+    return is_truthy(evaluate(condition, ctx))
+
+
+@dataclass
+class JobInstance:
+    """One run of a job: the job itself or one entry of its matrix."""
+    instance_id: str
+    job: workflowgen.Job
+    matrix: Dict[str, Any]
+    benchmark: str
+
+
+def expand_matrix(job: workflowgen.Job) -> List[JobInstance]:
+    # A job for several benchmarks (see WorkflowConfig.merged_benchmarks) is
+    # estimated from its own history alone.
+    benchmark = '+'.join(job.benchmarks)
+    if job.matrix is None:
+        return [JobInstance(job.job_id, job, {}, benchmark)]
+    return [
+        JobInstance(f'{job.job_id}_{entry.get("subvariant", i)}', job, entry,
+                    benchmark) for i, entry in enumerate(job.matrix)
+    ]
+
+
+class ResourceHistory:
+    """Peak RSS (in bytes) and running time of each job in earlier runs,
+    stored as JSON."""
+
+    def __init__(self, path: str, default_max_rss: int):
+        self.path = path
+        self.default_max_rss = default_max_rss
+        self.lock = threading.Lock()
+        try:
+            with open(path) as history_file:
+                self.jobs: Dict[str, Dict[str, Any]] = json.load(history_file)
+        except FileNotFoundError:
+            self.jobs = {}
+
+    def _benchmark_max(self, benchmark: str, key: str) -> Optional[float]:
+        with self.lock:
+            values = [
+                entry[key]
+                for entry in self.jobs.values()
+                if entry['benchmark'] == benchmark
+            ]
+        return max(values) if values else None
+
+    def max_rss(self, instance: JobInstance) -> int:
+        entry = self.jobs.get(instance.instance_id)
+        if entry is not None:
+            return entry['max_rss']
+        estimate = self._benchmark_max(instance.benchmark, 'max_rss')
+        return int(estimate) if estimate is not None else self.default_max_rss
+
+    def seconds(self, instance: JobInstance) -> float:
+        entry = self.jobs.get(instance.instance_id)
+        if entry is not None:
+            return entry['seconds']
+        return self._benchmark_max(instance.benchmark, 'seconds') or 0.0
+
+    def record(self, instance: JobInstance, max_rss: int, seconds: float):
+        with self.lock:
+            self.jobs[instance.instance_id] = {
+                'benchmark': instance.benchmark,
+                'max_rss': max_rss,
+                'seconds': seconds,
+            }
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp.{os.getpid()}'
+        with open(tmp_path, 'w') as history_file:
+            json.dump(self.jobs, history_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class LocalRunner:
+
+    def __init__(self, env: Dict[str, str], workspace: str,
+                 artifacts_dir: str, log_dir: str, history: ResourceHistory,
+                 memory_limit: int):
+        self.history = history
+        self.memory_limit = memory_limit
+        self.workspace = workspace
+        self.artifacts_dir = artifacts_dir
+        self.log_dir = log_dir
+        self.github = {'workspace': workspace, 'event': {'inputs': {}}}
+        # The env values may refer to the github context, but not to each
+        # other.
+        github_ctx = ExpressionContext({'github': self.github})
+        self.env = {k: substitute(v, github_ctx) for k, v in env.items()}
+        self.start_time = time.time()
+        self.print_lock = threading.Lock()
+
+    def report(self, message: str):
+        with self.print_lock:
+            print(f'[{time.time() - self.start_time:8.1f}s] {message}',
+                  flush=True)
+
+    def run_step(self, step, ctx: ExpressionContext,
+                 log_file) -> Tuple[bool, int]:
+        """Run `step` and return whether it succeeded and the peak RSS of
+        its largest process in bytes."""
+        if isinstance(step, workflowgen.RunStep):
+            log_file.flush()
+            proc = subprocess.Popen(
+                ['bash', '--noprofile', '--norc', '-e', '-c',
+                 substitute(step.run, ctx)],
+                cwd=self.workspace,
+                env={
+                    **os.environ,
+                    **self.env, 'GITHUB_WORKSPACE': self.workspace
+                },
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT)
+            # Unlike getrusage(RUSAGE_CHILDREN), wait4 gives us the usage of
+            # this step alone even though other jobs run in other threads.
+            _, wait_status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(wait_status)
+            if proc.returncode != 0:
+                log_file.write(f'Error: exit status {proc.returncode}\n')
+            # ru_maxrss is in KiB on Linux.
+            return proc.returncode == 0, rusage.ru_maxrss * 1024
+        if step.action_name.startswith(UPLOAD_ARTIFACT_ACTION):
+            self.upload_artifact(substitute(str(step.args['name']), ctx),
+                                 substitute(str(step.args['path']), ctx),
+                                 step.args.get('if-no-files-found', 'warn'),
+                                 log_file)
+            return True, 0
+        log_file.write(f'Error: unsupported action {step.action_name}\n')
+        return False, 0
+
+    def upload_artifact(self, name: str, path: str, if_no_files_found: str,
+                        log_file):
+        dest = os.path.join(self.artifacts_dir, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, dest, dirs_exist_ok=True)
+        elif os.path.exists(path):
+            os.makedirs(dest, exist_ok=True)
+            shutil.copy2(path, dest)
+        else:
+            # Like upload-artifact's `if-no-files-found`, which defaults to
+            # `warn`.
+            if if_no_files_found != 'ignore':
+                log_file.write(f'Warning: no files found at {path}; '
+                               f'artifact {name} not uploaded\n')
+            return
+        log_file.write(f'Uploaded {path} as artifact {name}\n')
+
+    def run_job(self, instance: JobInstance) -> str:
+        """Run the steps of `instance` and return 'success' or 'failure'."""
+        ctx = ExpressionContext({
+            'env': self.env,
+            'github': self.github,
+            'matrix': instance.matrix
+        })
+        start = time.time()
+        self.report(f'Started {instance.instance_id} (expecting '
+                    f'{self.history.max_rss(instance) / (1 << 30):.1f} GiB)')
+        max_rss = 0
+        log_path = os.path.join(self.log_dir, instance.instance_id + '.log')
+        with open(log_path, 'w') as log_file:
+            for step in instance.job.steps:
+                if not step_should_run(step.condition, ctx):
+                    continue
+                log_file.write(f'##[step] {substitute(step.name, ctx)}\n')
+                succeeded, step_max_rss = self.run_step(step, ctx, log_file)
+                max_rss = max(max_rss, step_max_rss)
+                if not succeeded:
+                    ctx.job_status = 'failure'
+        seconds = time.time() - start
+        # A failed job may have stopped before its most expensive step.
+        if ctx.job_status == 'success':
+            self.history.record(instance, max_rss, seconds)
+        self.report(f'Finished {instance.instance_id}: {ctx.job_status} '
+                    f'in {seconds:.1f}s, peak RSS '
+                    f'{max_rss / (1 << 30):.1f} GiB')
+        return ctx.job_status
+
+    def run(self, instances: List[JobInstance], workers: int) -> Dict[str, str]:
+        """Run `instances`, respecting their `needs`, and return the result of
+        each ('success', 'failure' or 'skipped') by instance ID."""
+        by_job_id: Dict[str, List[str]] = {}
+        for instance in instances:
+            by_job_id.setdefault(instance.job.job_id,
+                                 []).append(instance.instance_id)
+        results: Dict[str, str] = {}
+        pending = list(instances)
+        # The memory reserved for each running job, which we give back when it
+        # finishes.
+        running: Dict[concurrent.futures.Future, Tuple[JobInstance, int]] = {}
+        reserved_memory = 0
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            while pending or running:
+                ready = []
+                still_pending = []
+                for instance in pending:
+                    # Jobs we aren't running (e.g., build_3c) are assumed to
+                    # have succeeded.
+                    need_results = [
+                        results.get(need_id)
+                        for job_id in instance.job.needs
+                        for need_id in by_job_id.get(job_id, [])
+                    ]
+                    if any(r not in (None, 'success') for r in need_results):
+                        results[instance.instance_id] = 'skipped'
+                        self.report(f'Skipped {instance.instance_id}')
+                    elif None in need_results:
+                        still_pending.append(instance)
+                    else:
+                        ready.append(instance)
+                # Longest first, then backfill: a job that doesn't fit in the
+                # remaining memory doesn't hold up smaller ones behind it.
+                ready.sort(key=lambda i: -self.history.seconds(i))
+                for instance in ready:
+                    memory = self.history.max_rss(instance)
+                    # Always start something if nothing is running, even if
+                    # it's expected not to fit.
+                    if len(running) >= workers or (
+                            running and
+                            reserved_memory + memory > self.memory_limit):
+                        still_pending.append(instance)
+                        continue
+                    reserved_memory += memory
+                    running[executor.submit(self.run_job,
+                                            instance)] = (instance, memory)
+                pending = still_pending
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    instance, memory = running.pop(future)
+                    reserved_memory -= memory
+                    results[instance.instance_id] = future.result()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the benchmark jobs of a generated workflow locally.')
+    parser.add_argument('--workspace',
+                        required=True,
+                        help='Directory to use as ${{github.workspace}}.')
+    parser.add_argument('--workflow',
+                        default='main',
+                        help='Workflow to run, by file name without .yml '
+                        '(default: main).')
+    parser.add_argument('--benchmark',
+                        action='append',
+                        help='Run only the jobs of this benchmark (may be '
+                        'repeated).')
+    parser.add_argument('--job',
+                        action='append',
+                        help='Run only the jobs whose ID matches this regular '
+                        'expression, and the jobs they need (may be repeated).')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of jobs to run at once.')
+    parser.add_argument('--memory-limit',
+                        type=parse_size,
+                        help='Memory that the running jobs may use together, '
+                        'e.g., 48G (default: 80%% of physical memory).')
+    parser.add_argument('--default-memory',
+                        type=parse_size,
+                        default=parse_size('4G'),
+                        help='Expected peak RSS of a job of a benchmark with '
+                        'no history (default: 4G).')
+    parser.add_argument('--history',
+                        help='JSON file of the resource use of earlier jobs '
+                        '(default: WORKSPACE/job-resources.json).')
+    parser.add_argument('--env',
+                        action='append',
+                        default=[],
+                        metavar='KEY=VALUE',
+                        help='Override a workflow env value, e.g., builddir.')
+    parser.add_argument('--artifacts-dir',
+                        help='Where to put uploaded artifacts (default: '
+                        'WORKSPACE/artifacts).')
+    parser.add_argument('--log-dir',
+                        help='Where to put the job logs (default: '
+                        'WORKSPACE/logs).')
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help='Only list the jobs that would run.')
+    args = parser.parse_args()
+
+    configs = {c.filename: c for c in workflowgen.workflow_file_configs}
+    if args.workflow not in configs:
+        parser.error(f'unknown workflow {args.workflow!r}; choose from '
+                     f'{", ".join(configs)}')
+    config = configs[args.workflow]
+    graph = workflowgen.JobGraph.for_config(config)
+    jobs = list(graph)
+    if args.benchmark is not None:
+        known = {b.name for b in workflowgen.benchmarks}
+        for name in args.benchmark:
+            if name not in known:
+                parser.error(f'unknown benchmark {name!r}')
+        selected = {
+            job.job_id for name in args.benchmark
+            for job in graph.by_benchmark.get(name, [])
+        }
+        jobs = [job for job in jobs if job.job_id in selected]
+    if args.job is not None:
+        patterns = [re.compile(p) for p in args.job]
+        jobs = graph.with_needs(job.job_id
+                                for job in jobs
+                                if any(p.search(job.job_id) for p in patterns))
+
+    instances = [instance for job in jobs for instance in expand_matrix(job)]
+    if args.dry_run:
+        for instance in instances:
+            print(f'{instance.instance_id} (needs: '
+                  f'{", ".join(instance.job.needs)})')
+        return
+
+    env = dict(
+        HEADER_ENV_RE.findall(
+            workflowgen.format_header(config).split('\njobs:')[0]))
+    for assignment in args.env:
+        key, sep, value = assignment.partition('=')
+        if sep == '':
+            parser.error(f'--env {assignment!r} is not of the form KEY=VALUE')
+        env[key] = value
+
+    workspace = os.path.abspath(args.workspace)
+    artifacts_dir = os.path.abspath(args.artifacts_dir or
+                                    os.path.join(workspace, 'artifacts'))
+    log_dir = os.path.abspath(args.log_dir or os.path.join(workspace, 'logs'))
+    for d in (artifacts_dir, log_dir, os.path.join(workspace, 'depsfolder')):
+        os.makedirs(d, exist_ok=True)
+    actions_link = os.path.join(workspace, 'depsfolder', 'actions')
+    if not os.path.lexists(actions_link):
+        os.symlink(SCRIPT_DIR, actions_link)
+
+    history = ResourceHistory(
+        args.history or os.path.join(workspace, 'job-resources.json'),
+        args.default_memory)
+    memory_limit = args.memory_limit or int(physical_memory() * 0.8)
+    runner = LocalRunner(env, workspace, artifacts_dir, log_dir, history,
+                         memory_limit)
+    # The clean job normally creates this.
+    os.makedirs(runner.env['benchmark_conv_dir'], exist_ok=True)
+    try:
+        results = runner.run(instances, args.jobs)
+    finally:
+        history.save()
+
+    counts: Dict[str, int] = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    print(', '.join(f'{n} {result}' for result, n in sorted(counts.items())) +
+          f'; logs in {log_dir}')
+    for instance_id, result in results.items():
+        if result == 'failure':
+            print(f'Failed: {instance_id} '
+                  f'({os.path.join(log_dir, instance_id + ".log")})')
+    if counts.get('failure', 0) or counts.get('skipped', 0):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
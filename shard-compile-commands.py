@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Restrict a compilation database to the translation units of one shard of a
+# benchmark (see BenchmarkInfo.shards in workflowgen.py), so that
+# convert_project.py converts only those.
+#
+# usage: shard-compile-commands.py --project-dir DIR --shards JSON
+#          --select NAME COMPILE_COMMANDS
+#
+# JSON maps each shard name to a list of fnmatch patterns for the paths of its
+# translation units relative to DIR, or to null for the shard that takes the
+# translation units that no other shard matches. Every translation unit must
+# belong to exactly one shard; otherwise we report the problem and exit 1
+# rather than silently convert a different program. The original database is
+# kept as COMPILE_COMMANDS.all.
+
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+
+def assign_shard(path: str, shards: Dict[str, Optional[List[str]]]) -> str:
+    matches = [
+        name for name, patterns in shards.items() if patterns is not None and
+        any(fnmatch.fnmatchcase(path, p) for p in patterns)
+    ]
+    if len(matches) > 1:
+        raise ValueError(f'{path} is in more than one shard: '
+                         f'{", ".join(matches)}')
+    if matches:
+        return matches[0]
+    rest = [name for name, patterns in shards.items() if patterns is None]
+    if not rest:
+        raise ValueError(f'{path} is in no shard')
+    return rest[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Restrict a compilation database to one shard.')
+    parser.add_argument('--project-dir', required=True)
+    parser.add_argument('--shards', type=json.loads, required=True)
+    parser.add_argument('--select', required=True)
+    parser.add_argument('compile_commands')
+    args = parser.parse_args()
+    if args.select not in args.shards:
+        parser.error(f'unknown shard {args.select!r}')
+
+    with open(args.compile_commands) as db_file:
+        entries = json.load(db_file)
+    project_dir = os.path.abspath(args.project_dir)
+    selected = []
+    errors = []
+    for entry in entries:
+        path = os.path.relpath(
+            os.path.normpath(os.path.join(entry['directory'], entry['file'])),
+            project_dir)
+        try:
+            if assign_shard(path, args.shards) == args.select:
+                selected.append(entry)
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        for error in sorted(set(errors)):
+            print(f'shard-compile-commands.py: error: {error}', file=sys.stderr)
+        sys.exit(1)
+    if not selected:
+        sys.exit(f'shard-compile-commands.py: error: shard {args.select} has '
+                 'no translation units')
+
+    shutil.copy2(args.compile_commands, args.compile_commands + '.all')
+    with open(args.compile_commands, 'w') as db_file:
+        json.dump(selected, db_file, indent=2)
+    print(f'Shard {args.select}: {len(selected)} of {len(entries)} '
+          'translation units')
+
+
+if __name__ == '__main__':
+    main()
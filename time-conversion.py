@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# Time a conversion the way hyperfine times a command: run it a few times to
+# warm up, then repeat it until we know its median wall-clock time precisely
+# enough, or up to a maximum number of times, and append a record of each run
+# to an NDJSON file. workflowgen.py converts each component with this when
+# WorkflowConfig.timing_ci_width is set.
+#
+# usage: time-conversion.py --output FILE --step NAME [--stats-dir PREFIX]
+#          [--build-profile NAME] [--warmup N] [--min-runs N] [--max-runs N]
+#          [--ci-width FRACTION] [--confidence LEVEL] [--cpus LIST]
+#          -- COMMAND [ARG]...
+#
+# After --min-runs timed runs, we stop as soon as the bootstrap confidence
+# interval of the median (see perfstats.MedianBootstrap) is at most --ci-width
+# times the median wide. The median is robust to the odd run that the machine
+# slows down, so such an outlier costs at most a few more runs rather than
+# skewing the result; we list the outliers at the end, as hyperfine warns
+# about them.
+#
+# The records are those of measure-step.py, one per run, with the step named
+# `NAME (warmup N)` for warmup runs and `NAME N` for timed ones (just NAME if
+# --max-runs is 1), so that perfstats.py reads them like the records of
+# separate steps. They also have the run number, whether the run was a warmup
+# and the CPUs it ran on. With --stats-dir, after each timed run N, we copy the
+# JSON files that 3c wrote in the current directory to PREFIX_N/ (PREFIX/ if
+# --max-runs is 1), with the build profile in build_profile.json, for the
+# workflow to upload as the stats artifact of that iteration.
+#
+# We run the command on the CPUs of --cpus (like `0-1,4`), by default those
+# that the kernel isolates from the scheduler (the isolcpus boot parameter),
+# so that other processes don't preempt it; if there are none, we leave the
+# affinity alone. We can't set the CPU frequency governor without root (and
+# the hosted runners' VMs have none), so we only record it, if there is one,
+# to tell runs on differently clocked machines apart. We exit with the status
+# of the first run that fails, without running the command again.
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+from typing import List, Optional, Set
+
+import perfstats
+
+ISOLATED_CPUS_FILE = '/sys/devices/system/cpu/isolated'
+GOVERNOR_FILE = '/sys/devices/system/cpu/cpu{}/cpufreq/scaling_governor'
+# A run is an outlier if its time is further than this many MADs from the
+# median. (This is about 3 standard deviations for normal data.)
+OUTLIER_MADS = 4.5
+BOOTSTRAP_RESAMPLES = 2000
+
+
+def parse_cpu_list(text: str) -> Set[int]:
+    """Parse a list of CPUs in the kernel's format, like `0-1,4`."""
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def isolated_cpus() -> Set[int]:
+    try:
+        with open(ISOLATED_CPUS_FILE) as isolated_file:
+            return parse_cpu_list(isolated_file.read())
+    except FileNotFoundError:
+        return set()
+
+
+def cpu_governors(cpus: List[int]) -> List[str]:
+    governors = set()
+    for cpu in cpus:
+        try:
+            with open(GOVERNOR_FILE.format(cpu)) as governor_file:
+                governors.add(governor_file.read().strip())
+        except FileNotFoundError:
+            pass
+    return sorted(governors)
+
+
+def save_stats(stats_dir: str, build_profile: Optional[str]):
+    os.mkdir(stats_dir)
+    for path in glob.glob('*.json'):
+        shutil.copy2(path, stats_dir)
+    if build_profile is not None:
+        with open(os.path.join(stats_dir, perfstats.BUILD_PROFILE_FNAME),
+                  'w') as profile_file:
+            json.dump({'name': build_profile}, profile_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time a command with warmup and adaptive repetition.')
+    parser.add_argument('--output',
+                        required=True,
+                        help='NDJSON file to append the records to.')
+    parser.add_argument('--step', required=True, help='Name of the step.')
+    parser.add_argument('--stats-dir',
+                        help='Prefix of the directories to copy the JSON '
+                        'files of each timed run to.')
+    parser.add_argument('--build-profile',
+                        default=os.environ.get('build_profile'),
+                        help='Build profile of 3c to record (default: the '
+                        '`build_profile` environment variable).')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--min-runs', type=int, default=3)
+    parser.add_argument('--max-runs', type=int, default=10)
+    parser.add_argument('--ci-width',
+                        type=float,
+                        default=0.02,
+                        help='Stop when the confidence interval of the '
+                        'median wall-clock time is at most this fraction of '
+                        'it wide.')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--cpus',
+                        type=parse_cpu_list,
+                        help='CPUs to run the command on (default: the '
+                        'isolated ones).')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        parser.error('no command given')
+    if not 1 <= args.min_runs <= args.max_runs:
+        parser.error('need 1 <= --min-runs <= --max-runs')
+
+    cpus = args.cpus if args.cpus is not None else isolated_cpus()
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    else:
+        print('time-conversion.py: no isolated CPUs; not pinning the command')
+    cpus = sorted(os.sched_getaffinity(0))
+    governors = cpu_governors(cpus)
+
+    bootstrap = perfstats.MedianBootstrap(BOOTSTRAP_RESAMPLES)
+    timed_seconds: List[float] = []
+    runs = [(True, i) for i in range(1, args.warmup + 1)
+           ] + [(False, i) for i in range(1, args.max_runs + 1)]
+    for warmup, run in runs:
+        if warmup:
+            step = (f'{args.step} (warmup {run})'
+                    if args.warmup > 1 else f'{args.step} (warmup)')
+        else:
+            step = f'{args.step} {run}' if args.max_runs > 1 else args.step
+        print(f'=== {step}', flush=True)
+        record = {'step': step, **perfstats.measure_command(command)}
+        record.update(run=run, warmup=warmup, cpus=cpus)
+        if governors:
+            record['cpu_governors'] = governors
+        if args.build_profile is not None:
+            record['build_profile'] = args.build_profile
+        with open(args.output, 'a') as output_file:
+            output_file.write(json.dumps(record) + '\n')
+        if record['exit_status'] != 0:
+            sys.exit(record['exit_status'])
+        if warmup:
+            continue
+
+        if args.stats_dir is not None:
+            save_stats(
+                f'{args.stats_dir}_{run}'
+                if args.max_runs > 1 else args.stats_dir, args.build_profile)
+        timed_seconds.append(record['wall_seconds'])
+        if len(timed_seconds) < args.min_runs:
+            continue
+        values = sorted(timed_seconds)
+        center = perfstats.median(values)
+        low, high = bootstrap.interval(values, args.confidence)
+        rel_width = (high - low) / center if center > 0 else 0.0
+        print(f'Median of {len(values)} runs: {center:.3f} s, '
+              f'{args.confidence:.0%} CI [{low:.3f}, {high:.3f}] '
+              f'({rel_width:.1%} of the median)')
+        if rel_width <= args.ci_width:
+            break
+    else:
+        print(f'time-conversion.py: stopped after {args.max_runs} runs '
+              f'without reaching a confidence interval {args.ci_width:.1%} '
+              'of the median wide')
+
+    values = sorted(timed_seconds)
+    center = perfstats.median(values)
+    mad = perfstats.median_abs_deviation(values)
+    outliers = [
+        run for run, seconds in enumerate(timed_seconds, 1)
+        if mad > 0 and abs(seconds - center) > OUTLIER_MADS * mad
+    ]
+    if outliers:
+        print('time-conversion.py: warning: outlying runs (was the machine '
+              f'busy?): {", ".join(map(str, outliers))}')
+
+
+if __name__ == '__main__':
+    main()
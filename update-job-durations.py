@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Record how long the benchmark jobs of a workflow took in job-durations.json,
+# which WorkflowConfig.order_by_duration in workflowgen.py uses to emit the
+# longest jobs first. Run generate-workflow.py afterwards.
+#
+# usage: update-job-durations.py --workflow NAME [--output FILE]
+#          [--gh-run RUN_JSON]... [--history HISTORY_JSON]...
+#
+# RUN_JSON is the output of `gh run view RUN_ID --json jobs` for a run of the
+# workflow on GitHub; we match its jobs to ours by name. HISTORY_JSON is the
+# history file of run-workflow-locally.py (by default
+# WORKSPACE/job-resources.json). The duration of a job is the median over the
+# inputs that have it. A matrix job's is the sum of those of its entries,
+# since they share the runner, and an input counts for it only if it has all
+# of them. Jobs that didn't succeed on GitHub are ignored, since a failure
+# ends a job early. The recorded durations of the workflow's other jobs, and
+# of the other workflows, are kept.
+
+import argparse
+import datetime
+import json
+import re
+import statistics
+from typing import Dict, List, Tuple
+
+import workflowgen
+
+MATRIX_EXPR_RE = re.compile(r'\$\{\{ matrix\.(\w+) \}\}')
+
+
+def job_instances(job: workflowgen.Job) -> List[Tuple[str, str]]:
+    """(Instance ID in run-workflow-locally.py, name on GitHub) of each run of
+    `job`."""
+    if job.matrix is None:
+        return [(job.job_id, job.name)]
+    return [(f'{job.job_id}_{entry.get("subvariant", i)}',
+             MATRIX_EXPR_RE.sub(lambda m: str(entry[m[1]]), job.name))
+            for i, entry in enumerate(job.matrix)]
+
+
+def parse_time(timestamp: str) -> datetime.datetime:
+    # fromisoformat doesn't take the `Z` suffix before Python 3.11.
+    return datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+def gh_run_seconds(path: str) -> Dict[str, float]:
+    """Seconds each successful job took, by name."""
+    with open(path) as run_file:
+        run = json.load(run_file)
+    return {
+        job['name']: (parse_time(job['completedAt']) -
+                      parse_time(job['startedAt'])).total_seconds()
+        for job in run['jobs']
+        if job.get('conclusion') == 'success'
+    }
+
+
+def history_seconds(path: str) -> Dict[str, float]:
+    """Seconds each job instance took, by instance ID."""
+    with open(path) as history_file:
+        return {
+            instance_id: entry['seconds']
+            for instance_id, entry in json.load(history_file).items()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Record the durations of the jobs of a workflow.')
+    parser.add_argument('--workflow', required=True)
+    parser.add_argument('--output', default=workflowgen.JOB_DURATIONS_FILE)
+    parser.add_argument('--gh-run', action='append', default=[])
+    parser.add_argument('--history', action='append', default=[])
+    args = parser.parse_args()
+    if not args.gh_run and not args.history:
+        parser.error('give at least one --gh-run or --history')
+    configs = {c.filename: c for c in workflowgen.workflow_file_configs}
+    if args.workflow not in configs:
+        parser.error(f'unknown workflow {args.workflow!r}; choose from '
+                     f'{", ".join(configs)}')
+    graph = workflowgen.JobGraph.for_config(configs[args.workflow])
+
+    # (Instance key -> seconds, whether instances are keyed by ID or name)
+    inputs = ([(gh_run_seconds(path), False) for path in args.gh_run] +
+              [(history_seconds(path), True) for path in args.history])
+    samples: Dict[str, List[float]] = {}
+    for seconds, by_id in inputs:
+        for job in graph:
+            keys = [
+                instance_id if by_id else name
+                for instance_id, name in job_instances(job)
+            ]
+            if all(key in seconds for key in keys):
+                samples.setdefault(job.job_id, []).append(
+                    sum(seconds[key] for key in keys))
+    if not samples:
+        parser.error('no job of the workflow appears in the inputs')
+
+    try:
+        with open(args.output) as durations_file:
+            durations = json.load(durations_file)
+    except FileNotFoundError:
+        durations = {}
+    workflow_durations = durations.setdefault(args.workflow, {})
+    for job_id, job_samples in samples.items():
+        workflow_durations[job_id] = round(statistics.median(job_samples), 1)
+    with open(args.output, 'w') as durations_file:
+        json.dump(durations, durations_file, indent=2, sort_keys=True)
+        durations_file.write('\n')
+    print(f'Recorded the durations of {len(samples)} of the {len(graph)} jobs '
+          f'of {args.workflow}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2065 @@
+# python3: Whee, type annotations!
+
+# The benchmarks, variants and workflow configurations behind the workflows in
+# .github/workflows, and the code that turns them into jobs and steps and
+# renders those as YAML. generate-workflow.py writes the files; other tools
+# (e.g., run-workflow-locally.py) import this module to work with the same jobs
+# through a `JobGraph`, so importing it must not do anything else.
+
+from abc import ABC, abstractmethod
+import dataclasses
+from dataclasses import dataclass, field
+import functools
+import io
+import json
+import os
+import re
+import shlex
+import textwrap
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import perfstats
+
+
+# To make `WorkflowConfig` definitions more concise, this `Variant` class does
+# not include some extra flags that are currently done in Cartesian product with
+# `Variant` objects. Currently, the only such extra flag is expand_macros.
+@dataclass
+class Variant:
+    alltypes: bool
+    extra_3c_args: List[str] = ''
+    friendly_name_suffix: str = ''
+    is_comparative_varient: bool = False
+    # Convert with 3c built this way (in a job of its own) instead of the
+    # workflow's build_profile, e.g., to compare the two.
+    build_profile: Optional['BuildProfile'] = None
+
+
+@dataclass
+class BenchmarkComponent:
+    # Default: Same as the benchmark's friendly_name.
+    friendly_name: Optional[str] = None
+    # Default: The benchmark's main directory.
+    subdir: Optional[str] = None
+    # Relative to subdir. Default: Same directory.
+    build_dir: Optional[str] = None
+    # Command that builds this component under `bear`, in subdir, independently
+    # of the other components, after the benchmark's build_cmds. The commands
+    # of the components run in parallel, each writing its own compilation
+    # database, and the databases are then merged into one in the benchmark's
+    # main directory.
+    build_cmd: Optional[str] = None
+
+
+# A subset of the translation units of a benchmark that can be converted
+# separately from the rest. With WorkflowConfig.use_shards, each shard of a
+# benchmark is converted in its own job and a final job merges their output and
+# builds the result (see shard-compile-commands.py and merge-shards.py).
+@dataclass
+class Shard:
+    name: str
+    # fnmatch patterns for the paths of the translation units, relative to the
+    # benchmark's main directory. None: All translation units that no other
+    # shard of the benchmark matches.
+    paths: Optional[List[str]] = None
+
+
+@dataclass
+class BenchmarkInfo:
+    name: str
+    friendly_name: str
+    dir_name: str
+    # Followed by the build_cmd of each component that has one.
+    build_cmds: str
+    # Please use the `-k` option to `make` or its analogue so we can catch as
+    # many errors as possible on one workflow run.
+    build_converted_cmd: str
+    convert_extra: Optional[str] = None
+    # Default: One component with all default properties.
+    components: Optional[List[BenchmarkComponent]] = None
+    patch_dir: Optional[str] = None
+    # Disallow this benchmark for comparative varients
+    disallow_for_comparative_varients: bool = False
+    # Only for benchmarks with a single component.
+    shards: Optional[List[Shard]] = None
+
+    def component_names(self) -> List[str]:
+        """The names of the components, as in the stats artifacts."""
+        if self.components is None:
+            return [self.friendly_name]
+        return [c.friendly_name or self.friendly_name for c in self.components]
+
+    def is_allowed(self, var: Variant):
+        # Is this a fancy varient?
+        return not self.disallow_for_comparative_varients or \
+               not var.is_comparative_varient
+
+
+# Standard options for `ninja` and parallel `make`.
+#
+# - `-j` and `--output-sync` make `make` behave more like `ninja`.
+#
+# - For both tools, `-l` is a crude attempt to try to avoid bogging down the
+#   machine by using too much memory if other jobs are running on the machine.
+#   If (for example) multiple ninja instances run concurrently, each will try to
+#   run approximately `$(nproc)` parallel jobs, which can make a machine
+#   unresponsive. (Anecdotal evidence suggests that `nice` is insufficient to
+#   avoid the problem because it only directly controls CPU priority.) We set
+#   `-l` to `$(nproc)` to try to use all hyperthreads when the machine is
+#   otherwise idle; to a first approximation, there should be no benefit to
+#   setting it higher. We hope that the resulting total memory usage is not too
+#   much.
+#
+# TODO: Factor these out into wrapper scripts that users can call manually for
+# all their builds?
+ninja_std = 'ninja -l $(nproc)'
+make_std = 'make -j $(nproc) -l $(nproc) --output-sync'
+
+# Encapsulate the standard option to use the Checked C compiler for either a
+# CMake project or a `make` project that uses the traditional CC variable.
+make_checkedc = f'{make_std} CC="${{{{env.builddir}}}}/bin/clang"'
+cmake_checkedc = 'cmake -DCMAKE_C_COMPILER=${{env.builddir}}/bin/clang'
+
+# `-w`: We generally want to turn off all compiler warnings since there are many
+# of them in the benchmarks and they distract us from the errors we need to fix.
+# In some cases, warnings may clue us in to the cause of an error, and it may be
+# useful to temporarily turn them back on for troubleshooting.
+#
+# Some benchmarks appear to have no warnings in the code anyway (good for them!)
+# and/or have other -W flags in effect that we can't easily (and don't)
+# override, but we still pass this to all benchmarks as standard to make a best
+# effort to turn off warnings.
+#
+# `-ferror-limit=0`: By default, Clang stops issuing errors after the first 20
+# errors in each translation unit. In some cases, that might be helpful to avoid
+# letting a single root cause produce a huge number of errors that make the
+# statistics a less useful measure of what actually needs to be fixed, but in
+# other cases, ignoring errors in each file after the first 20 introduces a more
+# or less arbitrary distortion in the statistics. Currently, we believe the
+# second effect outweighs the first, so we turn off the error limit.
+#
+# There is enough variation in how we need to pass compiler options to different
+# benchmarks that we don't factor out anything more here.
+common_cflags = '-w -ferror-limit=0'
+
+# There is a known incompatibility between the vsftpd version we're using and
+# Clang: vsftpd triggers a -Wenum-conversion warning that becomes an error with
+# -Werror. See, for example:
+#
+# https://bugs.freebsd.org/bugzilla/show_bug.cgi?id=170101
+#
+# For now, we avoid the problem by turning off -Wenum-conversion. Unfortunately,
+# the vsftpd makefile doesn't give us a way to add one flag to its CFLAGS list,
+# so we stuff the flag in CC instead.
+#
+# NOTE: -Wenum-conversion is redundant with -w in common_cflags, but we keep it
+# in case we turn off -w.
+vsftpd_make = f'{make_std} CC="${{{{env.builddir}}}}/bin/clang {common_cflags} -Wno-enum-conversion"'
+
+# We use plain `make` and not `make_std` because it's not safe to build thttpd
+# in parallel: the main and cgi-src Makefiles may try to build match.o in
+# parallel, which would result in a duplicate compilation database entry (which
+# breaks the macro expander) or possibly other corruption. Another possible
+# workaround might be to force match.o to be built first, but it seems more
+# reasonable to just turn off parallelism (despite the modest running time cost)
+# than to hard-code the knowledge of the specific problem here.
+#
+# I wasn't able to find any way to add to thttpd's compiler flags short of this
+# hack. Although thttpd uses Autoconf, it doesn't honor the CFLAGS variable
+# passed to Autoconf, and any arguments added to the CC variable at
+# `./configure` time seem to get discarded. As with vsftpd, we cannot add flags
+# to any of the other variables used in the makefile without losing the existing
+# flags. ~ Matt 2021-04-22
+thttpd_make = f'make CC="${{{{env.builddir}}}}/bin/clang {common_cflags}"'
+
+ptrdist_components = ['anagram', 'bc', 'ft', 'ks', 'yacr2']
+ptrdist_manual_components = ['anagram', 'ft', 'ks', 'yacr2']
+
+olden_components = ['bh', 'bisort', 'em3d', 'health', 'mst',
+                    'perimeter', 'power', 'treeadd', 'tsp', 'voronoi']
+
+# The blank comments below stop YAPF from reformatting things in ways we don't
+# want; large data literals are a known weakness of YAPF
+# (https://github.com/google/yapf#why-does-yapf-destroy-my-awesome-formatting).
+
+benchmarks = [
+
+    # Vsftpd
+    BenchmarkInfo(
+        #
+        name='vsftpd',
+        friendly_name='Vsftpd',
+        dir_name='vsftpd-3.0.3',
+        build_cmds=f'bear {vsftpd_make}',
+        build_converted_cmd=f'{vsftpd_make} -k'),
+
+    # Parson
+    BenchmarkInfo(
+        #
+        name='Parson',
+        friendly_name='Parson',
+        dir_name='parson',
+        build_cmds=f'bear {make_checkedc}',
+        build_converted_cmd=f'{make_checkedc} -k'),
+
+    # bignum
+    BenchmarkInfo(
+        #
+        name='TinyBigNum',
+        friendly_name='TinyBigNum',
+        dir_name='tiny-bignum-c',
+        build_cmds=f'bear {make_checkedc}',
+        build_converted_cmd=f'{make_checkedc} -k'),
+
+    # Olden
+    BenchmarkInfo(
+        #
+        name='Olden',
+        friendly_name='Olden',
+        dir_name='Olden',
+        convert_extra="--extra-3c-arg=-allow-unwritable-changes \\",
+        build_cmds='',
+        build_converted_cmd=(
+            f'{make_checkedc} -k LOCAL_CFLAGS="{common_cflags} -D_ISOC99_SOURCE"'
+        ),
+        components=[
+            BenchmarkComponent(
+                friendly_name=c,
+                subdir=c,
+                build_cmd=(f'bear {make_checkedc} '
+                           f'LOCAL_CFLAGS="{common_cflags} -D_ISOC99_SOURCE"'))
+            for c in olden_components
+        ]),
+
+    # PtrDist
+    BenchmarkInfo(
+        #
+        name='ptrdist',
+        friendly_name='PtrDist',
+        dir_name='ptrdist-1.1',
+        # Patch yacr2 to work around correctcomputation/checkedc-clang#374. For
+        # certain header files foo.h, foo.c defines a macro FOO_CODE that
+        # activates a different #if branch in foo.h that defines global
+        # variables instead of declaring them. This is an unusual practice:
+        # normally foo.h would declare the variables whether or not it is being
+        # included by foo.c, and then foo.c would additionally define them. We
+        # simulate the normal practice by copying only the parts of foo.h
+        # conditional on FOO_CODE to a new file foo_code.h, making foo.c include
+        # foo_code.h in addition to foo.h, and deleting the `#define FOO_CODE`.
+        #
+        # Also fix type conflict between `costMatrix` declaration and
+        # definition, exposed when both are in the same translation unit.
+        build_cmds=textwrap.dedent(f'''\
+        ( cd yacr2 ; \\
+          sed -Ei 's/^long (.*costMatrix)/ulong \\1/' assign.h
+          for header in *.h  ; do
+            src="$(basename "$header" .h).c"
+            new_header="$(basename "$header" .h)_code.h"
+            test -e "$src" || continue
+            sed -ne '/^#ifdef.*CODE/,/#else.*CODE/{{ /^#/!p; }}' "$header" >"$new_header"
+            sed -i "/#define.*_CODE/d; /#include \\"$header\\"/a#include \\"$new_header\\"" "$src"
+          done )
+        '''),
+        build_converted_cmd=(
+            f'{make_checkedc} -k LOCAL_CFLAGS="{common_cflags} -D_ISOC99_SOURCE"'
+        ),
+        components=[
+            BenchmarkComponent(
+                friendly_name=c,
+                subdir=c,
+                build_cmd=(f'bear {make_checkedc} '
+                           f'LOCAL_CFLAGS="{common_cflags} -D_ISOC99_SOURCE"'))
+            for c in ptrdist_components
+        ]),
+
+    # LibArchive
+    BenchmarkInfo(
+        #
+        name='libarchive',
+        friendly_name='LibArchive',
+        dir_name='libarchive-3.4.3',
+        build_cmds=textwrap.dedent(f'''\
+        cd build
+        {cmake_checkedc} -G Ninja -DCMAKE_C_FLAGS="{common_cflags} -D_GNU_SOURCE" ..
+        bear {ninja_std} archive
+        '''),
+        build_converted_cmd=f'{ninja_std} -k 0 archive',
+        convert_extra=textwrap.dedent('''\
+        --skip '/.*/(test|test_utils|tar|cat|cpio|examples|contrib|libarchive_fe)/.*' \\
+        '''),
+        components=[BenchmarkComponent(build_dir='build')],
+        shards=[
+            Shard('read', ['libarchive/archive_read*']),
+            Shard('write', ['libarchive/archive_write*']),
+            Shard('rest'),
+        ]),
+
+    # Lua
+    BenchmarkInfo(
+        #
+        name='lua',
+        friendly_name='Lua',
+        dir_name='lua-5.4.1',
+        build_cmds=textwrap.dedent(f'''\
+        bear {make_checkedc} CFLAGS="{common_cflags}" linux
+        ( cd src ; \\
+          ${{{{env.builddir}}}}/bin/clang-rename -pl -i \\
+            --qualified-name=main \\
+            --new-name=luac_main \\
+            luac.c )
+        '''),
+        # Undo the rename using sed because the system install of clang-rename
+        # can't handle checked pointers. This works since "luac_main" only
+        # appears in the locations where it was added as a result of the
+        # original rename.
+        build_converted_cmd=textwrap.dedent(f'''\
+        sed -i "s/luac_main/main/" src/luac.c
+        {make_checkedc} -k CFLAGS="{common_cflags}" linux
+        ''')),
+
+    # LibTiff
+    BenchmarkInfo(
+        #
+        name='libtiff',
+        friendly_name='LibTiff',
+        dir_name='tiff-4.1.0',
+        build_cmds=textwrap.dedent(f'''\
+        {cmake_checkedc} -G Ninja -DCMAKE_C_FLAGS="{common_cflags}" .
+        bear {ninja_std} tiff
+        ( cd tools ; \\
+          for i in *.c ; do \\
+            ${{{{env.builddir}}}}/bin/clang-rename -pl -i \\
+              --qualified-name=main \\
+              --new-name=$(basename -s .c $i)_main $i ; \\
+          done)
+        '''),
+        build_converted_cmd=f'{ninja_std} -k 0 tiff',
+        convert_extra=textwrap.dedent('''\
+        --skip '/.*/tif_stream.cxx' \\
+        --skip '.*/test/.*\.c' \\
+        --skip '.*/contrib/.*\.c' \\
+        '''),
+        patch_dir='tiff-4.1.0_patches'),
+
+    # Zlib
+    BenchmarkInfo(
+        #
+        name='zlib',
+        friendly_name='ZLib',
+        dir_name='zlib-1.2.11',
+        build_cmds=textwrap.dedent(f'''\
+        mkdir build
+        cd build
+        {cmake_checkedc} -G Ninja -DCMAKE_C_FLAGS="{common_cflags}" ..
+        bear {ninja_std} zlib
+        '''),
+        build_converted_cmd=f'{ninja_std} -k 0 zlib',
+        convert_extra="--skip '/.*/test/.*' \\",
+        components=[BenchmarkComponent(build_dir='build')]),
+
+    # Icecast
+    BenchmarkInfo(
+        #
+        name='icecast',
+        friendly_name='Icecast',
+        dir_name='icecast-2.4.4',
+        # Turn off _GNU_SOURCE to work around the problem with transparent
+        # unions for `struct sockaddr *`
+        # (https://github.com/microsoft/checkedc/issues/441). `configure` was
+        # generated from `configure.in` by autoconf, but we don't want to re-run
+        # autoconf here, so just patch the generated file. :/
+        build_cmds=textwrap.dedent(f'''\
+        sed -i '/_GNU_SOURCE/d' configure
+        CC="${{{{env.builddir}}}}/bin/clang" CFLAGS="{common_cflags}" ./configure
+        bear {make_std}
+        '''),
+        build_converted_cmd=f'{make_std} -k'),
+
+    # thttpd
+    BenchmarkInfo(
+        #
+        name='thttpd',
+        friendly_name='Thttpd',
+        dir_name='thttpd-2.29',
+        build_cmds=textwrap.dedent(f'''\
+        CC="${{{{env.builddir}}}}/bin/clang" ./configure
+        chmod -R 777 *
+        bear {thttpd_make}
+        '''),
+        build_converted_cmd=f'{thttpd_make} -k',
+        patch_dir='thttpd-2.29_patches'),
+]
+
+HEADER = '''\
+# This file is generated by generate-workflow.py. To update this file, update
+# workflowgen.py instead and re-run generate-workflow.py. Some things in this
+# file are explained by comments in workflowgen.py.
+{content_hash_line}
+
+name: {workflow.name}
+
+on:
+{optional_schedule_trigger}  workflow_dispatch:
+    inputs:
+      branch:
+        description: "Branch or commit ID of correctcomputation/checkedc-clang to run workflow on"
+        required: true
+        default: "main"
+
+env:
+  benchmark_tar_dir: "/home/github/checkedc-benchmarks"
+  builddir: "${{github.workspace}}/b/ninja"
+  benchmark_conv_dir: "${{github.workspace}}/benchmark_conv"
+  branch_for_scheduled_run: "main"
+  port_tools: "${{github.workspace}}/depsfolder/checkedc-clang/clang/tools/3c/utils/port_tools"
+  # How 3c and clang are built (see BuildProfile in workflowgen.py). Recorded
+  # in the stats artifacts so that stats of different profiles aren't
+  # compared.
+  build_profile: "{build_profile.name}"
+  # Builds of 3c and clang are cached here across workflow runs, keyed by the
+  # commits and the CMake flags (and so by the build profile); see
+  # build-3c-cache.py.
+  build_cache_dir: "/home/github/3c-build-cache"
+  build_cache_max_size: "200G"
+
+jobs:
+
+  # Cleanup files left behind by prior runs
+  clean:
+    name: Clean
+    runs-on: self-hosted
+    steps:
+      - name: Clean
+        run: |
+          rm -rf ${{env.benchmark_conv_dir}}
+          mkdir -p ${{env.benchmark_conv_dir}}
+          rm -rf ${{env.builddir}}
+          mkdir -p ${{env.builddir}}
+          rm -rf ${{github.workspace}}/depsfolder
+          mkdir -p ${{github.workspace}}/depsfolder
+
+  # Clone and build 3c and clang
+  # (clang is needed to test compilation of converted benchmarks.)
+  build_3c:
+    name: Build 3c and clang
+    needs: clean
+    runs-on: self-hosted
+    steps:
+      - name: Check out the actions repository
+        uses: actions/checkout@v2
+        with:
+          path: depsfolder/actions
+      - name: Check that the workflow file is up to date with generate-workflow.py before running it
+        run: |
+          cd ${{github.workspace}}/depsfolder/actions
+          ./generate-workflow.py --check
+
+      - name: Branch or commit ID
+        run: echo "${{ github.event.inputs.branch || env.branch_for_scheduled_run }}"
+      - name: Check out the 3C repository and the Checked C system headers
+        run: |
+          git init ${{github.workspace}}/depsfolder/checkedc-clang
+          cd ${{github.workspace}}/depsfolder/checkedc-clang
+          git remote add origin https://github.com/correctcomputation/checkedc-clang
+          git fetch --depth 1 origin "${{ github.event.inputs.branch || env.branch_for_scheduled_run }}"
+          git checkout FETCH_HEAD
+          # As of 2021-04-12, we're using CCI's `checkedc` repository because it
+          # has a checked declaration for `syslog` that we want to use for our
+          # experiments but have not yet submitted to Microsoft.
+          git clone --depth 1 https://github.com/correctcomputation/checkedc ${{github.workspace}}/depsfolder/checkedc-clang/llvm/projects/checkedc-wrapper/checkedc
+
+      - name: Build 3c and clang
+        run: |
+{build_3c_cmds}          chmod -R 777 ${{github.workspace}}/depsfolder
+          chmod -R 777 ${{env.builddir}}
+
+  # Run Test for 3C
+  test_3c:
+    name: 3C regression tests
+    needs: build_3c
+    runs-on: self-hosted
+    steps:
+      - name: 3C regression tests
+        run: |
+          cd ${{env.builddir}}
+          {ninja_std} check-3c
+
+  # Convert our benchmark programs
+'''
+
+# For this exceptionally long string literal, the trade-off is in favor of
+# replacing {ninja_std} ad-hoc rather than using an f-string, which would
+# require us to escape all the curly braces.
+HEADER = HEADER.replace('{ninja_std}', ninja_std)
+
+
+# We render thousands of steps (every benchmark × variant × expand_macros value
+# × config), many of them with the same text in several configs, and most of
+# the rendering time goes to textwrap. So memoize it.
+dedent = functools.lru_cache(maxsize=None)(textwrap.dedent)
+indent = functools.lru_cache(maxsize=None)(textwrap.indent)
+
+
+# Frozen so that it can be the default of WorkflowConfig.build_profile.
+@dataclass(frozen=True)
+class BuildProfile:
+    """How the build_3c job builds 3c and clang."""
+    name: str
+    # Rendered as a comment before the flags.
+    description: str
+    cmake_flags: List[str]
+    # An LLVM profile (from `llvm-profdata merge`) to optimize the build with.
+    # Its contents are part of the build cache key.
+    profdata_file: Optional[str] = None
+    # If set, the workflow gathers the profile in profdata_file itself (see
+    # generate_profile_build_job): it builds 3c with these flags, which must
+    # instrument it, and converts the benchmarks with it.
+    training_cmake_flags: Optional[List[str]] = None
+
+    def format_cmake_flags(self, training: bool = False) -> str:
+        """The definition of the `cmake_flags` array in the build step. With
+        `training`, for the instrumented build that gathers the profile."""
+        if training:
+            description = 'Instrumented to gather the profile for PGO.\n'
+            flags = self.training_cmake_flags
+        else:
+            description = self.description
+            flags = self.cmake_flags
+            if self.profdata_file is not None:
+                flags = flags + [f'-DLLVM_PROFDATA_FILE={self.profdata_file}']
+        return (''.join(f'# {line}\n' if line else '#\n'
+                        for line in description.splitlines()) +
+                'cmake_flags=(\n' + ''.join(f'  {flag}\n' for flag in flags) +
+                ')\n')
+
+
+BUILD_PROFILE_COMMON_CMAKE_FLAGS = [
+    '-G Ninja',
+    '-DLLVM_TARGETS_TO_BUILD=X86',
+]
+
+# For testing 3c.
+DEBUG_BUILD_PROFILE = BuildProfile(
+    name='debug',
+    description=dedent('''\
+        We'll be running the tools enough that it's worth spending the extra
+        time for an optimized build, and the easiest way to do that is to
+        use a "release" build. But we do want assertions and we do want
+        debug info in order to get symbols in assertion stack traces, so we
+        use -DLLVM_ENABLE_ASSERTIONS=ON and the RelWithDebInfo build type,
+        respectively. Furthermore, the tools rely on the llvm-symbolizer
+        helper program to actually read the debug info and generate the
+        symbolized stack trace when an assertion failure occurs. We could
+        build it here, but as of 2021-03-15, we just use Ubuntu's version
+        installed systemwide; it seems that llvm-symbolizer is a generic
+        tool and the difference in versions does not matter.
+    '''),
+    cmake_flags=BUILD_PROFILE_COMMON_CMAKE_FLAGS + [
+        '-DCMAKE_BUILD_TYPE="RelWithDebInfo"',
+        '-DLLVM_ENABLE_ASSERTIONS=ON',
+        '-DLLVM_OPTIMIZED_TABLEGEN=ON',
+        '-DLLVM_USE_SPLIT_DWARF=ON',
+        '-DLLVM_ENABLE_PROJECTS="clang"',
+    ])
+
+# For measuring the conversion time of 3c as users would see it: assertions
+# and debug info would slow 3c down unevenly and make the build slower.
+RELEASE_BUILD_PROFILE = BuildProfile(
+    name='release',
+    description=dedent('''\
+        An optimized build without assertions or debug info, so that the
+        conversion times we measure are those of a release build of 3c.
+    '''),
+    cmake_flags=BUILD_PROFILE_COMMON_CMAKE_FLAGS + [
+        '-DCMAKE_BUILD_TYPE="Release"',
+        '-DLLVM_ENABLE_ASSERTIONS=OFF',
+        '-DLLVM_ENABLE_PROJECTS="clang"',
+    ])
+
+# Like RELEASE_BUILD_PROFILE, with ThinLTO, which needs the system clang and
+# lld on the runner. With a profdata_file, also with PGO.
+THINLTO_BUILD_PROFILE = BuildProfile(
+    name='thinlto',
+    description=dedent('''\
+        An optimized build without assertions or debug info, with ThinLTO
+        (which needs the system clang and lld).
+    '''),
+    cmake_flags=RELEASE_BUILD_PROFILE.cmake_flags + [
+        '-DCMAKE_C_COMPILER=clang',
+        '-DCMAKE_CXX_COMPILER=clang++',
+        '-DLLVM_USE_LINKER=lld',
+        '-DLLVM_ENABLE_LTO=Thin',
+    ])
+
+# With profile-guided optimization (on top of ThinLTO) from converting the
+# benchmarks, which are realistic inputs for 3c, in the same workflow run.
+PGO_BUILD_PROFILE = BuildProfile(
+    name='pgo',
+    description=dedent('''\
+        An optimized build without assertions or debug info, with ThinLTO
+        and PGO (which need the system clang, lld and llvm-profdata). The
+        profile comes from converting the benchmarks in this workflow run.
+    '''),
+    cmake_flags=THINLTO_BUILD_PROFILE.cmake_flags,
+    profdata_file='${{env.benchmark_conv_dir}}/pgo_training/3c.profdata',
+    training_cmake_flags=RELEASE_BUILD_PROFILE.cmake_flags + [
+        '-DCMAKE_C_COMPILER=clang',
+        '-DCMAKE_CXX_COMPILER=clang++',
+        '-DLLVM_BUILD_INSTRUMENTED=IR',
+    ])
+
+# As with HEADER, we replace the placeholders ad-hoc rather than escape all the
+# curly braces of the shell code for an f-string.
+BUILD_3C_CMDS_TEMPLATE = '''\
+cd {build_dir}
+{cmake_flags}build_targets=({build_targets})
+# If an earlier run on this machine built the same commits with the
+# same flags, reuse that build instead of spending most of the
+# workflow's time rebuilding it.
+build_cache="${{github.workspace}}/depsfolder/actions/build-3c-cache.py --cache-dir ${{env.build_cache_dir}}"
+build_sources=(
+  --source ${{github.workspace}}/depsfolder/checkedc-clang
+  --source ${{github.workspace}}/depsfolder/checkedc-clang/llvm/projects/checkedc-wrapper/checkedc
+)
+cache_key=$($build_cache key "${build_sources[@]}" \\
+  --build-dir {build_dir} {cache_inputs}\\
+  -- "${cmake_flags[@]}" "${build_targets[@]}")
+if ! $build_cache restore "${build_sources[@]}" "$cache_key" {build_dir}; then
+  build_start=$SECONDS
+  cmake "${cmake_flags[@]}" ${{github.workspace}}/depsfolder/checkedc-clang/llvm
+  {ninja_std} "${build_targets[@]}"
+  $build_cache store --build-seconds $((SECONDS - build_start)) \\
+    --max-size ${{env.build_cache_max_size}} \\
+    "$cache_key" {build_dir}
+fi
+$build_cache report
+'''
+
+
+def build_3c_cmds(build_dir: str,
+                  profile: BuildProfile,
+                  build_targets: str,
+                  training: bool = False) -> str:
+    """Commands to build `build_targets` of 3c and clang with `profile` in
+    `build_dir`, or to restore them from the build cache. With `training`, for
+    the instrumented build that gathers the profile."""
+    cache_inputs = ''
+    if profile.profdata_file is not None and not training:
+        cache_inputs = f'--input {profile.profdata_file} '
+    return (BUILD_3C_CMDS_TEMPLATE.replace('{build_dir}', build_dir).replace(
+        '{cmake_flags}', profile.format_cmake_flags(training)).replace(
+            '{build_targets}', build_targets).replace(
+                '{cache_inputs}', cache_inputs).replace('{ninja_std}',
+                                                        ninja_std))
+
+
+@functools.lru_cache(maxsize=None)
+def format_step(name: str, condition: Optional[str], body: str) -> str:
+    condition_line = f'if: {condition}\n' if condition is not None else ''
+    step = f'- name: {name}\n' + indent(condition_line + body, 2 * ' ')
+    return indent(step, 6 * ' ')
+
+
+# Apparently Step has to be a dataclass in order for its field declaration to be
+# seen by the dataclass implementation in the subclasses.
+@dataclass
+class Step(ABC):
+    name: str
+
+    @abstractmethod
+    def format_body(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        # `condition` is declared in each subclass because a dataclass field
+        # with a default can't precede the subclasses' fields without one.
+        return format_step(self.name, self.condition, self.format_body())
+
+
+@dataclass
+class RunStep(Step):
+    run: str  # Trailing newline but not blank line
+    # GitHub Actions expression for the step's `if`, e.g., 'always()'.
+    condition: Optional[str] = None
+    # The benchmark component the step works on, if it works on one. Not
+    # rendered.
+    component: Optional[str] = None
+
+    def format_body(self):
+        return 'run: |\n' + indent(self.run, 2 * ' ')
+
+
+@dataclass
+class ActionStep(Step):
+    action_name: str
+    args: Dict[str, Any]
+    condition: Optional[str] = None
+    component: Optional[str] = None
+
+    def format_body(self):
+        formatted_args = ''.join(
+            f'{arg_key}: {arg_val}\n' for arg_key, arg_val in self.args.items())
+        return (f'uses: {self.action_name}\n'
+                'with:\n' + indent(formatted_args, 2 * ' '))
+
+
+@dataclass
+class Job:
+    job_id: str
+    name: str
+    needs: List[str]
+    steps: List[Step]
+    # If set, the job runs once for each entry of this list, which become the
+    # `matrix` context.
+    matrix: Optional[List[Dict[str, Any]]] = None
+    max_parallel: Optional[int] = None
+    # What the job works on, for `JobGraph`. Not rendered. A job has several
+    # benchmarks only with WorkflowConfig.merged_benchmarks.
+    benchmarks: List[str] = field(default_factory=list)
+    subvariants: List[str] = field(default_factory=list)
+    components: List[str] = field(default_factory=list)
+
+    def format_strategy(self):
+        if self.matrix is None:
+            return ''
+        # JSON values are valid YAML flow scalars, which saves us from worrying
+        # about quoting.
+        entries = ''.join(
+            '          - ' + '\n            '.join(
+                f'{key}: {json.dumps(value)}' for key, value in entry.items()) +
+            '\n' for entry in self.matrix)
+        # As with separate jobs, one subvariant failing shouldn't cancel the
+        # others.
+        return ('    strategy:\n'
+                '      fail-fast: false\n' +
+                (f'      max-parallel: {self.max_parallel}\n'
+                 if self.max_parallel is not None else '') +
+                '      matrix:\n'
+                '        include:\n' + entries)
+
+    def __str__(self):
+        needs = (self.needs[0]
+                 if len(self.needs) == 1 else f'[{", ".join(self.needs)}]')
+        # The blank line at the start is important: it gets us blank lines
+        # between jobs without a blank line at the very end of the workflow
+        # file. Similarly, we want blank lines between steps but not after the
+        # last step of the last job.
+        return (f'''\
+
+  {self.job_id}:
+    name: {self.name}
+    needs: {needs}
+    runs-on: self-hosted
+''' + self.format_strategy() + '    steps:\n' +
+                '\n'.join(str(s) for s in self.steps))
+
+
+def ensure_trailing_newline(s: str):
+    return s + '\n' if s != '' and not s.endswith('\n') else s
+
+
+# "Subvariant" = Variant object + the extra flags mentioned above. We use the
+# name "subvariant" even though the subvariants may be grouped by extra flag
+# value before variant. (Better naming ideas?)
+@dataclass
+class Subvariant:
+    name: str
+    friendly_name: str
+    # Extra convert_project.py arguments, each followed by ` \` and a newline.
+    convert_extra: str
+    # None in a matrix job, where it depends on the matrix entry.
+    alltypes: Optional[bool]
+    # From Variant.build_profile.
+    build_profile: Optional['BuildProfile'] = None
+
+    def to_matrix_entry(self) -> Dict[str, Any]:
+        return {
+            'subvariant': self.name,
+            'subvariant_friendly': self.friendly_name,
+            'alltypes': self.alltypes,
+            # A matrix value is substituted as a single line.
+            'convert_extra': self.convert_extra.replace(' \\\n', ' ').strip(),
+        }
+
+
+# Stands in for the subvariant in the steps of a matrix job.
+MATRIX_SUBVARIANT = Subvariant(
+    name='${{ matrix.subvariant }}',
+    friendly_name='${{ matrix.subvariant_friendly }}',
+    convert_extra='${{ matrix.convert_extra }} \\\n',
+    alltypes=None)
+
+
+def make_subvariant(expand_macros: bool, variant: Variant) -> Subvariant:
+    name = (('' if expand_macros else 'no_') + 'expand_macros_' +
+            ('' if variant.alltypes else 'no_') + 'alltypes')
+
+    convert_extra = ''
+    if variant.alltypes:
+        # Python argparse thinks `--extra-3c-arg -alltypes` is two options
+        # rather than an option with an argument.
+        convert_extra += '--extra-3c-arg=-alltypes \\\n'
+    # XXX: An argument could be made for putting this before -alltypes for
+    # consistency with the subvariant name. For now, I don't want the diff in
+    # the generated workflow.
+    if expand_macros:
+        convert_extra += '--expand_macros_before_conversion \\\n'
+
+    for earg in variant.extra_3c_args:
+        convert_extra += '--extra-3c-arg=' + earg + ' \\\n'
+        name += '_' + earg.lstrip('-').replace('-', '_')
+
+    friendly_name = (('' if expand_macros else 'not ') + 'macro-expanded, ' +
+                     ('' if variant.alltypes else 'no ') + '-alltypes' +
+                     variant.friendly_name_suffix)
+    if variant.build_profile is not None:
+        name += '_' + variant.build_profile.name
+        friendly_name += f', {variant.build_profile.name} build of 3c'
+    return Subvariant(name, friendly_name, convert_extra, variant.alltypes,
+                      variant.build_profile)
+
+
+def profile_builddir(profile: 'BuildProfile') -> str:
+    """Where the job for Variant.build_profile `profile` builds 3c."""
+    return f'${{{{github.workspace}}}}/b/{profile.name}'
+
+
+def subvariant_builddir(subvariant: Subvariant) -> str:
+    """The build directory of the 3c that converts `subvariant`."""
+    if subvariant.build_profile is None:
+        return '${{env.builddir}}'
+    return profile_builddir(subvariant.build_profile)
+
+
+def benchmark_build_cmds(binfo: BenchmarkInfo, parent_dir: str) -> str:
+    """Commands to extract, patch and build `binfo` in `parent_dir`."""
+    apply_patch_cmd = ''
+    if binfo.patch_dir:
+        apply_patch_cmd = dedent(f'''\
+            for i in ${{{{env.benchmark_tar_dir}}}}/{binfo.patch_dir}/*; do patch -s -p0 < $i; done
+        ''')
+    change_dir = dedent(f'''\
+        cd {binfo.dir_name}
+    ''')
+
+    return dedent(f'''\
+        mkdir -p {parent_dir}
+        cd {parent_dir}
+        tar -xvzf ${{{{env.benchmark_tar_dir}}}}/{binfo.dir_name}.tar.gz
+    ''') + apply_patch_cmd + change_dir + ensure_trailing_newline(
+        binfo.build_cmds) + component_build_cmds(binfo)
+
+
+def component_build_cmds(binfo: BenchmarkInfo) -> str:
+    """Commands to run the build_cmd of each component of `binfo` in parallel,
+    from the benchmark's main directory, and merge their compilation
+    databases."""
+    components = [c for c in binfo.components or [] if c.build_cmd is not None]
+    if not components:
+        return ''
+    # The same runner as for the conversions (see generate_benchmark_steps),
+    # with a build log per component.
+    scripts = [
+        f'component-build-scripts/{c.friendly_name or binfo.name}.sh'
+        for c in components
+    ]
+    write_scripts = ''.join(
+        f"cat >{script} <<'COMPONENT_SCRIPT_EOF'\n"
+        f'cd {c.subdir or "."}\n'
+        f'{ensure_trailing_newline(c.build_cmd)}'
+        'COMPONENT_SCRIPT_EOF\n' for c, script in zip(components, scripts))
+    databases = [f'{c.subdir or "."}/compile_commands.json' for c in components]
+    return ('mkdir -p component-build-scripts\n' + write_scripts + dedent('''\
+        ${{github.workspace}}/depsfolder/actions/run-component-scripts.py \\
+          --log-dir component-build-logs \\
+    ''') + ' \\\n'.join(f'  {script}' for script in scripts) + '\n' +
+            dedent('''\
+        ${{github.workspace}}/depsfolder/actions/merge-compile-commands.py \\
+          --output compile_commands.json \\
+    ''') + ' \\\n'.join(f'  {db}' for db in databases) + '\n')
+
+
+# With WorkflowConfig.prepare_benchmarks, each benchmark is extracted, patched
+# and built once per workflow run here, and each subvariant starts from a copy.
+PREPARED_BENCHMARKS_DIR = '${{env.benchmark_conv_dir}}/prepared'
+
+
+def generate_prepare_job(binfo: BenchmarkInfo,
+                         config: 'WorkflowConfig') -> Job:
+    build_cmds = benchmark_build_cmds(binfo, PREPARED_BENCHMARKS_DIR)
+    if config.compiler_cache:
+        # So that a CMake build directory copied from here uses the cache.
+        # (This build itself runs under bear, so it can't.)
+        build_cmds = with_compiler_cache(build_cmds)
+    return Job(f'prepare_{binfo.name}',
+               f'Prepare {binfo.friendly_name}', ['build_3c'],
+               [RunStep('Build ' + binfo.friendly_name, build_cmds)],
+               benchmarks=[binfo.name])
+
+
+def profile_build_job_id(profile: 'BuildProfile') -> str:
+    return f'build_3c_{profile.name}'
+
+
+# Where a BuildProfile with training_cmake_flags gathers its profile. (The clean
+# job empties benchmark_conv_dir.)
+PGO_TRAINING_DIR = '${{env.benchmark_conv_dir}}/pgo_training'
+# The training converts each benchmark once, with the settings the timing
+# workflow measures.
+PGO_TRAINING_SUBVARIANT = make_subvariant(True, Variant(alltypes=True))
+# The training conversions may run side by side, since nothing measures them.
+PGO_TRAINING_JOBS = 4
+# 3c finds the clang resource headers (stddef.h, etc.) and the Checked C
+# headers in lib/clang/<version>/include relative to its binary, so a build
+# of 3c alone can't convert anything.
+PROFILE_BUILD_TARGETS = '3c clang-resource-headers'
+
+
+def generate_profile_build_job(profile: 'BuildProfile',
+                               benchmark_infos: List[BenchmarkInfo]) -> Job:
+    """Generate the job that builds 3c with `profile` in
+    profile_builddir(profile) for the variants with that build_profile. If
+    the profile has training_cmake_flags, the job first builds an
+    instrumented 3c, converts each of `benchmark_infos` with it and merges
+    the resulting profiles into profile.profdata_file."""
+    build_dir = profile_builddir(profile)
+    steps: List[Step] = []
+    if profile.training_cmake_flags is not None:
+        instrumented_dir = f'{build_dir}-instrumented'
+        raw_profiles_dir = f'{PGO_TRAINING_DIR}/profraw'
+        logs_dir = f'{PGO_TRAINING_DIR}/logs'
+        steps.append(
+            RunStep(
+                'Build instrumented 3c',
+                f'rm -rf {instrumented_dir}\nmkdir -p {instrumented_dir}\n' +
+                build_3c_cmds(instrumented_dir, profile, PROFILE_BUILD_TARGETS,
+                              training=True)))
+        scripts = []
+        for binfo in benchmark_infos:
+            script = benchmark_build_cmds(binfo, PGO_TRAINING_DIR)
+            # %p keeps the profiles of concurrent conversions apart.
+            script += (f'export LLVM_PROFILE_FILE={raw_profiles_dir}/'
+                       f'{binfo.name}-%p.profraw\n')
+            for component in (binfo.components or
+                              [BenchmarkComponent(binfo.friendly_name)]):
+                component_dir = f'{PGO_TRAINING_DIR}/{binfo.dir_name}'
+                if component.subdir is not None:
+                    component_dir += '/' + component.subdir
+                script += component_convert_cmds(
+                    binfo, component, component_dir, PGO_TRAINING_SUBVARIANT,
+                    f'{instrumented_dir}/bin/3c')
+            scripts.append((binfo.name, script))
+        steps.append(
+            run_scripts_step('Convert the benchmarks with instrumented 3c',
+                             scripts, f'{PGO_TRAINING_DIR}/scripts', logs_dir,
+                             PGO_TRAINING_JOBS, 'TRAINING_SCRIPT_EOF'))
+        steps.append(
+            ActionStep('Upload training logs',
+                       'actions/upload-artifact@v2', {
+                           'name': f'{profile.name}_training_logs',
+                           'path': logs_dir,
+                           'retention-days': 5
+                       },
+                       condition='always()'))
+        steps.append(
+            RunStep(
+                'Merge the profiles',
+                f'llvm-profdata merge --output={profile.profdata_file} '
+                f'{raw_profiles_dir}/*.profraw\n'))
+    steps.append(
+        RunStep(
+            f'Build 3c ({profile.name})',
+            f'rm -rf {build_dir}\nmkdir -p {build_dir}\n' +
+            build_3c_cmds(build_dir, profile, PROFILE_BUILD_TARGETS)))
+    return Job(profile_build_job_id(profile), f'Build 3c ({profile.name})',
+               ['build_3c'], steps)
+
+
+def benchmark_job_needs(binfo: BenchmarkInfo, config: 'WorkflowConfig',
+                        subvariants: List[Subvariant]) -> List[str]:
+    """The `needs` of a job that tests `binfo` on `subvariants`."""
+    needs = [f'prepare_{binfo.name}'] if config.prepare_benchmarks else []
+    for subvariant in subvariants:
+        profile = subvariant.build_profile
+        if profile is not None and profile_build_job_id(profile) not in needs:
+            needs.append(profile_build_job_id(profile))
+    return needs or ['build_3c']
+
+
+def check_matrix_subvariants(subvariants: List[Subvariant]):
+    # The matrix entries don't say which 3c to run.
+    if any(sv.build_profile is not None for sv in subvariants):
+        raise ValueError('variants with a build_profile of their own cannot '
+                         'be in a matrix')
+
+
+# With WorkflowConfig.compiler_cache, the benchmark builds compile through
+# clang-cache.py with a cache shared by all the workflow runs on the machine.
+CLANG_CACHE = '${{github.workspace}}/depsfolder/actions/clang-cache.py'
+COMPILER_CACHE_DIR = '/home/github/3c-compiler-cache'
+COMPILER_CACHE_MAX_SIZE = '20G'
+COMPILER_CACHE_STATS_FNAME = 'clang_cache_stats.ndjson'
+# The compiler in the build commands of the benchmarks (e.g., make_checkedc),
+# but not the other tools in the same directory, such as clang-rename.
+BENCHMARK_CC_RE = re.compile(
+    r'(-DCMAKE_C_COMPILER=)?\$\{\{env\.builddir\}\}/bin/clang(?![-\w])')
+
+
+def with_compiler_cache(cmds: str) -> str:
+    """Return `cmds` with the benchmark compiler run through clang-cache.py."""
+
+    def wrap(match: 're.Match') -> str:
+        if match[1] is not None:
+            return f'-DCMAKE_C_COMPILER_LAUNCHER={CLANG_CACHE} {match[0]}'
+        return f'{CLANG_CACHE} {match[0]}'
+
+    return BENCHMARK_CC_RE.sub(wrap, cmds)
+
+
+def compiler_cache_env(stats_file: str) -> str:
+    return dedent(f'''\
+        export CLANG_CACHE_DIR={COMPILER_CACHE_DIR}
+        export CLANG_CACHE_MAX_SIZE={COMPILER_CACHE_MAX_SIZE}
+        export CLANG_CACHE_BASE_DIR=${{{{env.benchmark_conv_dir}}}}
+        export CLANG_CACHE_STATS={stats_file}
+    ''')
+
+
+# Each stats artifact of 3c records the build profile of 3c in this file, as
+# does each record of measure-step.py, so that tools don't compare stats of
+# different profiles (see perfstats.py).
+BUILD_PROFILE_FNAME = perfstats.BUILD_PROFILE_FNAME
+
+
+# With WorkflowConfig.measure_steps, each job records the time and memory use of
+# its build and conversion steps in this file in the subvariant directory.
+STEP_STATS_FNAME = 'step_stats.ndjson'
+
+
+def measure_run_step(step: RunStep, stats_file: str) -> RunStep:
+    """Return `step` with its script run under measure-step.py."""
+    # The quoted here-document passes the script through unchanged. We run it
+    # from a file rather than from standard input, which the build may read.
+    return dataclasses.replace(step,
+                               run=dedent(f'''\
+        step_script=$(mktemp)
+        trap 'rm -f "$step_script"' EXIT
+        cat >"$step_script" <<'MEASURED_STEP_EOF'
+    ''') + step.run + dedent(f'''\
+        MEASURED_STEP_EOF
+        ${{{{github.workspace}}}}/depsfolder/actions/measure-step.py \\
+          --output {stats_file} \\
+          --step {shlex.quote(step.name)} \\
+          -- bash -e "$step_script"
+    '''))
+
+
+def run_steps_script(steps: List[Step], shell_tests: Dict[str, str]) -> str:
+    """Return a bash script that runs the run steps among `steps` in order, as
+    the runner would, skipping the other steps. `shell_tests` maps each step
+    condition to a shell command with the same meaning."""
+    script = ''
+    for step in steps:
+        if not isinstance(step, RunStep):
+            continue
+        # Each step gets its own shell, as on the runner, so that its `cd` and
+        # traps don't leak into the next one.
+        body = (f'echo {shlex.quote("=== " + step.name)}\n'
+                f'(\n{ensure_trailing_newline(step.run)})\n')
+        if step.condition is not None:
+            body = f'if {shell_tests[step.condition]}; then\n{body}fi\n'
+        script += body
+    return script
+
+
+# Shell equivalents of the conditions of the post-conversion build steps, for
+# when those steps go into a script for run_steps_script.
+ALLTYPES_SHELL_TESTS = {
+    '${{ !matrix.alltypes }}': "[ '${{ matrix.alltypes }}' != true ]",
+    'matrix.alltypes': "[ '${{ matrix.alltypes }}' = true ]",
+}
+
+
+def run_scripts_step(name: str, scripts: List[Tuple[str, str]],
+                     scripts_dir: str, logs_dir: str, jobs: int,
+                     eof_marker: str) -> RunStep:
+    """A step that writes each (name, script) of `scripts` to `scripts_dir`
+    and runs them with run-component-scripts.py, up to `jobs` at once, with
+    their logs in `logs_dir`. `eof_marker` ends the here-documents holding the
+    scripts, so it must not appear in them on a line of its own."""
+    write_scripts = ''.join(
+        f"cat >{scripts_dir}/{script_name}.sh <<'{eof_marker}'\n" + script +
+        f'{eof_marker}\n' for script_name, script in scripts)
+    return RunStep(
+        name, f'mkdir -p {scripts_dir}\n' + write_scripts + dedent(f'''\
+            ${{{{github.workspace}}}}/depsfolder/actions/run-component-scripts.py \\
+              --jobs {jobs} \\
+              --log-dir {logs_dir} \\
+        ''') + ''.join(f'  {scripts_dir}/{script_name}.sh \\\n'
+                      for script_name, _ in scripts).rstrip(' \\\n') + '\n')
+
+
+def component_convert_cmds(binfo: BenchmarkInfo,
+                           component: BenchmarkComponent,
+                           component_dir: str,
+                           subvariant: Subvariant,
+                           three_c: Optional[str] = None) -> str:
+    """Commands to convert `component` of `binfo` in `component_dir` with the
+    3c binary `three_c` (default: the one for `subvariant`)."""
+    if three_c is None:
+        three_c = f'{subvariant_builddir(subvariant)}/bin/3c'
+
+    benchmark_convert_extra = (ensure_trailing_newline(binfo.convert_extra)
+                               if binfo.convert_extra is not None else '')
+    # yapf: disable
+    convert_flags = indent(
+        benchmark_convert_extra +
+        f'--prog_name {three_c} \\\n' +
+        subvariant.convert_extra +
+        '--project_path .' +
+        (f' \\\n--build_dir {component.build_dir}'
+         if component.build_dir is not None else '') +
+        '\n',
+        2 * ' ')
+    # yapf: enable
+    return dedent(f'''\
+        cd {component_dir}
+        ${{{{env.port_tools}}}}/convert_project.py \\
+    ''') + convert_flags
+
+
+def shard_subvariant_dir(subvariant: Subvariant, shard: Shard) -> str:
+    return f'${{{{env.benchmark_conv_dir}}}}/{subvariant.name}_shard_{shard.name}'
+
+
+def generate_benchmark_steps(binfo: BenchmarkInfo,
+                             subvariant: Subvariant,
+                             config: 'WorkflowConfig',
+                             shard: Optional[Shard] = None,
+                             merge_shards: bool = False) -> List[Step]:
+    """With `shard`, only convert that shard of `binfo`. With `merge_shards`,
+    build the merged output of the shards' jobs instead of converting."""
+    subvariant_dir = '${{env.benchmark_conv_dir}}/' + subvariant.name
+    # The name for the artifacts of this job.
+    job_label = binfo.name
+    if shard is not None:
+        subvariant_dir = shard_subvariant_dir(subvariant, shard)
+        job_label += '.' + shard.name
+    build_converted_cmd = binfo.build_converted_cmd.rstrip('\n')
+    # When we're generating stats, also have the filter tally the errors it
+    # sees, so that we can get error counts without re-reading the logs.
+    error_stats_fname = 'bounds_inference_errors.json'
+
+    benchmark_dir = f'{subvariant_dir}/{binfo.dir_name}'
+    step_stats_file = f'{subvariant_dir}/{job_label}_{STEP_STATS_FNAME}'
+
+    compiler_cache_stats_file = (f'{subvariant_dir}/{job_label}_'
+                                 f'{COMPILER_CACHE_STATS_FNAME}')
+
+    # The stats record the build profile of the 3c that converts this
+    # subvariant.
+    build_profile_name = '${{env.build_profile}}'
+    if subvariant.build_profile is not None:
+        build_profile_name = subvariant.build_profile.name
+
+    def measured(step: RunStep) -> RunStep:
+        if not config.measure_steps:
+            return step
+        step = measure_run_step(step, step_stats_file)
+        if subvariant.build_profile is not None:
+            # measure-step.py takes the profile from the environment.
+            step = dataclasses.replace(
+                step,
+                run=f'export build_profile={build_profile_name}\n' + step.run)
+        return step
+
+    def compiler_cached(step: RunStep) -> RunStep:
+        if not config.compiler_cache:
+            return step
+        return dataclasses.replace(
+            step,
+            run=compiler_cache_env(compiler_cache_stats_file) +
+            with_compiler_cache(step.run))
+
+    if config.prepare_benchmarks:
+        steps = [
+            measured(
+                RunStep(
+                    'Copy prepared ' + binfo.friendly_name,
+                    dedent(f'''\
+                        ${{{{github.workspace}}}}/depsfolder/actions/clone-benchmark-tree.py \\
+                          {PREPARED_BENCHMARKS_DIR}/{binfo.dir_name} \\
+                          {benchmark_dir}
+                    ''')))
+        ]
+    else:
+        steps = [
+            measured(
+                compiler_cached(
+                    RunStep('Build ' + binfo.friendly_name,
+                            benchmark_build_cmds(binfo, subvariant_dir))))
+        ]
+
+    components = binfo.components
+    if components is None:
+        components = [BenchmarkComponent(binfo.friendly_name)]
+
+    if shard is not None or merge_shards:
+        component = components[0]
+        component_dir = benchmark_dir
+        if component.subdir is not None:
+            component_dir += '/' + component.subdir
+        if shard is not None:
+            compile_commands = (f'{component.build_dir or "."}/'
+                                'compile_commands.json')
+            shard_paths = json.dumps({s.name: s.paths for s in binfo.shards})
+            steps.append(
+                RunStep(
+                    f'Select shard {shard.name}',
+                    dedent(f'''\
+                        cd {component_dir}
+                        ${{{{github.workspace}}}}/depsfolder/actions/shard-compile-commands.py \\
+                          --project-dir . \\
+                          --shards {shlex.quote(shard_paths)} \\
+                          --select {shard.name} \\
+                          {compile_commands}
+                    ''')))
+        else:
+            component_subdir = ('' if component.subdir is None else
+                                '/' + component.subdir)
+            shard_output_dirs = ''.join(
+                f'  {shard_subvariant_dir(subvariant, s)}/{binfo.dir_name}'
+                f'{component_subdir}/out.checked \\\n' for s in binfo.shards)
+            steps.append(
+                RunStep(
+                    'Merge shards',
+                    dedent(f'''\
+                        cd {component_dir}
+                        ${{{{github.workspace}}}}/depsfolder/actions/merge-shards.py \\
+                          --output out.checked \\
+                    ''') + shard_output_dirs.rstrip(' \\\n') + '\n'))
+
+    # In a matrix job whose entries differ in alltypes, we generate the
+    # post-conversion build step both ways and let the matrix entry pick one.
+    if subvariant.alltypes is None:
+        alltypes_cases = [(False, '${{ !matrix.alltypes }}'),
+                          (True, 'matrix.alltypes')]
+    else:
+        alltypes_cases = [(subvariant.alltypes, None)]
+
+    # A shard's job only converts, and the job that merges the shards only
+    # builds.
+    repeat = 0 if merge_shards else config.repeat
+    # time-conversion.py runs the warmup and timed conversions in one step,
+    # and as many of the timed ones as it takes, so we upload the stats of
+    # those that it ran.
+    timed = config.timing_ci_width is not None and repeat > 0
+    warmup_iterations = (0 if merge_shards or timed else
+                         config.warmup_iterations)
+    build_cases = [] if shard is not None else alltypes_cases
+
+    defer_failure = (len(components) > 1)
+    failed_components_fname = f'{benchmark_dir}/failed-components-list.txt'
+    parallel = (config.parallel_components > 1 and len(components) > 1 and
+                shard is None and not merge_shards)
+    # (Component name, script running its run steps) for each component.
+    component_scripts = []
+    deferred_action_steps: List[Step] = []
+    for component in components:
+        component_steps: List[Step] = []
+        component_dir = benchmark_dir
+        if component.subdir is not None:
+            component_dir += '/' + component.subdir
+        component_friendly_name = (component.friendly_name or
+                                   binfo.friendly_name)
+        if shard is not None:
+            # Keep the shards' stats artifacts apart. (The artifact name must
+            # still parse in perfstats.py.)
+            component_friendly_name += '.' + shard.name
+
+        convert_cmds = component_convert_cmds(binfo, component, component_dir,
+                                              subvariant)
+        if timed:
+            # The conversion commands `cd`, so we pass them to
+            # time-conversion.py as a script, as measure_run_step does. It
+            # copies the stats of each timed run from the component
+            # directory, so it runs there.
+            timing_args = [
+                f'--output {step_stats_file}',
+                f'--step {shlex.quote("Convert " + component_friendly_name)}',
+            ]
+            if config.generate_stats:
+                timing_args.append(
+                    f'--stats-dir {component_dir}/3c_performance_stats')
+            timing_args += [
+                f'--build-profile {build_profile_name}',
+                f'--warmup {config.warmup_iterations}',
+                f'--max-runs {repeat}',
+                f'--ci-width {config.timing_ci_width}',
+            ]
+            component_steps.append(
+                RunStep(
+                    'Time the conversion of ' + component_friendly_name,
+                    dedent(f'''\
+                        cd {component_dir}
+                        convert_script=$(mktemp)
+                        trap 'rm -f "$convert_script"' EXIT
+                        cat >"$convert_script" <<'TIMED_CONVERSION_EOF'
+                    ''') + convert_cmds + dedent('''\
+                        TIMED_CONVERSION_EOF
+                        ${{github.workspace}}/depsfolder/actions/time-conversion.py \\
+                    ''') + ''.join(f'  {arg} \\\n' for arg in timing_args) +
+                    '  -- bash -e "$convert_script"\n'))
+
+        # Warmup conversions warm up the caches (file system, etc.) so that
+        # the timed iterations are more comparable to each other. We don't
+        # keep their stats.
+        for warmup_iter in range(1, warmup_iterations + 1):
+            warmup_suffix = (f' {warmup_iter}'
+                             if config.warmup_iterations > 1 else '')
+            component_steps.append(
+                measured(
+                    RunStep(
+                        f'Convert {component_friendly_name} (warmup{warmup_suffix})',
+                        convert_cmds)))
+
+        for curr_iter in range(1, repeat + 1):
+            # With a single iteration, leave the iteration number out of the
+            # step, directory and artifact names.
+            iter_step_suffix = f' {curr_iter}' if config.repeat > 1 else ''
+            iter_suffix = f'_{curr_iter}' if config.repeat > 1 else ''
+            if not timed:
+                component_steps.append(
+                    measured(
+                        RunStep(
+                            'Convert ' + component_friendly_name +
+                            iter_step_suffix, convert_cmds)))
+
+            if config.generate_stats:
+                perf_dir_name = f'3c_performance_stats{iter_suffix}/'
+                if not timed:
+                    component_steps.append(
+                        RunStep(
+                            'Copy 3c stats of ' + component_friendly_name +
+                            iter_step_suffix,
+                            dedent(f'''\
+                                cd {component_dir}
+                                mkdir {perf_dir_name}
+                                cp *.json {perf_dir_name}
+                                echo '{{"name": "{build_profile_name}"}}' >{perf_dir_name}{BUILD_PROFILE_FNAME}
+                            ''')))
+                # Same idea as the job name but using the component name
+                # instead of the benchmark name.
+                perf_artifact_name = (f'{component_friendly_name}_'
+                                      f'{subvariant.name}{iter_suffix}')
+                perf_dir = os.path.join(component_dir, perf_dir_name)
+                upload_args = {'name': perf_artifact_name, 'path': perf_dir}
+                if timed:
+                    # time-conversion.py stopped before this iteration.
+                    upload_args['if-no-files-found'] = 'ignore'
+                upload_args['retention-days'] = 5
+                component_steps.append(
+                    ActionStep(
+                        'Upload 3c stats of ' + component_friendly_name +
+                        iter_step_suffix, 'actions/upload-artifact@v2',
+                        upload_args))
+
+        defer_failure_step = (' (defer failure)' if defer_failure else '')
+        defer_failure_code = (f'''\
+ || echo {component_friendly_name} >>{failed_components_fname}'''
+                              if defer_failure else '')
+        for alltypes, alltypes_condition in build_cases:
+            at_filter_step = (' (filter bounds inference errors)'
+                              if alltypes else '')
+            # By default, this shell script runs with the `pipefail` option
+            # off. This is important so that the build failure doesn't cause
+            # the entire script to fail regardless of the result of
+            # filter-bounds-inference-errors.py. But we might want to turn on
+            # `pipefail` in general, in which case we'd need to turn it back
+            # off here.
+            #
+            # --benchmark selects the filter rules that apply to this
+            # benchmark (see bounds-inference-filter-rules.ini).
+            at_filter_code = ('''\
+ 2>&1 | ${{github.workspace}}/depsfolder/actions/filter-bounds-inference-errors.py'''
+                              f' --benchmark {binfo.name}' if alltypes else '')
+            collect_error_stats = alltypes and config.generate_stats
+            component_steps.append(measured(compiler_cached(
+                RunStep(
+                    'Build converted ' + component_friendly_name +
+                    at_filter_step + defer_failure_step,
+                    # convert_project.py sets -output-dir=out.checked as
+                    # standard.
+                    dedent(f'''\
+                        cd {component_dir}
+                        if [ -e "out.checked" ]; then cp -r out.checked/* . && rm -r out.checked; fi
+                    ''') +
+                    #
+                    (f'cd {component.build_dir}\n'
+                     if component.build_dir is not None else '') +
+                    f'{build_converted_cmd}{at_filter_code}' +
+                    (f' --stats-json {component_dir}/{error_stats_fname}'
+                     if collect_error_stats else '') +
+                    f'{defer_failure_code}\n',
+                    condition=alltypes_condition))))
+
+            if collect_error_stats:
+                component_steps.append(
+                    ActionStep(
+                        'Upload bounds inference error stats of ' +
+                        component_friendly_name,
+                        'actions/upload-artifact@v2', {
+                            'name': (f'{component_friendly_name}_'
+                                     f'{subvariant.name}'
+                                     '_bounds_inference_errors'),
+                            'path': f'{component_dir}/{error_stats_fname}',
+                            'retention-days': 5
+                        },
+                        # The stats are most interesting when the build
+                        # failed.
+                        condition=('always()' if alltypes_condition is None
+                                   else f'always() && {alltypes_condition}')))
+
+        for step in component_steps:
+            step.component = component.friendly_name or binfo.friendly_name
+        if parallel:
+            component_scripts.append(
+                (component_friendly_name,
+                 run_steps_script(component_steps, ALLTYPES_SHELL_TESTS)))
+            deferred_action_steps.extend(
+                s for s in component_steps if isinstance(s, ActionStep))
+        else:
+            steps.extend(component_steps)
+
+    if parallel:
+        logs_dir = f'{benchmark_dir}/component-logs'
+        steps.append(
+            run_scripts_step(
+                'Convert and build components in parallel' +
+                (' (defer failure)' if defer_failure else ''),
+                component_scripts, f'{benchmark_dir}/component-scripts',
+                logs_dir, config.parallel_components, 'COMPONENT_SCRIPT_EOF'))
+        steps.extend(deferred_action_steps)
+        steps.append(
+            ActionStep('Upload component logs',
+                       'actions/upload-artifact@v2', {
+                           'name': f'{job_label}_{subvariant.name}_component_logs',
+                           'path': logs_dir,
+                           'retention-days': 5
+                       },
+                       condition='always()'))
+
+    if defer_failure:
+        steps.append(
+            RunStep(
+                'Check for deferred post-conversion build failures', f'''\
+if [ -e {failed_components_fname} ]; then
+    echo 'Failed components (see previous post-conversion build steps):'
+    cat {failed_components_fname}
+    exit 1
+fi
+'''))
+
+    if config.compiler_cache:
+        steps.append(
+            RunStep('Report compiler cache hits',
+                    f'{CLANG_CACHE} --report {compiler_cache_stats_file}\n',
+                    condition='always()'))
+
+    if config.measure_steps or timed:
+        steps.append(
+            ActionStep('Upload step stats', 'actions/upload-artifact@v2', {
+                'name': f'{job_label}_{subvariant.name}_step_stats',
+                'path': step_stats_file,
+                'retention-days': 5
+            },
+                       condition='always()'))
+
+    return steps
+
+
+def generate_benchmark_job(binfo: BenchmarkInfo, expand_macros: bool,
+                           variant: Variant,
+                           config: 'WorkflowConfig') -> Optional[Job]:
+    # Check if this benchmark is allowed for the given varient
+    if not binfo.is_allowed(variant):
+        return None
+    subvariant = make_subvariant(expand_macros, variant)
+    return Job(f'test_{binfo.name}_{subvariant.name}',
+               f'Test {binfo.friendly_name} ({subvariant.friendly_name})',
+               benchmark_job_needs(binfo, config, [subvariant]),
+               generate_benchmark_steps(binfo, subvariant, config),
+               benchmarks=[binfo.name],
+               subvariants=[subvariant.name],
+               components=binfo.component_names())
+
+
+def generate_sharded_benchmark_jobs(binfo: BenchmarkInfo, expand_macros: bool,
+                                    variant: Variant,
+                                    config: 'WorkflowConfig') -> List[Job]:
+    """Like `generate_benchmark_job`, but generate a job for each shard of
+    `binfo` and a job that merges and builds their output."""
+    if not binfo.is_allowed(variant):
+        return []
+    if binfo.components is not None and len(binfo.components) > 1:
+        raise ValueError(f'{binfo.name}: a benchmark with several components '
+                         'cannot be sharded')
+    if sum(s.paths is None for s in binfo.shards) > 1:
+        raise ValueError(f'{binfo.name}: only one shard may take the '
+                         'remaining translation units')
+    subvariant = make_subvariant(expand_macros, variant)
+    job_id = f'test_{binfo.name}_{subvariant.name}'
+    jobs = [
+        Job(f'{job_id}_shard_{shard.name}',
+            f'Test {binfo.friendly_name} ({subvariant.friendly_name}, '
+            f'shard {shard.name})',
+            benchmark_job_needs(binfo, config, [subvariant]),
+            generate_benchmark_steps(binfo, subvariant, config, shard=shard),
+            benchmarks=[binfo.name],
+            subvariants=[subvariant.name],
+            components=binfo.component_names()) for shard in binfo.shards
+    ]
+    jobs.append(
+        Job(job_id,
+            f'Test {binfo.friendly_name} ({subvariant.friendly_name})',
+            [job.job_id for job in jobs],
+            generate_benchmark_steps(binfo,
+                                     subvariant,
+                                     config,
+                                     merge_shards=True),
+            benchmarks=[binfo.name],
+            subvariants=[subvariant.name],
+            components=binfo.component_names()))
+    return jobs
+
+
+def generate_benchmark_matrix_job(binfo: BenchmarkInfo,
+                                  config: 'WorkflowConfig') -> Optional[Job]:
+    """Like `generate_benchmark_job`, but generate one job for all the
+    subvariants of `binfo` in `config`, using a matrix strategy."""
+    subvariants = [
+        make_subvariant(expand_macros, variant)
+        for expand_macros in config.expand_macros_values
+        for variant in config.variants
+        if binfo.is_allowed(variant)
+    ]
+    if not subvariants:
+        return None
+    check_matrix_subvariants(subvariants)
+    alltypes_values = {sv.alltypes for sv in subvariants}
+    matrix_subvariant = dataclasses.replace(
+        MATRIX_SUBVARIANT,
+        alltypes=(next(iter(alltypes_values))
+                  if len(alltypes_values) == 1 else None))
+    return Job(f'test_{binfo.name}',
+               f'Test {binfo.friendly_name} ({MATRIX_SUBVARIANT.friendly_name})',
+               benchmark_job_needs(binfo, config, subvariants),
+               generate_benchmark_steps(binfo, matrix_subvariant, config),
+               matrix=[sv.to_matrix_entry() for sv in subvariants],
+               max_parallel=config.max_parallel,
+               benchmarks=[binfo.name],
+               subvariants=[sv.name for sv in subvariants],
+               components=binfo.component_names())
+
+
+def merged_benchmark_job(binfos: List[BenchmarkInfo], subvariant: Subvariant,
+                         config: 'WorkflowConfig',
+                         subvariants: List[Subvariant]) -> Job:
+    """Generate one job that tests all of `binfos` on `subvariant` (see
+    WorkflowConfig.merged_benchmarks). `subvariants` are those of the job:
+    `subvariant` itself, or the entries of the matrix it stands for."""
+    names = [binfo.name for binfo in binfos]
+    friendly_names = ', '.join(binfo.friendly_name for binfo in binfos)
+    job_id = 'test_' + '_'.join(names)
+    if subvariant.name != MATRIX_SUBVARIANT.name:
+        job_id += '_' + subvariant.name
+    subvariant_dir = '${{env.benchmark_conv_dir}}/' + subvariant.name
+    logs_dir = f'{subvariant_dir}/merged-benchmark-logs'
+    # Each benchmark's run steps go into a script of their own, so that a
+    # failure stops only that benchmark. Its other steps (artifact uploads and
+    # steps that run regardless) follow the scripts and run regardless too,
+    # so that we get the artifacts of the benchmarks that succeeded.
+    scripts = []
+    deferred_steps: List[Step] = []
+    needs: List[str] = []
+    for binfo in binfos:
+        steps = generate_benchmark_steps(binfo, subvariant, config)
+        script_steps = [
+            s for s in steps if isinstance(s, RunStep) and
+            (s.condition is None or s.condition in ALLTYPES_SHELL_TESTS)
+        ]
+        scripts.append((binfo.name,
+                        run_steps_script(script_steps, ALLTYPES_SHELL_TESTS)))
+        for step in steps:
+            if any(step is s for s in script_steps):
+                continue
+            if binfo.friendly_name not in step.name:
+                step = dataclasses.replace(
+                    step, name=f'{step.name} ({binfo.friendly_name})')
+            deferred_steps.append(
+                dataclasses.replace(step,
+                                    condition=step.condition or 'always()'))
+        needs.extend(n for n in benchmark_job_needs(binfo, config, subvariants)
+                     if n not in needs)
+    steps = [
+        run_scripts_step(f'Test {friendly_names}', scripts,
+                         f'{subvariant_dir}/merged-benchmark-scripts',
+                         logs_dir, max(1, config.parallel_components),
+                         'BENCHMARK_SCRIPT_EOF')
+    ]
+    steps.extend(deferred_steps)
+    steps.append(
+        ActionStep('Upload benchmark logs',
+                   'actions/upload-artifact@v2', {
+                       'name': (f'{"_".join(names)}_{subvariant.name}'
+                                '_benchmark_logs'),
+                       'path': logs_dir,
+                       'retention-days': 5
+                   },
+                   condition='always()'))
+    return Job(job_id,
+               f'Test {friendly_names} ({subvariant.friendly_name})',
+               needs,
+               steps,
+               benchmarks=names,
+               subvariants=[sv.name for sv in subvariants],
+               components=[
+                   c for binfo in binfos for c in binfo.component_names()
+               ])
+
+
+def generate_merged_benchmark_jobs(binfos: List[BenchmarkInfo],
+                                   config: 'WorkflowConfig') -> List[Job]:
+    """Like `generate_benchmark_job`, but for all of `binfos` at once, with
+    one job per subvariant (or a single matrix job) for those that are allowed
+    for it."""
+    if config.use_shards and any(b.shards is not None for b in binfos):
+        raise ValueError('sharded benchmarks cannot be merged')
+    if config.use_matrix:
+        subvariants = [
+            make_subvariant(expand_macros, variant)
+            for expand_macros in config.expand_macros_values
+            for variant in config.variants
+            if all(binfo.is_allowed(variant) for binfo in binfos)
+        ]
+        if any(
+                binfo.is_allowed(variant) != binfos[0].is_allowed(variant)
+                for binfo in binfos for variant in config.variants):
+            raise ValueError('with use_matrix, the merged benchmarks must be '
+                             'allowed for the same variants')
+        if not subvariants:
+            return []
+        check_matrix_subvariants(subvariants)
+        alltypes_values = {sv.alltypes for sv in subvariants}
+        matrix_subvariant = dataclasses.replace(
+            MATRIX_SUBVARIANT,
+            alltypes=(next(iter(alltypes_values))
+                      if len(alltypes_values) == 1 else None))
+        job = merged_benchmark_job(binfos, matrix_subvariant, config,
+                                   subvariants)
+        job.matrix = [sv.to_matrix_entry() for sv in subvariants]
+        job.max_parallel = config.max_parallel
+        return [job]
+    jobs = []
+    for expand_macros in config.expand_macros_values:
+        for variant in config.variants:
+            allowed = [b for b in binfos if b.is_allowed(variant)]
+            if len(allowed) == 1:
+                jobs.append(
+                    generate_benchmark_job(allowed[0], expand_macros, variant,
+                                           config))
+            elif allowed:
+                subvariant = make_subvariant(expand_macros, variant)
+                jobs.append(
+                    merged_benchmark_job(allowed, subvariant, config,
+                                         [subvariant]))
+    return jobs
+
+
+@dataclass
+class WorkflowConfig:
+    filename: str
+    friendly_name: str
+    variants: List[Variant]
+    # Warning: If we have multiple scheduled workflows, the times need to be
+    # well-separated because of
+    # https://github.com/correctcomputation/actions/issues/6 .
+    cron_timestamp: Optional[str] = None
+    generate_stats: bool = False
+    # Values of the expand_macros flag to combine with each variant.
+    expand_macros_values: List[bool] = field(
+        default_factory=lambda: [False, True])
+    # Number of times to run each conversion, e.g., to measure its running
+    # time. With more than one iteration, each iteration's stats are uploaded
+    # as a separate artifact, with the iteration number appended to the name.
+    # With timing_ci_width, this is the maximum.
+    repeat: int = 1
+    # Number of extra conversions to run before the counted ones and discard.
+    warmup_iterations: int = 0
+    # Convert each component with time-conversion.py, which pins 3c to the
+    # isolated CPUs, runs the warmup_iterations and then repeats the
+    # conversion until the confidence interval of its median time is at most
+    # this fraction of it wide, or `repeat` times, recording each run in the
+    # step stats. Only the iterations that it ran have stats artifacts.
+    timing_ci_width: Optional[float] = None
+    # Generate one job per benchmark with a matrix strategy over the
+    # subvariants instead of one job per benchmark and subvariant. This makes
+    # the workflow file several times smaller, so it's faster for GitHub to
+    # parse and dispatch.
+    use_matrix: bool = False
+    # With use_matrix, the maximum number of subvariants of each benchmark
+    # that may run at once, i.e., the number of runner slots each benchmark
+    # may occupy. (GitHub has no equivalent limit for a whole workflow.)
+    max_parallel: Optional[int] = None
+    # Extract, patch and build each benchmark once, in a `prepare_*` job, and
+    # give each subvariant a copy-on-write clone of the result (see
+    # clone-benchmark-tree.py) instead of building the benchmark again for
+    # every subvariant.
+    prepare_benchmarks: bool = False
+    # Run the build and conversion steps under measure-step.py and upload the
+    # resulting per-step time and memory records as an artifact.
+    measure_steps: bool = False
+    # Convert the benchmarks that declare shards one shard per job, in
+    # parallel, and merge the results.
+    use_shards: bool = False
+    # In a job for a benchmark with several components, convert and build up
+    # to this many components at once (see run-component-scripts.py), each
+    # with its own log, rather than one after another in separate steps.
+    # Concurrent conversions disturb each other's timings, so leave this off
+    # where we measure them.
+    parallel_components: int = 0
+    # Compile the benchmarks through clang-cache.py, which reuses the object
+    # files of identical compilations from earlier jobs and workflow runs.
+    compiler_cache: bool = False
+    # How to build 3c and clang.
+    build_profile: BuildProfile = DEBUG_BUILD_PROFILE
+    # Emit the benchmark jobs in order of decreasing expected time to finish
+    # them and the jobs that need them (the critical path), according to the
+    # durations recorded for this workflow in JOB_DURATIONS_FILE. The runner
+    # picks up jobs that are ready in roughly the order the workflow lists
+    # them, so the longest ones start first instead of holding up the end of
+    # the run (LPT scheduling). Jobs without a recorded duration keep their
+    # order after those with one.
+    order_by_duration: bool = False
+    # Test these benchmarks (by name), each of which takes little time, in one
+    # job per subvariant to save the runner's overhead per job. Each
+    # benchmark still runs in a script of its own with its own log (see
+    # run-component-scripts.py), and the job lists the ones that failed.
+    merged_benchmarks: List[str] = field(default_factory=list)
+
+
+workflow_file_configs = [
+    WorkflowConfig(filename="main",
+                   friendly_name="3C benchmark tests",
+                   variants=[Variant(alltypes=False),
+                             Variant(alltypes=True)],
+                   cron_timestamp="0 5 * * *",
+                   measure_steps=True,
+                   parallel_components=4,
+                   compiler_cache=True,
+                   order_by_duration=True,
+                   merged_benchmarks=['vsftpd', 'Parson', 'TinyBigNum']),
+    WorkflowConfig(
+        filename="exhaustivestats",
+        friendly_name="Exhaustive testing and Performance Stats",
+        variants=[
+            Variant(alltypes=False),
+            Variant(alltypes=True)
+        ],
+        generate_stats=True,
+        order_by_duration=True),
+    WorkflowConfig(
+        filename="exhaustiveleastgreatest",
+        friendly_name="Exhaustive testing and Performance Stats (Least and Greatest)",
+        variants=[
+            Variant(alltypes=True,
+                    extra_3c_args=['-only-g-sol'],
+                    friendly_name_suffix=', greatest solution',
+                    is_comparative_varient=True),
+            Variant(alltypes=True,
+                    extra_3c_args=['-only-l-sol'],
+                    friendly_name_suffix=', least solution',
+                    is_comparative_varient=True),
+        ],
+        generate_stats=True,
+        order_by_duration=True),
+    WorkflowConfig(
+        filename="exhaustiveccured",
+        friendly_name="Exhaustive testing and Performance Stats (CCured)",
+        variants=[
+            Variant(alltypes=True,
+                    extra_3c_args=['-disable-rds'],
+                    friendly_name_suffix=', CCured solution',
+                    is_comparative_varient=True),
+            Variant(alltypes=True,
+                    extra_3c_args=['-disable-fnedgs'],
+                    friendly_name_suffix=', FuncRevEdges solution',
+                    is_comparative_varient=True),
+        ],
+        generate_stats=True,
+        order_by_duration=True),
+    WorkflowConfig(
+        filename="timing",
+        friendly_name="Exhaustive testing and Timing",
+        variants=[
+            Variant(alltypes=True),
+            # To compare with the default, the thinlto profile, which differs
+            # from pgo only in the profile.
+            Variant(alltypes=True, build_profile=PGO_BUILD_PROFILE),
+        ],
+        generate_stats=True,
+        expand_macros_values=[True],
+        repeat=10,
+        warmup_iterations=1,
+        timing_ci_width=0.02,
+        measure_steps=True,
+        build_profile=THINLTO_BUILD_PROFILE),
+]
+
+# Seconds each benchmark job took in recent runs, by workflow file name
+# without .yml and then job ID, for WorkflowConfig.order_by_duration. See
+# update-job-durations.py.
+JOB_DURATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'job-durations.json')
+
+
+@functools.lru_cache(maxsize=None)
+def load_job_durations(path: str = JOB_DURATIONS_FILE
+                      ) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path) as durations_file:
+            return json.load(durations_file)
+    except FileNotFoundError:
+        return {}
+
+
+def expected_job_seconds(job: Job, durations: Dict[str, float]) -> float:
+    if job.job_id in durations:
+        return durations[job.job_id]
+    # For a job with no record (e.g., one whose benchmarks were just merged),
+    # assume each benchmark takes as long as its longest recorded test job.
+    total = 0.0
+    for benchmark in job.benchmarks:
+        prefix = f'test_{benchmark}'
+        total += max((seconds for job_id, seconds in durations.items()
+                      if job_id == prefix or job_id.startswith(prefix + '_')),
+                     default=0.0)
+    return total
+
+
+def order_jobs_by_critical_path(jobs: List[Job],
+                                durations: Dict[str, float]) -> List[Job]:
+    """Return `jobs` sorted by decreasing length of the longest chain of jobs
+    starting with each, by `durations`: for independent jobs, longest first.
+    A job always comes before the jobs that need it, and the sort is stable,
+    so jobs with the same priority keep their order."""
+    job_ids = {job.job_id for job in jobs}
+    dependents: Dict[str, List[Job]] = {}
+    for job in jobs:
+        for need in job.needs:
+            if need in job_ids:
+                dependents.setdefault(need, []).append(job)
+    chain_seconds: Dict[str, float] = {}
+
+    def chain(job: Job) -> float:
+        if job.job_id not in chain_seconds:
+            chain_seconds[job.job_id] = expected_job_seconds(job, durations) + \
+                max((chain(d) for d in dependents.get(job.job_id, [])),
+                    default=0.0)
+        return chain_seconds[job.job_id]
+
+    return sorted(jobs, key=lambda job: -chain(job))
+
+
+def generate_benchmark_jobs(
+        config: WorkflowConfig,
+        benchmark_infos: Optional[List[BenchmarkInfo]] = None
+) -> Iterator[Job]:
+    """Yield the jobs of the workflow for `config` that follow the fixed jobs
+    in HEADER, in order. `benchmark_infos` defaults to `benchmarks`."""
+    jobs = generate_benchmark_jobs_in_catalog_order(config, benchmark_infos)
+    if config.order_by_duration:
+        jobs = order_jobs_by_critical_path(
+            list(jobs),
+            load_job_durations().get(config.filename, {}))
+    yield from jobs
+
+
+def generate_benchmark_jobs_in_catalog_order(
+        config: WorkflowConfig,
+        benchmark_infos: Optional[List[BenchmarkInfo]] = None
+) -> Iterator[Job]:
+    """Like `generate_benchmark_jobs`, but in the order of `benchmark_infos`,
+    regardless of config.order_by_duration."""
+    if benchmark_infos is None:
+        benchmark_infos = benchmarks
+    # (Another list of benchmarks may leave out some of the merged ones.)
+    unknown = set(config.merged_benchmarks) - {b.name for b in benchmark_infos}
+    if unknown and benchmark_infos is benchmarks:
+        raise ValueError(f'unknown merged benchmarks: {", ".join(unknown)}')
+    merged = [b for b in benchmark_infos if b.name in config.merged_benchmarks]
+    profiles = {
+        v.build_profile.name: v.build_profile
+        for v in config.variants
+        if v.build_profile is not None
+    }
+    for profile in profiles.values():
+        yield generate_profile_build_job(profile, benchmark_infos)
+    for binfo in benchmark_infos:
+        if binfo in merged:
+            # The merged jobs go where the first merged benchmark's would,
+            # after the jobs they need.
+            if binfo is merged[0]:
+                if config.prepare_benchmarks:
+                    yield from (generate_prepare_job(b, config)
+                                for b in merged if any(
+                                    b.is_allowed(v) for v in config.variants))
+                yield from generate_merged_benchmark_jobs(merged, config)
+            continue
+        if config.prepare_benchmarks and any(
+                binfo.is_allowed(v) for v in config.variants):
+            yield generate_prepare_job(binfo, config)
+        if config.use_shards and binfo.shards is not None:
+            # A matrix can't express the merge job's dependence on the
+            # shards of the same subvariant, so we always unroll these.
+            for expand_macros in config.expand_macros_values:
+                for variant in config.variants:
+                    yield from generate_sharded_benchmark_jobs(
+                        binfo, expand_macros, variant, config)
+            continue
+        if config.use_matrix:
+            job = generate_benchmark_matrix_job(binfo, config)
+            if job is not None:
+                yield job
+            continue
+        for expand_macros in config.expand_macros_values:
+            for variant in config.variants:
+                job = generate_benchmark_job(binfo, expand_macros, variant,
+                                             config)
+                if job is not None:
+                    yield job
+
+
+def format_header(config: WorkflowConfig) -> str:
+    """HEADER for `config`, with the content hash line still to fill in."""
+    # format header using workflow name and schedule time.
+    formatted_hdr = HEADER.replace('{workflow.name}', config.friendly_name)
+    optional_schedule_trigger = (''
+                                 if config.cron_timestamp is None else f'''\
+  # Run every day at the following time.
+  schedule:
+    - cron: "{config.cron_timestamp}"
+''')
+    formatted_hdr = formatted_hdr.replace('{optional_schedule_trigger}',
+                                          optional_schedule_trigger)
+    formatted_hdr = formatted_hdr.replace('{build_profile.name}',
+                                          config.build_profile.name)
+    return formatted_hdr.replace(
+        '{build_3c_cmds}',
+        indent(
+            build_3c_cmds('${{env.builddir}}', config.build_profile,
+                          '3c clang clang-rename'), 10 * ' '))
+
+
+def render_workflow(
+        config: WorkflowConfig,
+        benchmark_infos: Optional[List[BenchmarkInfo]] = None) -> str:
+    """Return the contents of the workflow file for `config`, without the
+    content hash line. `benchmark_infos` defaults to `benchmarks`."""
+    # Render the whole file into a buffer so that we can hash it and write it
+    # with one call.
+    out = io.StringIO()
+    out.write(format_header(config))
+    for job in generate_benchmark_jobs(config, benchmark_infos):
+        out.write(str(job))
+    return out.getvalue()
+
+
+class JobGraph:
+    """The benchmark jobs of a workflow (not the fixed jobs in HEADER) and
+    their steps, with the `needs` of the jobs as edges, indexed so that tools
+    can look up the jobs of a benchmark, subvariant or component directly
+    instead of generating or parsing the whole workflow each time. A component
+    is named as in the stats artifacts."""
+
+    def __init__(self, config: WorkflowConfig, jobs: Iterable[Job]):
+        self.config = config
+        # In workflow order.
+        self.jobs: Dict[str, Job] = {}
+        self.dependents: Dict[str, List[Job]] = {}
+        self.by_benchmark: Dict[str, List[Job]] = {}
+        self.by_subvariant: Dict[str, List[Job]] = {}
+        self.by_component: Dict[str, List[Job]] = {}
+        for job in jobs:
+            if job.job_id in self.jobs:
+                raise ValueError(f'duplicate job ID {job.job_id}')
+            self.jobs[job.job_id] = job
+            for need in job.needs:
+                self.dependents.setdefault(need, []).append(job)
+            for benchmark in job.benchmarks:
+                self.by_benchmark.setdefault(benchmark, []).append(job)
+            for subvariant in job.subvariants:
+                self.by_subvariant.setdefault(subvariant, []).append(job)
+            for component in job.components:
+                self.by_component.setdefault(component, []).append(job)
+
+    @staticmethod
+    def for_config(
+            config: WorkflowConfig,
+            benchmark_infos: Optional[List[BenchmarkInfo]] = None
+    ) -> 'JobGraph':
+        return JobGraph(config,
+                        generate_benchmark_jobs(config, benchmark_infos))
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def __iter__(self) -> Iterator[Job]:
+        return iter(self.jobs.values())
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self.jobs
+
+    def __getitem__(self, job_id: str) -> Job:
+        return self.jobs[job_id]
+
+    def needs(self, job_id: str) -> List[Job]:
+        """The jobs in the graph that `job_id` needs."""
+        return [
+            self.jobs[need]
+            for need in self.jobs[job_id].needs
+            if need in self.jobs
+        ]
+
+    def component_steps(self, job_id: str, component: str) -> List[Step]:
+        """The steps of `job_id` that work on `component` alone. (With
+        WorkflowConfig.parallel_components, most of them are combined into one
+        step for all the components.)"""
+        return [s for s in self.jobs[job_id].steps if s.component == component]
+
+    def with_needs(self, job_ids: Iterable[str]) -> List[Job]:
+        """The jobs `job_ids` and all the jobs they need, directly or
+        indirectly, in workflow order."""
+        selected = set()
+        todo = list(job_ids)
+        while todo:
+            job_id = todo.pop()
+            if job_id in selected or job_id not in self.jobs:
+                continue
+            selected.add(job_id)
+            todo.extend(self.jobs[job_id].needs)
+        return [job for job in self if job.job_id in selected]
+
+
+def job_graphs(
+    configs: Optional[List[WorkflowConfig]] = None,
+    benchmark_infos: Optional[List[BenchmarkInfo]] = None
+) -> Dict[str, JobGraph]:
+    """A `JobGraph` for each of `configs` (default: `workflow_file_configs`),
+    by workflow file name without .yml."""
+    if configs is None:
+        configs = workflow_file_configs
+    return {
+        config.filename: JobGraph.for_config(config, benchmark_infos)
+        for config in configs
+    }